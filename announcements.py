@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+from database import Database
+from outbound import BACKGROUND, OutboundQueue, channel_bucket
+
+
+class AnnouncementService:
+    """Sends an announcement embed to several channels at once.
+
+    An entity's icon is uploaded with the first announcement that shows it and
+    later announcements embed the uploaded copy by URL, until the icon changes
+    or the signed URL gets old.
+    """
+
+    def __init__(self, db: Database, outbound: OutboundQueue, url_ttl: timedelta = timedelta(hours=12)):
+        self.db = db
+        self.outbound = outbound
+        self.url_ttl = url_ttl
+        self._icon_urls: Dict[Tuple[str, int], Tuple[str, datetime]] = {}
+        self._uploads: Dict[Tuple[str, int], asyncio.Lock] = {}  # one upload per icon at a time
+        db.add_listener('icon_changed', self.invalidate_icon)
+
+    def invalidate_icon(self, entity_type: str, entity_id: int):
+        self._icon_urls.pop((entity_type, entity_id), None)
+
+    def _cached_url(self, entity: Tuple[str, int]) -> Optional[str]:
+        cached = self._icon_urls.get(entity)
+        if cached and cached[1] > datetime.now():
+            return cached[0]
+        return None
+
+    async def _send(self, channel: discord.abc.Messageable, **kwargs) -> Optional[discord.Message]:
+        try:
+            return await self.outbound.run(channel_bucket(channel), lambda: channel.send(**kwargs), BACKGROUND)
+        except discord.HTTPException as e:
+            print(f"Failed to send announcement to {getattr(channel, 'name', channel.id)}: {e}")
+            return None
+
+    async def announce(self, channels: List[discord.abc.Messageable], embed: discord.Embed,
+                       entity_type: str, entity_id: int) -> int:
+        """Send embed to every channel with the entity's icon as thumbnail, returning how many sends succeeded"""
+        channels = list({channel.id: channel for channel in channels if channel}.values())
+        if not channels:
+            return 0
+        entity = (entity_type, entity_id)
+        sent = 0
+
+        url = self._cached_url(entity)
+        if url is None:
+            digest = await self.db.get_entity_icon(entity_type, entity_id, 'thumb')
+            if digest:
+                async with self._uploads.setdefault(entity, asyncio.Lock()):
+                    url = self._cached_url(entity)  # Another announcement may have uploaded it meanwhile
+                    if url is None:
+                        icon = await self.db.blobs.get(digest)
+                        filename = f"{entity_type}_icon.png"
+                        uploading = embed.copy().set_thumbnail(url=f"attachment://{filename}")
+                        # Upload with the first channel that takes the message and reuse that attachment elsewhere
+                        while channels and url is None:
+                            first, channels = channels[0], channels[1:]
+                            message = await self._send(first, embed=uploading,
+                                                       file=discord.File(BytesIO(icon), filename=filename))
+                            if message:
+                                sent += 1
+                                if message.attachments:
+                                    url = message.attachments[0].url
+                                    self._icon_urls[entity] = (url, datetime.now() + self.url_ttl)
+
+        if url:
+            embed = embed.copy().set_thumbnail(url=url)
+        results = await asyncio.gather(*(self._send(channel, embed=embed) for channel in channels))
+        return sent + sum(1 for message in results if message)
+
+
+def category_channel(guild: discord.Guild, category_name: str, channel_name: str = "announcements") -> Optional[discord.TextChannel]:
+    """A text channel inside the category with this name, as created by create_faction_category"""
+    category = discord.utils.get(guild.categories, name=category_name)
+    if category is None:
+        return None
+    return discord.utils.get(category.text_channels, name=channel_name)
@@ -0,0 +1,57 @@
+"""Compare the pass output formats on encode time and size.
+
+    python benchmarks/bench_pass_formats.py [--passes 200]
+
+Renders a synthetic set of passes, half with default icons and half with
+photo-like uploaded icons, encodes each in every format and checks that the
+verification strip decodes back to exactly the rendered pixels.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from corpus import synthetic_passes
+from blob_store import BlobStore
+from pass_formats import PASS_FORMATS, encode_pass
+from pass_generator import PassGenerator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--passes', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as root:
+        blobs = BlobStore(root)
+        generator = PassGenerator(blobs)
+        box = generator.strip_box()
+        cards = [generator.create_pass_image(p, name, icons) for p, name, icons in synthetic_passes(args.passes, blobs, rng)]
+
+    print(f"{len(cards)} passes, {generator.width}x{generator.height}")
+    print(f"{'format':<12} {'mean ms':>8} {'p95 ms':>8} {'mean bytes':>11} {'vs png':>7}  strip")
+    baseline = None
+    for fmt in PASS_FORMATS:
+        times, sizes, exact = [], [], 0
+        for card in cards:
+            start = time.perf_counter()
+            data = encode_pass(card, fmt, box)
+            times.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(data))
+            decoded = np.asarray(Image.open(BytesIO(data)).convert('RGB').crop(box))
+            exact += np.array_equal(decoded, np.asarray(card.crop(box)))
+        mean_size = statistics.mean(sizes)
+        baseline = baseline or mean_size
+        p95 = statistics.quantiles(times, n=20)[-1]
+        print(f"{fmt:<12} {statistics.mean(times):>8.2f} {p95:>8.2f} {mean_size:>11.0f} "
+              f"{mean_size / baseline:>6.0%}  {exact}/{len(cards)} exact")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""Latency, allocations and output size of the PassGenerator render and verify paths.
+
+    python benchmarks/bench_pass_generator.py [--passes 80] [--repeat 3] [--json results.json]
+
+Runs headless on a synthetic corpus of passes, faction-only, nation-only, both
+and neither, so render-path regressions can be tracked without Discord. Timing
+and allocation tracking run as separate passes, tracemalloc would skew the times.
+Allocations are Python and NumPy memory only, tracemalloc can't see Pillow's
+pixel buffers. Tolerant verification also reports how many copies verified and
+how many were read exactly, which a signed pass needs.
+"""
+import argparse
+import contextlib
+import json
+import statistics
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO, StringIO
+
+import numpy as np
+from PIL import Image
+
+from corpus import MEMBERSHIPS, synthetic_passes
+from blob_store import BlobStore
+from icon_pipeline import default_icon
+from pass_generator import PassGenerator
+
+
+def _encode(image: Image.Image, format: str = 'PNG', **params) -> bytes:
+    with BytesIO() as bio:
+        image.save(bio, format, **params)
+        return bio.getvalue()
+
+
+def _screenshot(card: Image.Image, scale: float, rng: np.random.Generator, background=(54, 57, 63)) -> bytes:
+    """The card zoomed and drawn at a random spot of a 1920x1080 window, dark-theme by default"""
+    card = card.resize((round(card.width * scale), round(card.height * scale)), Image.BICUBIC)
+    window = Image.new('RGB', (1920, 1080), background)
+    window.paste(card, (int(rng.integers(0, 1920 - card.width)), int(rng.integers(0, 1080 - card.height))))
+    return _encode(window)
+
+
+def _read_exactly(generator: PassGenerator, user_pass, image: bytes) -> bool:
+    """Whether the colored part is among the readings a signed pass check tries"""
+    read = generator.read_strip_codes(BytesIO(image), tolerant=True, readings=256)
+    return read is not None and user_pass.pass_identifier.colored_part in read[1]
+
+
+def measure(name: str, func, inputs: list, repeat: int, size=None, rates=None) -> dict:
+    """Time func over every input, then track its allocations over the same inputs once.
+
+    rates maps a column to a check of one input, reported as the share of inputs passing it.
+    """
+    func(inputs[0])  # Warm up lazy imports and caches outside the measurement
+    times = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            func(item)
+            times.append((time.perf_counter() - start) * 1000)
+
+    peaks, blocks = [], []
+    tracemalloc.start()
+    for item in inputs:
+        before_blocks = len(tracemalloc.take_snapshot().traces)
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = func(item)
+        peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+        blocks.append(len(tracemalloc.take_snapshot().traces) - before_blocks)
+        del result
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(times, n=100) if len(times) > 1 else times * 99
+    row = {
+        'name': name,
+        'calls': len(times),
+        'mean_ms': statistics.mean(times),
+        'p50_ms': percentiles[49],
+        'p95_ms': percentiles[94],
+        'p99_ms': percentiles[98],
+        'peak_kib': statistics.mean(peaks),
+        'retained_blocks': statistics.mean(blocks),
+    }
+    if size:
+        row['bytes'] = round(statistics.mean(size(item) for item in inputs))
+    for column, check in (rates or {}).items():
+        row[column] = statistics.mean(bool(check(item)) for item in inputs)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--passes', type=int, default=80, help="Passes per benchmark, split across memberships")
+    parser.add_argument('--repeat', type=int, default=3, help="Timing rounds over the corpus")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        blobs = BlobStore(root)
+        generator = PassGenerator(blobs)
+        corpus = list(synthetic_passes(args.passes, blobs, rng))
+
+        for membership in MEMBERSHIPS:
+            items = [item for item in corpus if _membership(item[0]) == membership]
+            results.append(measure(
+                f"create_pass_image[{membership}]",
+                lambda item: generator.create_pass_image(*item),
+                items, args.repeat,
+                size=lambda item: len(_encode(generator.create_pass_image(*item)))
+            ))
+
+        cards = [(user_pass, generator.create_pass_image(user_pass, name, icons)) for user_pass, name, icons in corpus]
+        pngs = [(user_pass, _encode(card)) for user_pass, card in cards]
+        # Screenshots, thumbnails and re-encodes reach tolerant verification at other sizes and qualities
+        copies = {
+            '1.5x': lambda card: _encode(card.resize((600, 375), Image.BILINEAR)),
+            'jpeg': lambda card: _encode(card, 'JPEG', quality=85),
+            '0.8x bicubic jpeg': lambda card: _encode(card.resize((320, 200), Image.BICUBIC), 'JPEG', quality=85),
+            '1.25x lanczos jpeg': lambda card: _encode(card.resize((500, 312), Image.LANCZOS), 'JPEG', quality=85),
+            '2x bicubic jpeg': lambda card: _encode(card.resize((800, 500), Image.BICUBIC), 'JPEG', quality=85),
+            'webp thumbnail': lambda card: _encode(card.resize((300, 188), Image.LANCZOS), 'WEBP', quality=80),
+            'screenshot 1x': lambda card: _screenshot(card, 1.0, rng),
+            'screenshot 1.25x': lambda card: _screenshot(card, 1.25, rng),
+            'light screenshot 1.25x': lambda card: _screenshot(card, 1.25, rng, 'white'),
+        }
+        tolerant_rates = {
+            'verified': lambda item: generator.verify_pass_image(BytesIO(item[1]), item[0], tolerant=True)[0],
+            'exact': lambda item: _read_exactly(generator, *item),
+        }
+
+        results.append(measure(
+            "extract_verification_line",
+            lambda item: generator.extract_verification_line(item[1]),
+            cards, args.repeat
+        ))
+        results.append(measure(
+            "verify_pass_image",
+            lambda item: generator.verify_pass_image(BytesIO(item[1]), item[0]),
+            pngs, args.repeat
+        ))
+        for copy, encode in copies.items():
+            # Failed verifications print their details, which would bury the table
+            with contextlib.redirect_stdout(StringIO()):
+                results.append(measure(
+                    f"verify_pass_image[tolerant, {copy}]",
+                    lambda item: generator.verify_pass_image(BytesIO(item[1]), item[0], tolerant=True),
+                    [(user_pass, encode(card)) for user_pass, card in cards[:max(4, args.passes // 4)]], 1,
+                    rates=tolerant_rates
+                ))
+
+        entities = [(kind, entity_id) for kind in ('faction', 'nation') for entity_id in range(args.passes)]
+
+        def cold_icon(entity):
+            default_icon.cache_clear()
+            return generator._generate_default_icon(entity[0], entity[1], entity[0][0].upper())
+
+        results.append(measure("default_icon[cold]", cold_icon, entities, 1))
+        results.append(measure(
+            "default_icon[warm]",
+            lambda entity: generator._generate_default_icon(entity[0], entity[1] % 16, entity[0][0].upper()),
+            entities, args.repeat
+        ))
+
+    print(f"{len(corpus)} passes, seed {args.seed}")
+    print(f"{'benchmark':<52} {'calls':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'peak KiB':>9} {'blocks':>7} "
+          f"{'bytes':>7} {'verified':>8} {'exact':>6}")
+    for row in results:
+        rates = [f"{row[column]:.0%}" if column in row else '-' for column in ('verified', 'exact')]
+        print(f"{row['name']:<52} {row['calls']:>6} {row['mean_ms']:>7.2f}ms {row['p50_ms']:>6.2f}ms "
+              f"{row['p95_ms']:>6.2f}ms {row['p99_ms']:>6.2f}ms {row['peak_kib']:>9.1f} "
+              f"{row['retained_blocks']:>7.0f} {str(row.get('bytes', '-')):>7} {rates[0]:>8} {rates[1]:>6}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'passes': len(corpus), 'seed': args.seed, 'results': results}, f, indent=2)
+
+
+def _membership(user_pass) -> str:
+    if user_pass.faction_id and user_pass.nation_id:
+        return 'both'
+    if user_pass.faction_id:
+        return 'faction'
+    if user_pass.nation_id:
+        return 'nation'
+    return 'neither'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Synthetic passes shared by the benchmarks, reproducible from a seed"""
+import os
+import sys
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blob_store import BlobStore
+from icon_pipeline import ingest_icon
+from models import PassIdentifier, UserPass
+from pass_codes import CODE_SIZE, PassCode
+
+# Which of faction and nation a pass belongs to
+MEMBERSHIPS = ('both', 'faction', 'nation', 'neither')
+
+
+def photo_icon(rng: np.random.Generator) -> bytes:
+    """A noisy gradient, about as hard to compress as a real uploaded logo photo"""
+    y, x = np.mgrid[0:300, 0:300]
+    base = np.stack((x * 0.8, y * 0.8, (x + y) * 0.4), axis=-1)
+    pixels = np.clip(base + rng.normal(0, 25, base.shape), 0, 255).astype(np.uint8)
+    with BytesIO() as bio:
+        Image.fromarray(pixels).save(bio, 'PNG')
+        return bio.getvalue()
+
+
+def synthetic_pass(rng: np.random.Generator, index: int, membership: str) -> UserPass:
+    faction_id = index + 1 if membership in ('both', 'faction') else None
+    nation_id = (index % 7) + 1 if membership in ('both', 'nation') else None
+    issued = datetime(2024, 1, 1) + timedelta(days=index % 365)
+    if faction_id or nation_id:
+        colorless = PassCode(rng.bytes(12) + bytes(CODE_SIZE - 12))
+    else:
+        colorless = PassCode.zero()
+    return UserPass(
+        user_id=1000 + index,
+        faction_id=faction_id,
+        nation_id=nation_id,
+        issue_date=issued,
+        # Far in the future so verification never reports an expired pass
+        expiry_date=datetime(2999, 1, 1),
+        pass_identifier=PassIdentifier(
+            colorless_part=colorless,
+            colored_part=PassCode(rng.bytes(CODE_SIZE)),
+            faction_id=faction_id,
+            nation_id=nation_id
+        ),
+        faction_rank="Member" if faction_id else None,
+        nation_rank="Citizen" if nation_id else None
+    )
+
+
+def synthetic_passes(count: int, blobs: BlobStore, rng: np.random.Generator, memberships=MEMBERSHIPS):
+    """(pass, username, icons) triples cycling through the memberships.
+
+    Every other pass of a membership draws an uploaded photo-like icon, the rest
+    draw default icons.
+    """
+    icon = blobs.write(ingest_icon(photo_icon(rng))['pass'])
+    for i in range(count):
+        membership = memberships[i % len(memberships)]
+        user_pass = synthetic_pass(rng, i, membership)
+        icons = (icon, icon) if (i // len(memberships)) % 2 else (None, None)
+        yield user_pass, f"user{i:04d}", icons
@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import os
+import time
+from functools import lru_cache
+from typing import Iterable, List
+
+
+class BlobStore:
+    """Immutable files on disk named by the SHA-256 of their content.
+
+    Identical data is only ever stored once. Since a digest always names the
+    same bytes, reads can be cached without any invalidation. Which blobs are
+    still in use is tracked by the database, see Database.collect_image_blobs.
+    """
+
+    def __init__(self, root: str = "images/blobs", cache_size: int = 256):
+        self.root = root
+        self.read = lru_cache(maxsize=cache_size)(self._read)
+
+    @staticmethod
+    def digest_of(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path_for(self, digest: str) -> str:
+        # Fan out over subdirectories so no single directory grows huge
+        return os.path.join(self.root, digest[:2], digest)
+
+    def write(self, data: bytes) -> str:
+        """Store data and return its digest, a no-op if it is already stored. Blocking."""
+        digest = self.digest_of(data)
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # Readers never see half a file
+        return digest
+
+    def _read(self, digest: str) -> bytes:
+        with open(self.path_for(digest), "rb") as f:
+            return f.read()
+
+    def delete(self, digests: Iterable[str]) -> int:
+        """Remove blobs from disk, returning how many existed. Blocking."""
+        removed = 0
+        for digest in digests:
+            try:
+                os.remove(self.path_for(digest))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        self.read.cache_clear()
+        return removed
+
+    def stray_digests(self, known: set, grace: float = 3600) -> List[str]:
+        """Blobs on disk the database doesn't know about, e.g. left behind by a crash mid-upload.
+
+        Files younger than grace seconds are skipped, they may belong to an upload in progress.
+        """
+        if not os.path.isdir(self.root):
+            return []
+        cutoff = time.time() - grace
+        strays = []
+        for shard in os.listdir(self.root):
+            shard_path = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            for name in os.listdir(shard_path):
+                if name.endswith(".tmp") or name in known:
+                    continue
+                if os.path.getmtime(os.path.join(shard_path, name)) < cutoff:
+                    strays.append(name)
+        return strays
+
+    async def put(self, data: bytes) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.write, data)
+
+    async def get(self, digest: str) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.read, digest)
@@ -1,15 +1,32 @@
 import os
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 from database import Database
-from models import User, Faction, Nation, FactionPermission, Rank
+from models import User, Faction, Nation, FactionPermission, Rank, UserPass
 from datetime import datetime, timedelta
-from pass_generator import PassGenerator
-from typing import List, Optional
-from PIL import Image, ImageDraw, ImageFont
-import random
+from render_service import RenderService
+from pass_cache import RenderedPassCache
+from revocation import RevocationList
+from image_index import PassImageIndex
+from conversations import ConversationRouter
+from member_cache import MemberCache, iter_member_chunks
+from name_index import NameIndex
+from outbound import BACKGROUND, INTERACTIVE, OutboundQueue, guild_bucket, interaction_bucket
+from announcements import AnnouncementService, category_channel
+from tracing import ACK_DEADLINE_MS, TracedCommandTree, Tracer, install_interaction_hooks
+from icon_pipeline import IconError, default_icon
+from pass_formats import DEFAULT_FORMAT, PASS_FORMATS, pass_extension
+from typing import Callable, Dict, List, Optional
+from PIL import Image
+import asyncio
+import hashlib
+import json
+import re
+import time
+import zipfile
 from io import BytesIO
+from urllib.parse import urlsplit
 
 def in_command_channel():
     """Check if command is used in the correct channel"""
@@ -23,33 +40,199 @@ def in_command_channel():
         return interaction.channel_id == command_channel_id
     return app_commands.check(predicate)
 
-class MegatropoBot(commands.Bot):
+def shard_options() -> dict:
+    """Shard settings from the environment, set per process by launcher.py.
+
+    MEGATROPO_SHARD_COUNT alone runs every shard in this process,
+    MEGATROPO_SHARD_IDS (e.g. "0,1,2") restricts it to those. Without either
+    Discord's recommended shard count is used.
+    """
+    options = {}
+    shard_count = os.getenv('MEGATROPO_SHARD_COUNT')
+    shard_ids = os.getenv('MEGATROPO_SHARD_IDS')
+    if shard_count:
+        options['shard_count'] = int(shard_count)
+    if shard_ids:
+        options['shard_ids'] = [int(shard_id) for shard_id in shard_ids.split(',')]
+    return options
+
+class MegatropoBot(commands.AutoShardedBot):
     def __init__(self):
-        intents = discord.Intents.all()
-        intents.all
-        super().__init__(command_prefix="!", intents=intents)
+        options = shard_options()
+        if os.getenv('MEGATROPO_LEAN_INTENTS') == '1':
+            # Only the intents the bot uses, and no member cache: members are fetched on demand
+            intents = discord.Intents.default()
+            intents.members = True  # member events and paging member lists in /setup
+            intents.message_content = True  # follow-up answers and prefix commands
+            options.update({'chunk_guilds_at_startup': False, 'member_cache_flags': discord.MemberCacheFlags.none()})
+        else:
+            intents = discord.Intents.all()
+        # Only one process of a multi-process launch runs database maintenance and command sync
+        self.is_primary = 0 in options.get('shard_ids', [0])
+        self.shares_database = 'shard_ids' in options
+        super().__init__(command_prefix="!", intents=intents, tree_cls=TracedCommandTree, **options)
+        self.tracer = Tracer()  # recent command timings for /perf
+        install_interaction_hooks()
         self.db = Database()
+        self.tracer.instrument(self.db, 'db')
         self.command_channels = {}  # guild_id -> command_channel_id
         self.faction_announcement_channels = {}  # guild_id -> channel_id
         self.nation_announcement_channels = {}  # guild_id -> channel_id
+        self.pass_formats = {}  # guild_id -> pass image format, loaded from bot_settings on first use
+        self.renderer = RenderService(self.db.pass_codec.key)
+        self.tracer.instrument(self.renderer, 'render')
+        self.renderer.start()
+        self.pass_cache = RenderedPassCache()
+        self.db.add_listener('pass_changed', self.pass_cache.invalidate_user)
+        self.db.add_listener('icon_changed', self.pass_cache.invalidate_icon)
+        self.revocations = RevocationList(self.db.is_pass_revoked)
+        self.db.add_listener('pass_revoked', self.revocations.add)
+        self.image_index = PassImageIndex()
+        self.renderer.on_render = self.record_pass_image
+        self.renderer.icon_lookup = self.db.get_pass_icons
+        self.conversations = ConversationRouter()  # follow-up messages for open prompts
+        self.members = MemberCache()
+        self.name_index = NameIndex()  # faction and nation names for autocomplete
+        self.outbound = OutboundQueue()  # REST calls queued per rate limit bucket
+        self.announcements = AnnouncementService(self.db, self.outbound)
+        self.db.add_listener('entity_named', self.name_index.add)
+        self.db.add_listener('entity_removed', self.name_index.remove)
 
     async def setup_hook(self):
-        await self.tree.sync()
+        # Read before loading anything, so writes made during the loads are picked up by watch_database
+        self.change_markers = await self.db.get_change_markers()
+        self.revocations.rebuild(await self.db.get_revoked_codes())
+        self.image_hash_id = await self.db.last_pass_image_hash_id()
+        self.image_index.load(await self.db.get_pass_image_hashes(upto_id=self.image_hash_id))
+        print(f"Loaded {len(self.image_index)} pass image hashes")
+        await self.load_guild_configs()
+        print(f"Loaded channel configuration for {len(self.command_channels)} servers")
+        await self.load_name_index()
+        self.expire_passes.start()
+        self.expire_conversations.start()
+        if self.shares_database:
+            self.data_version = await self.db.data_version()
+            self.pass_icon_digests = await self.db.get_pass_icon_digests()
+            self.watch_database.start()
+        # Guild reconciliation needs the gateway cache, so it runs once the bot is ready
+        self.reconcile_task = asyncio.create_task(self.reconcile_guilds())
+        if self.is_primary:
+            await self.db.import_legacy_icons()
+            self.collect_image_blobs.start()
+            await self.sync_commands()
+
+    def command_tree_hash(self, guild: Optional[discord.abc.Snowflake] = None) -> str:
+        """Stable hash of the command signatures Discord would receive from a sync"""
+        payload = sorted(
+            (command.to_dict(self.tree) for command in self.tree.get_commands(guild=guild)),
+            key=lambda command: (command.get('type', 1), command['name'])
+        )
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    async def sync_commands(self, force: bool = False):
+        """Sync the command tree only when the registered commands changed since the last sync.
+
+        With MEGATROPO_DEV_GUILD set, commands are copied to and synced in that
+        guild only, where changes show up immediately. MEGATROPO_FORCE_SYNC=1
+        syncs regardless of the stored hash.
+        """
+        dev_guild_id = os.getenv('MEGATROPO_DEV_GUILD')
+        guild = discord.Object(id=int(dev_guild_id)) if dev_guild_id else None
+        if guild:
+            self.tree.copy_global_to(guild=guild)
+        setting = f"command_tree_hash:{guild.id}" if guild else "command_tree_hash"
+        force = force or os.getenv('MEGATROPO_FORCE_SYNC') == '1'
+
+        tree_hash = self.command_tree_hash(guild)
+        if not force and await self.db.get_setting(setting) == tree_hash:
+            print("Commands unchanged since last sync, skipping")
+            return
+        synced = await self.tree.sync(guild=guild)
+        await self.db.set_setting(setting, tree_hash)
+        print(f"Synced {len(synced)} commands" + (f" to guild {guild.id}" if guild else ""))
+
+    @tasks.loop(minutes=10)
+    async def expire_passes(self):
+        if self.is_primary:
+            expired = await self.db.expire_passes()
+            if expired:
+                print(f"Added {expired} expired passes to the revocation list")
+        if self.revocations.needs_rebuild():
+            self.revocations.rebuild(await self.db.get_revoked_codes())
+
+    @tasks.loop(hours=6)
+    async def collect_image_blobs(self):
+        await self.db.collect_image_blobs()
+
+    @tasks.loop(seconds=5)
+    async def watch_database(self):
+        """Refresh in-memory state after another shard process wrote to the shared database"""
+        version = await self.db.data_version()
+        if version == self.data_version:
+            return
+        self.data_version = version
+
+        markers = await self.db.get_change_markers()
+        changed = {topic for topic, count in markers.items() if self.change_markers.get(topic) != count}
+        self.change_markers = markers
+
+        if 'revocations' in changed:
+            self.revocations.rebuild(await self.db.get_revoked_codes())
+        if 'pass_image_hashes' in changed:
+            last_id = await self.db.last_pass_image_hash_id()
+            self.image_index.load(await self.db.get_pass_image_hashes(self.image_hash_id, last_id))
+            self.image_hash_id = last_id
+        if 'guild_config' in changed:
+            await self.load_guild_configs()
+        if 'names' in changed:
+            await self.load_name_index()
+        if 'settings' in changed:
+            self.pass_formats.clear()
+        if 'pass_icons' in changed:
+            # Cached renders and icon URLs only hear about local icon changes, so check for ones made elsewhere
+            digests = await self.db.get_pass_icon_digests()
+            for entity in self.pass_icon_digests.keys() | digests.keys():
+                if self.pass_icon_digests.get(entity) != digests.get(entity):
+                    self.pass_cache.invalidate_icon(*entity)
+                    self.announcements.invalidate_icon(*entity)
+            self.pass_icon_digests = digests
+
+    @tasks.loop(minutes=5)
+    async def expire_conversations(self):
+        self.conversations.expire()
+
+    async def on_message(self, message: discord.Message):
+        if message.author.bot:
+            return
+        # Answers to open prompts are consumed here, anything else may still be a prefix command
+        if self.conversations.dispatch(message):
+            return
+        await self.process_commands(message)
+
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        self.members.update(after)
+
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        self.members.forget(payload.guild_id, payload.user.id)
+
+    async def close(self):
+        self.renderer.shutdown()
+        await super().close()
         
     async def on_guild_join(self, guild: discord.Guild):
         # Create or get bot role
         bot_role = discord.utils.get(guild.roles, name="MegatroBot")
         if not bot_role:
             try:
-                bot_role = await guild.create_role(
+                bot_role = await self.guild_call(guild, lambda: guild.create_role(
                     name="MegatroBot",
                     permissions=discord.Permissions.all(),
                     color=discord.Color.red(),
                     reason="Bot administrative role"
-                )
+                ))
                 # Move role position to be high in hierarchy
                 positions = {bot_role: len(guild.roles) - 1}  # -1 to be below server owner
-                await guild.edit_role_positions(positions)
+                await self.guild_call(guild, lambda: guild.edit_role_positions(positions), coalesce_key='role_positions')
             except discord.Forbidden:
                 print(f"Failed to create bot role in server: {guild.name}")
                 return
@@ -58,7 +241,7 @@ class MegatropoBot(commands.Bot):
         bot_member = guild.get_member(self.user.id)
         if (bot_member and bot_role not in bot_member.roles):
             try:
-                await bot_member.add_roles(bot_role, reason="Bot role assignment")
+                await self.guild_call(guild, lambda: bot_member.add_roles(bot_role, reason="Bot role assignment"))
             except discord.Forbidden:
                 print(f"Failed to assign bot role in server: {guild.name}")
 
@@ -75,11 +258,59 @@ class MegatropoBot(commands.Bot):
             status=discord.Status.online,
             activity=discord.Game(name="Managing Factions & Nations")
         )
-        
-        # Create/assign role in all current servers
-        for guild in self.guilds:
-            await self.on_guild_join(guild)
-        print(f"Bot is active in {len(self.guilds)} servers")
+
+    async def load_guild_configs(self):
+        """Rebuild the channel maps from the database so commands work before reconciliation"""
+        configs = await self.db.get_guild_configs()
+        # Swap in whole maps, so guilds whose config was removed elsewhere drop out too
+        self.command_channels = {guild_id: cmd_id for guild_id, (cmd_id, _, _) in configs.items() if cmd_id}
+        self.faction_announcement_channels = {guild_id: faction_id for guild_id, (_, faction_id, _) in configs.items() if faction_id}
+        self.nation_announcement_channels = {guild_id: nation_id for guild_id, (_, _, nation_id) in configs.items() if nation_id}
+
+    async def load_name_index(self):
+        for entity_type in ('faction', 'nation'):
+            self.name_index.load(entity_type, await self.db.get_entity_names(entity_type))
+
+    def guild_is_configured(self, guild: discord.Guild) -> bool:
+        """Whether the bot role and stored channels are all in place, checked against the gateway cache only"""
+        channel_ids = (
+            self.command_channels.get(guild.id),
+            self.faction_announcement_channels.get(guild.id),
+            self.nation_announcement_channels.get(guild.id)
+        )
+        if not all(channel_ids) or not all(guild.get_channel(channel_id) for channel_id in channel_ids):
+            return False
+        bot_role = discord.utils.get(guild.roles, name="MegatroBot")
+        return bot_role is not None and bot_role in guild.me.roles
+
+    async def reconcile_guilds(self, concurrency: int = 8):
+        """Bring every guild's role and channels in line, a few guilds at a time"""
+        await self.wait_until_ready()
+        started = time.perf_counter()
+        pending = [guild for guild in self.guilds if not self.guild_is_configured(guild)]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def reconcile(guild: discord.Guild):
+            async with semaphore:
+                try:
+                    await self.on_guild_join(guild)
+                except discord.HTTPException as e:
+                    print(f"Failed to set up server {guild.name}: {e}")
+
+        await asyncio.gather(*(reconcile(guild) for guild in pending))
+        print(f"Bot is active in {len(self.guilds)} servers, set up {len(pending)} "
+              f"in {time.perf_counter() - started:.1f}s")
+
+    async def guild_call(self, guild: discord.Guild, factory: Callable, coalesce_key=None):
+        """Run a guild management REST call as background work in the guild's bucket"""
+        return await self.outbound.run(guild_bucket(guild), factory, BACKGROUND, coalesce_key)
+
+    async def set_guild_channels(self, guild: discord.Guild, cmd_channel: discord.TextChannel,
+                                 faction_announce: discord.TextChannel, nation_announce: discord.TextChannel):
+        self.command_channels[guild.id] = cmd_channel.id
+        self.faction_announcement_channels[guild.id] = faction_announce.id
+        self.nation_announcement_channels[guild.id] = nation_announce.id
+        await self.db.set_guild_config(guild.id, cmd_channel.id, faction_announce.id, nation_announce.id)
 
     async def setup_categories(self, guild: discord.Guild):
         # Check if the category already exists
@@ -90,83 +321,77 @@ class MegatropoBot(commands.Bot):
             nation_announce = discord.utils.get(existing_category.text_channels, name="nation-announcements")
 
             if (cmd_channel and faction_announce and nation_announce):
-                self.command_channels[guild.id] = cmd_channel.id
-                self.faction_announcement_channels[guild.id] = faction_announce.id
-                self.nation_announcement_channels[guild.id] = nation_announce.id
+                await self.set_guild_channels(guild, cmd_channel, faction_announce, nation_announce)
                 print("The channels already exist.")
                 return
             else:
                 # Create missing channels inside the existing category
                 if (not cmd_channel):
-                    cmd_channel = await existing_category.create_text_channel(
+                    cmd_channel = await self.guild_call(guild, lambda: existing_category.create_text_channel(
                         "megabot-cmd",
                         overwrites={
                             guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=True),
                             guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
                         }
-                    )
-                    self.command_channels[guild.id] = cmd_channel.id
+                    ))
 
                 if (not faction_announce):
-                    faction_announce = await existing_category.create_text_channel(
+                    faction_announce = await self.guild_call(guild, lambda: existing_category.create_text_channel(
                         "faction-announcements",
                         overwrites={
                             guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False, add_reactions=True),
                             guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
                         }
-                    )
-                    self.faction_announcement_channels[guild.id] = faction_announce.id
+                    ))
 
                 if (not nation_announce):
-                    nation_announce = await existing_category.create_text_channel(
+                    nation_announce = await self.guild_call(guild, lambda: existing_category.create_text_channel(
                         "nation-announcements",
                         overwrites={
                             guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False, add_reactions=True),
                             guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
                         }
-                    )
-                    self.nation_announcement_channels[guild.id] = nation_announce.id
+                    ))
 
+                await self.set_guild_channels(guild, cmd_channel, faction_announce, nation_announce)
                 print("Created missing channels inside the existing category.")
                 return
 
         # Create bot management category
-        bot_category = await guild.create_category(
+        bot_category = await self.guild_call(guild, lambda: guild.create_category(
             "Bot Management",
             overwrites={
                 guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False),
                 guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
             }
-        )
+        ))
         
         # Create command channel
-        cmd_channel = await bot_category.create_text_channel(
+        cmd_channel = await self.guild_call(guild, lambda: bot_category.create_text_channel(
             "megabot-cmd",
             overwrites={
                 guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=True),
                 guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
             }
-        )
-        self.command_channels[guild.id] = cmd_channel.id
+        ))
 
         # Create announcement channels
-        faction_announce = await bot_category.create_text_channel(
+        faction_announce = await self.guild_call(guild, lambda: bot_category.create_text_channel(
             "faction-announcements",
             overwrites={
                 guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False, add_reactions=True),
                 guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
             }
-        )
-        nation_announce = await bot_category.create_text_channel(
+        ))
+        nation_announce = await self.guild_call(guild, lambda: bot_category.create_text_channel(
             "nation-announcements",
             overwrites={
                 guild.default_role: discord.PermissionOverwrite(read_messages=True, send_messages=False, add_reactions=True),
                 guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
             }
-        )
-        
-        self.faction_announcement_channels[guild.id] = faction_announce.id
-        self.nation_announcement_channels[guild.id] = nation_announce.id
+        ))
+
+        await self.set_guild_channels(guild, cmd_channel, faction_announce, nation_announce)
 
     async def can_use_command(self, interaction: discord.Interaction) -> bool:
         """Legacy method - kept for reference but not used"""
@@ -179,26 +404,21 @@ class MegatropoBot(commands.Bot):
         }
         
         # Get faction members and set permissions
-        members = await self.db.get_faction_members(faction.id)
-        for member_id in members:
-            member = guild.get_member(member_id)
-            if member:
-                overwrites[member] = discord.PermissionOverwrite(read_messages=True)
+        member_ids = await self.db.get_faction_members(faction.id)
 
         # If faction is part of a nation, add nation members
         if faction.nation_id:
             nation = await self.db.get_nation(faction.nation_id)
             if nation:
-                nation_members = await self.db.get_nation_members(nation.id)
-                for member_id in nation_members:
-                    member = guild.get_member(member_id)
-                    if member:
-                        overwrites[member] = discord.PermissionOverwrite(read_messages=True)
+                member_ids += await self.db.get_nation_members(nation.id)
+
+        for member in (await self.members.get_many(guild, member_ids)).values():
+            overwrites[member] = discord.PermissionOverwrite(read_messages=True)
 
         try:
-            category = await guild.create_category(f"Faction-{faction.name}", overwrites=overwrites)
-            await category.create_text_channel("general")
-            await category.create_text_channel("announcements")
+            category = await self.guild_call(guild, lambda: guild.create_category(f"Faction-{faction.name}", overwrites=overwrites))
+            await self.guild_call(guild, lambda: category.create_text_channel("general"))
+            await self.guild_call(guild, lambda: category.create_text_channel("announcements"))
             return category
         except discord.Forbidden:
             return None
@@ -210,16 +430,14 @@ class MegatropoBot(commands.Bot):
         }
         
         # Get nation members and set permissions
-        members = await self.db.get_nation_members(nation.id)
-        for member_id in members:
-            member = guild.get_member(member_id)
-            if member:
-                overwrites[member] = discord.PermissionOverwrite(read_messages=True)
+        member_ids = await self.db.get_nation_members(nation.id)
+        for member in (await self.members.get_many(guild, member_ids)).values():
+            overwrites[member] = discord.PermissionOverwrite(read_messages=True)
 
         try:
-            category = await guild.create_category(f"Nation-{nation.name}", overwrites=overwrites)
-            await category.create_text_channel("general")
-            await category.create_text_channel("announcements")
+            category = await self.guild_call(guild, lambda: guild.create_category(f"Nation-{nation.name}", overwrites=overwrites))
+            await self.guild_call(guild, lambda: category.create_text_channel("general"))
+            await self.guild_call(guild, lambda: category.create_text_channel("announcements"))
             return category
         except discord.Forbidden:
             return None
@@ -249,14 +467,14 @@ class MegatropoBot(commands.Bot):
             # Create bot role if it doesn't exist
             bot_role = discord.utils.get(guild.roles, name="MegatroBot")
             if not bot_role:
-                bot_role = await guild.create_role(
+                bot_role = await self.guild_call(guild, lambda: guild.create_role(
                     name="MegatroBot",
                     permissions=discord.Permissions.all(),
                     color=discord.Color.red(),
                     reason="Bot administrative role"
-                )
+                ))
                 positions = {bot_role: len(guild.roles) - 1}
-                await guild.edit_role_positions(positions)
+                await self.guild_call(guild, lambda: guild.edit_role_positions(positions), coalesce_key='role_positions')
                 status["created"].append("MegatroBot role")
 
             # Ensure images directory exists
@@ -269,109 +487,264 @@ class MegatropoBot(commands.Bot):
 
         return status
 
+    async def pass_format(self, guild_id: Optional[int]) -> str:
+        """The image format passes are sent in for a guild"""
+        if guild_id is None:
+            return DEFAULT_FORMAT
+        if guild_id not in self.pass_formats:
+            fmt = await self.db.get_setting(f"pass_format:{guild_id}")
+            self.pass_formats[guild_id] = fmt if fmt in PASS_FORMATS else DEFAULT_FORMAT
+        return self.pass_formats[guild_id]
+
+    async def send_pass(self, interaction: discord.Interaction, user_pass: UserPass, username: str, content: str):
+        """Send a pass as a followup, reusing a cached render or earlier upload when nothing changed"""
+        fmt = await self.pass_format(interaction.guild_id)
+        key = self.pass_cache.key_for(user_pass, username, fmt)
+        url = self.pass_cache.url_for(key)
+        if url:
+            embed = discord.Embed()
+            embed.set_image(url=url)
+            await self.outbound.run(
+                interaction_bucket(interaction), lambda: interaction.followup.send(content, embed=embed), INTERACTIVE
+            )
+            return
+
+        entry = self.pass_cache.get(key)
+        if not entry:
+            pass_data = await self.renderer.render(user_pass, username, fmt)
+            entry = self.pass_cache.put(key, user_pass, pass_data)
+
+        message = await self.outbound.run(interaction_bucket(interaction), lambda: interaction.followup.send(
+            content,
+            file=discord.File(BytesIO(entry.data), filename=f"pass_{user_pass.user_id}.{pass_extension(fmt)}")
+        ), INTERACTIVE)
+        if message and message.attachments:
+            self.pass_cache.remember_url(key, message.attachments[0].url)
+
+    async def record_pass_image(self, user_pass: UserPass, card_hash: str):
+        """Index the perceptual hash of a rendered pass so later checks can find it"""
+        colored_part = user_pass.pass_identifier.colored_part
+        if self.image_index.add(card_hash, user_pass.user_id, colored_part):
+            await self.db.add_pass_image_hash(user_pass.user_id, colored_part, card_hash)
+
+    def describe_closest(self, closest: Optional[tuple]) -> str:
+        if not closest:
+            return "no similar issued pass"
+        distance, user_id, _ = closest
+        user = self.get_user(user_id)
+        return f"closest issued pass is {user.name if user else user_id}'s at distance {distance}"
+
+    async def check_pass_image(self, image_data: bytes, owner_id: int, tolerant: bool, marked: bool = True,
+                               passes: Optional[Dict[int, UserPass]] = None) -> tuple:
+        """Verify a pass image shown by owner_id.
+
+        Returns (is_valid, discrepancies, marked PNG or None, closest) where closest is
+        the most similar issued pass image as (Hamming distance, user_id, colored_part).
+
+        The signature is checked in a worker and revocation in the in-memory filter, so
+        the database is only read when the filter reports a possible revocation. Images
+        whose signature can't be read exactly fall back to comparing against the stored
+        pass; passes can hold passes already loaded for a batch of checks.
+        """
+        claims, colored_part, discrepancies, marked_png, card_hash = await self.renderer.verify_signed(
+            image_data, tolerant, marked
+        )
+        if claims is None:
+            user_pass = passes.get(owner_id) if passes is not None else await self.db.get_user_pass(owner_id)
+            # Passes issued before signing have no signature, and a rescaled or recompressed
+            # strip may be too blurred to read exactly, so compare against the stored pass instead
+            if user_pass and (tolerant or not self.db.pass_codec.decode(user_pass.pass_identifier.colored_part)):
+                is_valid, discrepancies, marked_png, card_hash = await self.renderer.verify(
+                    image_data, user_pass, tolerant, marked
+                )
+                return is_valid, discrepancies, marked_png, card_hash and self.image_index.closest(card_hash)
+            return False, discrepancies, marked_png, card_hash and self.image_index.closest(card_hash)
+
+        if claims.user_id != owner_id:
+            discrepancies.append("Pass belongs to another user")
+        elif await self.revocations.is_revoked(colored_part):
+            discrepancies.append("Pass revoked or replaced")
+        return not discrepancies, discrepancies, marked_png, card_hash and self.image_index.closest(card_hash)
+
+    async def identify_pass_owner(self, image_data: bytes, tolerant: bool) -> tuple:
+        """Work out whose pass an image shows, returning (owner id or None, reason if unknown)"""
+        codes = await self.renderer.read_codes(image_data, tolerant)
+        if not codes:
+            return None, "Verification strip not found"
+        colorless_part, colored_parts = codes
+        user_pass = await self.db.find_pass_owner(colorless_part, colored_parts)
+        if user_pass:
+            return user_pass.user_id, None
+        # Signed passes name their owner even after the stored pass is gone
+        for colored_part in colored_parts:
+            claims = self.db.pass_codec.decode(colored_part)
+            if claims:
+                return None, f"Pass of user {claims.user_id} was revoked or replaced"
+        return None, "No pass matches this image"
+
     def generate_default_icon(self, name: str) -> Image.Image:
-        """Generate a default icon with the first letter and a random color"""
-        size = (100, 100)
-        img = Image.new('RGB', size, color=(255, 255, 255))
-        draw = ImageDraw.Draw(img)
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 50)
-        
-        # Generate random color
-        color = tuple(random.randint(0, 255) for _ in range(3))
-        
-        # Draw circular vignette
-        draw.ellipse([(0, 0), size], fill=color)
-        
-        # Draw the first letter
-        text = name[0].upper()
-        text_size = draw.textsize(text, font=font)
-        text_position = ((size[0] - text_size[0]) // 2, (size[1] - text_size[1]) // 2)
-        draw.text(text_position, text, fill=(255, 255, 255), font=font)
-        
-        return img
+        """Generate a default icon with the first letter, coloured from the name"""
+        return default_icon(name.lower(), name[0].upper(), 100, 50)
 
-class FactionSelect(discord.ui.Select):
-    def __init__(self, factions: List[Faction]):
-        options = [
-            discord.SelectOption(
-                label=faction.name,
-                value=str(faction.id),
-                description=f"Owner: {faction.owner_id}"
-            ) for faction in factions
-        ]
-        super().__init__(placeholder="Select a faction...", options=options)
+async def show_faction_info(interaction: discord.Interaction, faction_id: int):
+    faction = await interaction.client.db.get_faction(faction_id)
+    if not faction:
+        await interaction.response.send_message("Faction no longer exists!", ephemeral=True)
+        return
 
-    async def callback(self, interaction: discord.Interaction):
-        faction_id = int(self.values[0])
-        faction = await interaction.client.db.get_faction(faction_id)
-        if not faction:
-            await interaction.response.send_message("Faction no longer exists!", ephemeral=True)
-            return
+    members = await interaction.client.db.get_faction_members(faction.id)
+    owner = await interaction.client.fetch_user(faction.owner_id)
+    
+    embed = discord.Embed(title=f"Faction Info - {faction.name}", color=discord.Color.blue())
+    embed.add_field(name="ID", value=faction.id)
+    embed.add_field(name="Owner", value=owner.name)
+    embed.add_field(name="Balance", value=f"${faction.balance}")
+    embed.add_field(name="Member Count", value=len(members))
+    
+    if faction.nation_id:
+        nation = await interaction.client.db.get_nation(faction.nation_id)
+        embed.add_field(name="Nation", value=nation.name if nation else "None")
+    
+    if faction.ranks:
+        ranks_text = "\n".join([f"{r.name} (Priority: {r.priority})" for r in faction.ranks.values()])
+        embed.add_field(name="Ranks", value=ranks_text or "No ranks", inline=False)
 
-        members = await interaction.client.db.get_faction_members(faction.id)
-        owner = await interaction.client.fetch_user(faction.owner_id)
-        
-        embed = discord.Embed(title=f"Faction Info - {faction.name}", color=discord.Color.blue())
-        embed.add_field(name="ID", value=faction.id)
-        embed.add_field(name="Owner", value=owner.name)
-        embed.add_field(name="Balance", value=f"${faction.balance}")
-        embed.add_field(name="Member Count", value=len(members))
-        
-        if faction.nation_id:
-            nation = await interaction.client.db.get_nation(faction.nation_id)
-            embed.add_field(name="Nation", value=nation.name if nation else "None")
-        
-        if faction.ranks:
-            ranks_text = "\n".join([f"{r.name} (Priority: {r.priority})" for r in faction.ranks.values()])
-            embed.add_field(name="Ranks", value=ranks_text or "No ranks", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+async def show_nation_info(interaction: discord.Interaction, nation_id: int):
+    nation = await interaction.client.db.get_nation(nation_id)
+    if not nation:
+        await interaction.response.send_message("Nation no longer exists!", ephemeral=True)
+        return
 
-class FactionSelectView(discord.ui.View):
-    def __init__(self, factions: List[Faction]):
-        super().__init__()
-        self.add_item(FactionSelect(factions))
+    owner = await interaction.client.fetch_user(nation.owner_id)
+    
+    embed = discord.Embed(title=f"Nation Info - {nation.name}", color=discord.Color.gold())
+    embed.add_field(name="ID", value=nation.id)
+    embed.add_field(name="Owner", value=owner.name)
+    embed.add_field(name="Balance", value=f"${nation.balance}")
+    
+    if nation.allies:
+        allies_text = "\n".join([f"• {ally}" for ally in nation.allies])
+        embed.add_field(name="Allies", value=allies_text or "No allies", inline=False)
 
-class NationSelect(discord.ui.Select):
-    def __init__(self, nations: List[Nation]):
-        options = [
-            discord.SelectOption(
-                label=nation.name,
-                value=str(nation.id),
-                description=f"Owner: {nation.owner_id}"
-            ) for nation in nations
-        ]
-        super().__init__(placeholder="Select a nation...", options=options)
+    cursor = interaction.client.db.conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM factions WHERE nation_id = ?', (nation.id,))
+    faction_count = cursor.fetchone()[0]
+    embed.add_field(name="Number of Factions", value=faction_count)
 
-    async def callback(self, interaction: discord.Interaction):
-        nation_id = int(self.values[0])
-        nation = await interaction.client.db.get_nation(nation_id)
-        if not nation:
-            await interaction.response.send_message("Nation no longer exists!", ephemeral=True)
-            return
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
-        owner = await interaction.client.fetch_user(nation.owner_id)
-        
-        embed = discord.Embed(title=f"Nation Info - {nation.name}", color=discord.Color.gold())
-        embed.add_field(name="ID", value=nation.id)
-        embed.add_field(name="Owner", value=owner.name)
-        embed.add_field(name="Balance", value=f"${nation.balance}")
-        
-        if nation.allies:
-            allies_text = "\n".join([f"• {ally}" for ally in nation.allies])
-            embed.add_field(name="Allies", value=allies_text or "No allies", inline=False)
+class EntitySearchModal(discord.ui.Modal, title="Search"):
+    def __init__(self, picker: "EntityPickerView"):
+        super().__init__()
+        self.picker = picker
+        self.query = discord.ui.TextInput(
+            label=f"{picker.entity_type.capitalize()} name contains",
+            style=discord.TextStyle.short,
+            required=False,
+            default=picker.search,
+            max_length=100
+        )
+        self.add_item(self.query)
 
-        cursor = interaction.client.db.conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM factions WHERE nation_id = ?', (nation.id,))
-        faction_count = cursor.fetchone()[0]
-        embed.add_field(name="Number of Factions", value=faction_count)
+    async def on_submit(self, interaction: discord.Interaction):
+        await self.picker.set_search(interaction, self.query.value.strip() or None)
 
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+class EntityPickerSelect(discord.ui.Select):
+    def __init__(self, entity_type: str):
+        super().__init__(placeholder=f"Select a {entity_type}...", options=[discord.SelectOption(label="...")])
 
-class NationSelectView(discord.ui.View):
-    def __init__(self, nations: List[Nation]):
-        super().__init__()
-        self.add_item(NationSelect(nations))
+    async def callback(self, interaction: discord.Interaction):
+        await self.view.on_select(interaction, int(self.values[0]))
+
+class EntityPickerView(discord.ui.View):
+    """Pick a faction or nation from a name-ordered list, 25 per page, with a name search.
+
+    Pages are loaded by keyset pagination when first shown and kept for
+    going back, so opening the picker costs one query of at most 26 rows.
+    """
+    PAGE_SIZE = 25
+
+    def __init__(self, db: Database, entity_type: str, on_select: Callable):
+        super().__init__(timeout=180)
+        self.db = db
+        self.entity_type = entity_type
+        self.on_select = on_select
+        self.search: Optional[str] = None
+        self.pages: List[List[tuple]] = []
+        self.has_more = False  # whether a page exists after the last loaded one
+        self.page = 0
+        self.select = EntityPickerSelect(entity_type)
+        self.add_item(self.select)
+
+    async def load(self) -> bool:
+        """Load the first page, returning False if there is nothing to pick"""
+        await self._fetch_page()
+        self._render()
+        return bool(self.pages[0])
+
+    async def _fetch_page(self):
+        after = self.pages[-1][-1][1] if self.pages else None
+        # One extra row tells whether there is a next page
+        rows = await self.db.list_entities(self.entity_type, after, self.search, self.PAGE_SIZE + 1)
+        self.has_more = len(rows) > self.PAGE_SIZE
+        self.pages.append(rows[:self.PAGE_SIZE])
+
+    def _render(self):
+        rows = self.pages[self.page]
+        if rows:
+            self.select.options = [
+                discord.SelectOption(label=name[:100], value=str(entity_id), description=f"Owner: {owner_id}")
+                for entity_id, name, owner_id in rows
+            ]
+            self.select.placeholder = f"Select a {self.entity_type}... (page {self.page + 1})"
+            self.select.disabled = False
+        else:
+            self.select.options = [discord.SelectOption(label="No matches", value="0")]
+            self.select.placeholder = f"No {self.entity_type}s match"
+            self.select.disabled = True
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page == len(self.pages) - 1 and not self.has_more
+        self.clear_search.disabled = self.search is None
+
+    async def set_search(self, interaction: discord.Interaction, search: Optional[str]):
+        self.search = search
+        self.pages = []
+        self.page = 0
+        await self._fetch_page()
+        self._render()
+        await interaction.response.edit_message(view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary, row=1)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(0, self.page - 1)
+        self._render()
+        await interaction.response.edit_message(view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary, row=1)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.page == len(self.pages) - 1:
+            await self._fetch_page()
+        self.page += 1
+        self._render()
+        await interaction.response.edit_message(view=self)
+
+    @discord.ui.button(label="Search", style=discord.ButtonStyle.primary, row=1)
+    async def search_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_modal(EntitySearchModal(self))
+
+    @discord.ui.button(label="Clear search", style=discord.ButtonStyle.secondary, row=1)
+    async def clear_search(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.set_search(interaction, None)
+
+class FactionSelectView(EntityPickerView):
+    def __init__(self, db: Database):
+        super().__init__(db, 'faction', show_faction_info)
+
+class NationSelectView(EntityPickerView):
+    def __init__(self, db: Database):
+        super().__init__(db, 'nation', show_nation_info)
 
 class AdminActionSelect(discord.ui.Select):
     def __init__(self):
@@ -415,75 +788,158 @@ class MoneyTargetSelectView(discord.ui.View):
         super().__init__()
         self.add_item(MoneyTargetSelect(action))
 
+class UserPickSelect(discord.ui.UserSelect):
+    """Pick users from a dropdown instead of mentioning them in a follow-up message"""
+    def __init__(self, on_pick: Callable, max_values: int, placeholder: str):
+        super().__init__(placeholder=placeholder, min_values=1, max_values=max_values)
+        self.on_pick = on_pick
+
+    async def callback(self, interaction: discord.Interaction):
+        self.view.stop()
+        await self.on_pick(interaction, list(self.values))
+
+class UserPickView(discord.ui.View):
+    def __init__(self, owner_id: int, on_pick: Callable, max_values: int = 1, placeholder: str = "Select a user..."):
+        super().__init__(timeout=120)
+        self.owner_id = owner_id
+        self.add_item(UserPickSelect(on_pick, max_values, placeholder))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+class ConfirmView(discord.ui.View):
+    """Confirm/Cancel buttons for the user who started an action; value stays None on timeout"""
+    def __init__(self, owner_id: int, timeout: float = 60.0):
+        super().__init__(timeout=timeout)
+        self.owner_id = owner_id
+        self.value: Optional[bool] = None
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    @discord.ui.button(label="Confirm", style=discord.ButtonStyle.danger)
+    async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.value = True
+        await interaction.response.edit_message(view=None)
+        self.stop()
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.secondary)
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.value = False
+        await interaction.response.edit_message(view=None)
+        self.stop()
+
+async def apply_money_action(action: str, target_type: str, target_id: int, amount: float):
+    """Add, remove or set the balance of a user, faction or nation"""
+    if target_type == "user":
+        balance = (await bot.db.get_user(target_id)).balance
+        modify = bot.db.modify_balance
+    elif target_type == "faction":
+        balance = (await bot.db.get_faction(target_id)).balance
+        modify = bot.db.modify_faction_balance
+    else:
+        balance = (await bot.db.get_nation(target_id)).balance
+        modify = bot.db.modify_nation_balance
+
+    if action == "addmoney":
+        await modify(target_id, amount)
+    elif action == "removemoney":
+        await modify(target_id, -amount)
+    elif action == "setmoney":
+        await modify(target_id, -balance + amount)
+
+async def find_entity(entity_type: str, name: str):
+    """Faction or nation by name, matched case-insensitively through the name index"""
+    entity_id = bot.name_index.lookup(entity_type, name)
+    if entity_id is None:
+        return None
+    if entity_type == "faction":
+        return await bot.db.get_faction(entity_id)
+    return await bot.db.get_nation(entity_id)
+
+async def autocomplete_names(entity_type: str, current: str) -> List[app_commands.Choice[str]]:
+    return [app_commands.Choice(name=name, value=name) for name in bot.name_index.complete(entity_type, current)]
+
 class MoneyAmountModal(discord.ui.Modal, title="Enter Amount"):
     def __init__(self, action: str, target_type: str):
         super().__init__()
         self.action = action
         self.target_type = target_type
         self.amount = discord.ui.TextInput(label="Amount", style=discord.TextStyle.short)
+        self.add_item(self.amount)
+        self.entity_name = None
+        if target_type != "user":
+            self.entity_name = discord.ui.TextInput(label=f"{target_type.capitalize()} name", style=discord.TextStyle.short)
+            self.add_item(self.entity_name)
 
     async def on_submit(self, interaction: discord.Interaction):
-        amount = float(self.amount.value)
+        try:
+            amount = float(self.amount.value)
+        except ValueError:
+            await interaction.response.send_message("Amount must be a number!", ephemeral=True)
+            return
+
         if self.target_type == "user":
-            await interaction.response.send_message("Please mention the user:", ephemeral=True)
-            try:
-                message = await bot.wait_for(
-                    'message',
-                    timeout=30.0,
-                    check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-                )
-                user = message.mentions[0]
-                if self.action == "addmoney":
-                    await bot.db.modify_balance(user.id, amount)
-                elif self.action == "removemoney":
-                    await bot.db.modify_balance(user.id, -amount)
-                elif self.action == "setmoney":
-                    await bot.db.modify_balance(user.id, -user.balance + amount)
-                await interaction.followup.send(f"Successfully {self.action} for {user.mention} by {amount}!", ephemeral=True)
-            except TimeoutError:
-                await interaction.followup.send("Timed out waiting for user mention!", ephemeral=True)
-        elif self.target_type == "faction":
-            await interaction.response.send_message("Please enter the faction name:", ephemeral=True)
-            try:
-                message = await bot.wait_for(
-                    'message',
-                    timeout=30.0,
-                    check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
+            async def on_pick(pick_interaction: discord.Interaction, users: List[discord.User]):
+                user = users[0]
+                await apply_money_action(self.action, "user", user.id, amount)
+                await pick_interaction.response.send_message(
+                    f"Successfully {self.action} for {user.mention} by {amount}!", ephemeral=True
                 )
-                faction = await bot.db.get_faction_by_name(message.content)
-                if faction:
-                    if self.action == "addmoney":
-                        await bot.db.modify_faction_balance(faction.id, amount)
-                    elif self.action == "removemoney":
-                        await bot.db.modify_faction_balance(faction.id, -amount)
-                    elif self.action == "setmoney":
-                        await bot.db.modify_faction_balance(faction.id, -faction.balance + amount)
-                    await interaction.followup.send(f"Successfully {self.action} for faction {faction.name} by {amount}!", ephemeral=True)
-                else:
-                    await interaction.followup.send("Faction not found!", ephemeral=True)
-            except TimeoutError:
-                await interaction.followup.send("Timed out waiting for faction name!", ephemeral=True)
-        elif self.target_type == "nation":
-            await interaction.response.send_message("Please enter the nation name:", ephemeral=True)
-            try:
-                message = await bot.wait_for(
-                    'message',
-                    timeout=30.0,
-                    check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
+
+            await interaction.response.send_message(
+                "Select the user:", view=UserPickView(interaction.user.id, on_pick), ephemeral=True
+            )
+            return
+
+        entity = await find_entity(self.target_type, self.entity_name.value)
+        if not entity:
+            await interaction.response.send_message(f"{self.target_type.capitalize()} not found!", ephemeral=True)
+            return
+        await apply_money_action(self.action, self.target_type, entity.id, amount)
+        await interaction.response.send_message(
+            f"Successfully {self.action} for {self.target_type} {entity.name} by {amount}!", ephemeral=True
+        )
+
+class EntityActionModal(discord.ui.Modal, title="Select Target"):
+    """Asks an admin which faction or nation a management action applies to"""
+    def __init__(self, entity_type: str, action: str):
+        super().__init__()
+        self.entity_type = entity_type
+        self.action = action
+        self.entity_name = discord.ui.TextInput(label=f"{entity_type.capitalize()} name", style=discord.TextStyle.short)
+        self.add_item(self.entity_name)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        entity = await find_entity(self.entity_type, self.entity_name.value)
+        if not entity:
+            await interaction.response.send_message(f"{self.entity_type.capitalize()} not found!", ephemeral=True)
+            return
+
+        if self.action == "assign_ranks":
+            view = AssignRanksView(entity.id)
+            await interaction.response.send_message("Select a rank to assign:", view=view, ephemeral=True)
+        elif self.action == "force_add_members":
+            async def on_pick(pick_interaction: discord.Interaction, users: List[discord.User]):
+                for member in users:
+                    if self.entity_type == "faction":
+                        await bot.db.add_member_to_faction(member.id, entity.id)
+                    else:
+                        await bot.db.add_member_to_nation(member.id, entity.id)
+                await pick_interaction.response.send_message(
+                    f"Successfully added {len(users)} users to {self.entity_type} {entity.name}!", ephemeral=True
                 )
-                nation = await bot.db.get_nation_by_name(message.content)
-                if nation:
-                    if self.action == "addmoney":
-                        await bot.db.modify_nation_balance(nation.id, amount)
-                    elif self.action == "removemoney":
-                        await bot.db.modify_nation_balance(nation.id, -amount)
-                    elif self.action == "setmoney":
-                        await bot.db.modify_nation_balance(nation.id, -nation.balance + amount)
-                    await interaction.followup.send(f"Successfully {self.action} for nation {nation.name} by {amount}!", ephemeral=True)
-                else:
-                    await interaction.followup.send("Nation not found!", ephemeral=True)
-            except TimeoutError:
-                await interaction.followup.send("Timed out waiting for nation name!", ephemeral=True)
+
+            view = UserPickView(interaction.user.id, on_pick, max_values=25, placeholder="Select users to add...")
+            await interaction.response.send_message("Select the users to add:", view=view, ephemeral=True)
+        elif self.action.startswith("force_disband"):
+            if self.entity_type == "faction":
+                await bot.db.disband_faction(entity.id)
+            else:
+                await bot.db.disband_nation(entity.id)
+            await interaction.response.send_message(
+                f"Successfully disbanded {self.entity_type} {entity.name}!", ephemeral=True
+            )
 
 class FactionManagementSelect(discord.ui.Select):
     def __init__(self):
@@ -495,71 +951,7 @@ class FactionManagementSelect(discord.ui.Select):
         super().__init__(placeholder="Select a faction management action...", options=options)
 
     async def callback(self, interaction: discord.Interaction):
-        action = self.values[0]
-        if action == "assign_ranks":
-            await interaction.response.send_message("Please enter the faction name:", ephemeral=True)
-            try:
-                message = await bot.wait_for(
-                    'message',
-                    timeout=30.0,
-                    check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-                )
-                faction = await bot.db.get_faction_by_name(message.content)
-                if faction:
-                    view = AssignRanksView(faction.id)
-                    await interaction.followup.send("Select a rank to assign:", view=view, ephemeral=True)
-                else:
-                    await interaction.followup.send("Faction not found!", ephemeral=True)
-            except TimeoutError:
-                await interaction.followup.send("Timed out waiting for faction name!", ephemeral=True)
-        elif action == "force_add_members":
-            await interaction.response.send_message("Please enter the faction name:", ephemeral=True)
-            try:
-                message = await bot.wait_for(
-                    'message',
-                    timeout=30.0,
-                    check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-                )
-                faction = await bot.db.get_faction_by_name(message.content)
-                if faction:
-                    await interaction.followup.send("Please mention the users to add:", ephemeral=True)
-                    try:
-                        message = await bot.wait_for(
-                            'message',
-                            timeout=30.0,
-                            check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-                        )
-                        mentions = message.mentions
-                        if not mentions:
-                            await interaction.followup.send("No users mentioned!", ephemeral=True)
-                            return
-
-                        for mentioned_user in mentions:
-                            await bot.db.add_member_to_faction(mentioned_user.id, faction.id)
-                        
-                        await interaction.followup.send(f"Successfully added {len(mentions)} users to faction {faction.name}!", ephemeral=True)
-                    except TimeoutError:
-                        await interaction.followup.send("Timed out waiting for user mentions!", ephemeral=True)
-                else:
-                    await interaction.followup.send("Faction not found!", ephemeral=True)
-            except TimeoutError:
-                await interaction.followup.send("Timed out waiting for faction name!", ephemeral=True)
-        elif action == "force_disband_faction":
-            await interaction.response.send_message("Please enter the faction name:", ephemeral=True)
-            try:
-                message = await bot.wait_for(
-                    'message',
-                    timeout=30.0,
-                    check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-                )
-                faction = await bot.db.get_faction_by_name(message.content)
-                if faction:
-                    await bot.db.disband_faction(faction.id)
-                    await interaction.followup.send(f"Successfully disbanded faction {faction.name}!", ephemeral=True)
-                else:
-                    await interaction.followup.send("Faction not found!", ephemeral=True)
-            except TimeoutError:
-                await interaction.followup.send("Timed out waiting for faction name!", ephemeral=True)
+        await interaction.response.send_modal(EntityActionModal("faction", self.values[0]))
 
 class FactionManagementSelectView(discord.ui.View):
     def __init__(self):
@@ -576,71 +968,7 @@ class NationManagementSelect(discord.ui.Select):
         super().__init__(placeholder="Select a nation management action...", options=options)
 
     async def callback(self, interaction: discord.Interaction):
-        action = self.values[0]
-        if action == "assign_ranks":
-            await interaction.response.send_message("Please enter the nation name:", ephemeral=True)
-            try:
-                message = await bot.wait_for(
-                    'message',
-                    timeout=30.0,
-                    check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-                )
-                nation = await bot.db.get_nation_by_name(message.content)
-                if nation:
-                    view = AssignRanksView(nation.id)
-                    await interaction.followup.send("Select a rank to assign:", view=view, ephemeral=True)
-                else:
-                    await interaction.followup.send("Nation not found!", ephemeral=True)
-            except TimeoutError:
-                await interaction.followup.send("Timed out waiting for nation name!", ephemeral=True)
-        elif action == "force_add_members":
-            await interaction.response.send_message("Please enter the nation name:", ephemeral=True)
-            try:
-                message = await bot.wait_for(
-                    'message',
-                    timeout=30.0,
-                    check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-                )
-                nation = await bot.db.get_nation_by_name(message.content)
-                if nation:
-                    await interaction.followup.send("Please mention the users to add:", ephemeral=True)
-                    try:
-                        message = await bot.wait_for(
-                            'message',
-                            timeout=30.0,
-                            check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-                        )
-                        mentions = message.mentions
-                        if not mentions:
-                            await interaction.followup.send("No users mentioned!", ephemeral=True)
-                            return
-
-                        for mentioned_user in mentions:
-                            await bot.db.add_member_to_nation(mentioned_user.id, nation.id)
-                        
-                        await interaction.followup.send(f"Successfully added {len(mentions)} users to nation {nation.name}!", ephemeral=True)
-                    except TimeoutError:
-                        await interaction.followup.send("Timed out waiting for user mentions!", ephemeral=True)
-                else:
-                    await interaction.followup.send("Nation not found!", ephemeral=True)
-            except TimeoutError:
-                await interaction.followup.send("Timed out waiting for nation name!", ephemeral=True)
-        elif action == "force_disband_nation":
-            await interaction.response.send_message("Please enter the nation name:", ephemeral=True)
-            try:
-                message = await bot.wait_for(
-                    'message',
-                    timeout=30.0,
-                    check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-                )
-                nation = await bot.db.get_nation_by_name(message.content)
-                if nation:
-                    await bot.db.disband_nation(nation.id)
-                    await interaction.followup.send(f"Successfully disbanded nation {nation.name}!", ephemeral=True)
-                else:
-                    await interaction.followup.send("Nation not found!", ephemeral=True)
-            except TimeoutError:
-                await interaction.followup.send("Timed out waiting for nation name!", ephemeral=True)
+        await interaction.response.send_modal(EntityActionModal("nation", self.values[0]))
 
 class NationManagementSelectView(discord.ui.View):
     def __init__(self):
@@ -666,27 +994,19 @@ class AssignRanksSelect(discord.ui.Select):
 
     async def callback(self, interaction: discord.Interaction):
         rank_name = self.values[0]
-        await interaction.response.send_message("Please mention the user to assign the rank to:", ephemeral=True)
-        try:
-            message = await bot.wait_for(
-                'message',
-                timeout=30.0,
-                check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-            )
-            user = message.mentions[0]
+
+        async def on_pick(pick_interaction: discord.Interaction, users: List[discord.User]):
+            user = users[0]
             await bot.db.assign_rank_to_user(user.id, self.entity_id, rank_name)
-            await interaction.followup.send(f"Successfully assigned rank {rank_name} to {user.mention}!", ephemeral=True)
-        except TimeoutError:
-            await interaction.followup.send("Timed out waiting for user mention!", ephemeral=True)
+            await pick_interaction.response.send_message(
+                f"Successfully assigned rank {rank_name} to {user.mention}!", ephemeral=True
+            )
+
+        view = UserPickView(interaction.user.id, on_pick)
+        await interaction.response.send_message("Select the user to assign the rank to:", view=view, ephemeral=True)
 
 bot = MegatropoBot()
-pass_generator = PassGenerator()
 
-@bot.event
-async def on_ready():
-    print(f'{bot.user} has connected to Discord!')
-    await bot.tree.sync()  # Ensure commands are synced
-    
 @bot.tree.command(name="balance", description="Check your balance")
 @in_command_channel()
 async def balance(interaction: discord.Interaction):
@@ -712,18 +1032,7 @@ async def create_faction(interaction: discord.Interaction, name: str):
             await bot.db.store_entity_image('faction', success, bio.getvalue())
 
         # Assign owner rank
-        cursor = bot.db.conn.cursor()
-        cursor.execute(
-            'SELECT id FROM ranks WHERE faction_id = ? AND name = ?',
-            (success, "Owner")
-        )
-        owner_rank = cursor.fetchone()
-        if owner_rank:
-            cursor.execute(
-                'UPDATE users SET rank_id = ? WHERE id = ?',
-                (owner_rank[0], user.id)
-            )
-            bot.db.conn.commit()
+        await bot.db.assign_rank_to_user(user.id, success, "Owner")
         
         await interaction.response.send_message(f"Faction {name} created successfully!")
     else:
@@ -793,18 +1102,7 @@ async def create_nation(interaction: discord.Interaction, name: str, type: str,
                 await bot.db.store_entity_image('nation', success, bio.getvalue())
 
             # Assign owner rank to nation
-            cursor = bot.db.conn.cursor()
-            cursor.execute(
-                'SELECT id FROM ranks WHERE faction_id = ? AND name = ?',
-                (success, "Owner")
-            )
-            owner_rank = cursor.fetchone()
-            if owner_rank:
-                cursor.execute(
-                    'UPDATE users SET rank_id = ? WHERE id = ?',
-                    (owner_rank[0], user.id)
-                )
-                bot.db.conn.commit()
+            await bot.db.assign_rank_to_user(user.id, success, "Owner")
 
             await interaction.response.send_message(f"Faction converted to nation {name} successfully!")
         else:
@@ -825,18 +1123,7 @@ async def create_nation(interaction: discord.Interaction, name: str, type: str,
                     await bot.db.store_entity_image('nation', success, bio.getvalue())
 
                 # Assign owner rank
-                cursor = bot.db.conn.cursor()
-                cursor.execute(
-                    'SELECT id FROM ranks WHERE faction_id = ? AND name = ?',
-                    (success, "Owner")
-                )
-                owner_rank = cursor.fetchone()
-                if owner_rank:
-                    cursor.execute(
-                        'UPDATE users SET rank_id = ? WHERE id = ?',
-                        (owner_rank[0], user.id)
-                    )
-                    bot.db.conn.commit()
+                await bot.db.assign_rank_to_user(user.id, success, "Owner")
 
                 await interaction.response.send_message(f"Nation {name} created successfully!")
             else:
@@ -1043,31 +1330,26 @@ async def disband(interaction: discord.Interaction, entity_type: str):
         await interaction.followup.send("Invalid entity type! Use 'faction' or 'nation'.")
         return
 
-    # Generate a random number for confirmation
-    import random
-    confirmation_number = random.randint(1000, 9999)
-    await interaction.followup.send(f"To confirm disbanding the {entity_type}, please type the following number: {confirmation_number}")
+    view = ConfirmView(interaction.user.id)
+    await interaction.followup.send(f"Are you sure you want to disband {entity.name}? This cannot be undone.", view=view)
+    await view.wait()
 
-    try:
-        message = await bot.wait_for(
-            'message',
-            timeout=60.0,
-            check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
-        )
-        if message.content == str(confirmation_number):
-            if entity_type.lower() == "faction":
-                success = await bot.db.disband_faction(entity.id)
-            else:
-                success = await bot.db.disband_nation(entity.id)
-            
-            if success:
-                await interaction.followup.send(f"{entity_type.capitalize()} disbanded successfully!")
-            else:
-                await interaction.followup.send(f"Failed to disband {entity_type}!")
-        else:
-            await interaction.followup.send("Disbanding cancelled. Incorrect confirmation number.")
-    except TimeoutError:
+    if view.value is None:
         await interaction.followup.send("Disbanding cancelled. Confirmation timed out.")
+        return
+    if not view.value:
+        await interaction.followup.send("Disbanding cancelled.")
+        return
+
+    if entity_type.lower() == "faction":
+        success = await bot.db.disband_faction(entity.id)
+    else:
+        success = await bot.db.disband_nation(entity.id)
+
+    if success:
+        await interaction.followup.send(f"{entity_type.capitalize()} disbanded successfully!")
+    else:
+        await interaction.followup.send(f"Failed to disband {entity_type}!")
 
 @bot.tree.command(name="add-member", description="Add a member to your faction or nation")
 @in_command_channel()
@@ -1112,26 +1394,15 @@ async def add_member(interaction: discord.Interaction, entity_type: str, user: d
                 f"Invited {user.mention} to {entity.name}! They can accept with `/accept-invite {entity_type} {entity.id}`"
             )
     else:
-        await interaction.followup.send("Please mention the users to invite in your next message:")
-        try:
-            message = await bot.wait_for(
-                'message',
-                timeout=30.0,
-                check=lambda m: m.author.id == interaction.user.id and m.channel.id == interaction.channel.id
+        async def on_pick(pick_interaction: discord.Interaction, users: List[discord.User]):
+            for invited in users:
+                await bot.db.add_pending_invite(invited.id, entity.id)
+            await pick_interaction.response.send_message(
+                f"Invited {len(users)} users to {entity.name}! They can accept with `/accept-invite {entity_type} {entity.id}`"
             )
-            mentions = message.mentions
-            if not mentions:
-                await interaction.followup.send("No users mentioned!")
-                return
 
-            for mentioned_user in mentions:
-                await bot.db.add_pending_invite(mentioned_user.id, entity.id)
-            
-            await interaction.followup.send(
-                f"Invited {len(mentions)} users to {entity.name}! They can accept with `/accept-invite {entity_type} {entity.id}`"
-            )
-        except TimeoutError:
-            await interaction.followup.send("Timed out waiting for mentions!")
+        view = UserPickView(interaction.user.id, on_pick, max_values=25, placeholder="Select users to invite...")
+        await interaction.followup.send("Select the users to invite:", view=view)
 
 @bot.tree.command(name="accept-invite", description="Accept an invite to a faction or nation")
 @in_command_channel()
@@ -1182,22 +1453,10 @@ async def user_info(interaction: discord.Interaction, user: discord.User = None)
 async def faction_info(interaction: discord.Interaction):
     await interaction.response.defer()  # Defer the interaction at the beginning
     
-    # Get all factions
-    cursor = bot.db.conn.cursor()
-    cursor.execute('SELECT id FROM factions')
-    faction_ids = [row[0] for row in cursor.fetchall()]
-    
-    if not faction_ids:
+    view = FactionSelectView(bot.db)
+    if not await view.load():
         await interaction.followup.send("No factions exist yet!")
         return
-        
-    factions = []
-    for fid in faction_ids:
-        faction = await bot.db.get_faction(fid)
-        if faction:
-            factions.append(faction)
-    
-    view = FactionSelectView(factions)
     await interaction.followup.send("Select a faction to view:", view=view)
 
 @bot.tree.command(name="nation-info", description="Get information about a nation")
@@ -1205,22 +1464,10 @@ async def faction_info(interaction: discord.Interaction):
 async def nation_info(interaction: discord.Interaction):
     await interaction.response.defer()
     
-    # Get all nations
-    cursor = bot.db.conn.cursor()
-    cursor.execute('SELECT id FROM nations')
-    nation_ids = [row[0] for row in cursor.fetchall()]
-    
-    if not nation_ids:
+    view = NationSelectView(bot.db)
+    if not await view.load():
         await interaction.followup.send("No nations exist yet!")
         return
-        
-    nations = []
-    for nid in nation_ids:
-        nation = await bot.db.get_nation(nid)
-        if nation:
-            nations.append(nation)
-    
-    view = NationSelectView(nations)
     await interaction.followup.send("Select a nation to view:", view=view)
 
 @bot.tree.command(name="form-alliance", description="Form an alliance with another nation")
@@ -1236,7 +1483,7 @@ async def form_alliance(interaction: discord.Interaction, nation_name: str):
         await interaction.response.send_message("Only nation leaders can form alliances!")
         return
 
-    target_nation = await bot.db.get_nation_by_name(nation_name)
+    target_nation = await find_entity("nation", nation_name)
     if not target_nation:
         await interaction.response.send_message(f"Nation '{nation_name}' not found!")
         return
@@ -1251,6 +1498,10 @@ async def form_alliance(interaction: discord.Interaction, nation_name: str):
     else:
         await interaction.response.send_message("Failed to form alliance!")
 
+@form_alliance.autocomplete('nation_name')
+async def form_alliance_nation_autocomplete(interaction: discord.Interaction, current: str):
+    return await autocomplete_names("nation", current)
+
 @bot.tree.command(name="break-alliance", description="Break an alliance with another nation")
 @in_command_channel()
 async def break_alliance(interaction: discord.Interaction, nation_name: str):
@@ -1264,7 +1515,7 @@ async def break_alliance(interaction: discord.Interaction, nation_name: str):
         await interaction.response.send_message("Only nation leaders can break alliances!")
         return
 
-    target_nation = await bot.db.get_nation_by_name(nation_name)
+    target_nation = await find_entity("nation", nation_name)
     if not target_nation:
         await interaction.response.send_message(f"Nation '{nation_name}' not found!")
         return
@@ -1275,6 +1526,10 @@ async def break_alliance(interaction: discord.Interaction, nation_name: str):
     else:
         await interaction.response.send_message("Failed to break alliance!")
 
+@break_alliance.autocomplete('nation_name')
+async def break_alliance_nation_autocomplete(interaction: discord.Interaction, current: str):
+    return await autocomplete_names("nation", current)
+
 @bot.tree.command(name="transfer", description="Transfer money between faction/nation pools")
 @in_command_channel()
 async def transfer_money(
@@ -1307,14 +1562,8 @@ async def transfer_money(
 
     # Determine destination
     to_id = None
-    if to_type.lower() == 'faction':
-        target = await bot.db.get_faction_by_name(to_name)
-        if target:
-            to_id = target.id
-    elif to_type.lower() == 'nation':
-        target = await bot.db.get_nation_by_name(to_name)
-        if target:
-            to_id = target.id
+    if to_type.lower() in ('faction', 'nation'):
+        to_id = bot.name_index.lookup(to_type.lower(), to_name)
     
     if not to_id:
         await interaction.response.send_message(f"{to_type.capitalize()} '{to_name}' not found!")
@@ -1328,29 +1577,130 @@ async def transfer_money(
     else:
         await interaction.response.send_message("Transfer failed! Insufficient funds or invalid transfer.")
 
+@transfer_money.autocomplete('to_name')
+async def transfer_name_autocomplete(interaction: discord.Interaction, current: str):
+    to_type = (interaction.namespace.to_type or '').lower()
+    if to_type not in ('faction', 'nation'):
+        return []
+    return await autocomplete_names(to_type, current)
+
 @bot.tree.command(name="grant-pass", description="Grant a pass to a user")
 @in_command_channel()
 async def grant_pass(interaction: discord.Interaction, user: discord.User, days: int = 30):
+    await interaction.response.defer(thinking=True)  # Rendering may wait for a free worker
     granter = await bot.db.get_user(interaction.user.id)
     faction = await bot.db.get_user_faction(granter.id)
     
     if not faction or faction.owner_id != granter.id:
-        await interaction.response.send_message("Only faction owners can grant passes!")
+        await interaction.followup.send("Only faction owners can grant passes!")
         return
 
     expiry_date = datetime.now() + timedelta(days=days)
     user_pass = await bot.db.create_user_pass(user.id, expiry_date)
     if user_pass:
-        pass_image = pass_generator.create_pass_image(user_pass, user.name)
-        pass_image.save(f"temp_pass_{user.id}.png")
-        
-        await interaction.response.send_message(
-            f"Pass created for {user.name}",
-            file=discord.File(f"temp_pass_{user.id}.png")
+        await bot.send_pass(interaction, user_pass, user.name, f"Pass created for {user.name}")
+    else:
+        await interaction.followup.send("Failed to create pass!")
+
+def build_pass_zip(files: List[tuple]) -> bytes:
+    """Pack (filename, png bytes) pairs into a ZIP archive"""
+    with BytesIO() as bio:
+        # PNGs are already compressed, storing them is much faster than deflating again
+        with zipfile.ZipFile(bio, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for filename, data in files:
+                archive.writestr(filename, data)
+        return bio.getvalue()
+
+@bot.tree.command(name="grant-pass-bulk", description="Grant passes to every member of your faction or nation")
+@in_command_channel()
+@app_commands.describe(
+    entity_type="Grant to your faction or your nation",
+    days="How many days the passes stay valid",
+    delivery="Send one ZIP file or batches of images"
+)
+@app_commands.choices(
+    entity_type=[
+        app_commands.Choice(name="Faction", value="faction"),
+        app_commands.Choice(name="Nation", value="nation")
+    ],
+    delivery=[
+        app_commands.Choice(name="ZIP file", value="zip"),
+        app_commands.Choice(name="Messages", value="messages")
+    ]
+)
+async def grant_pass_bulk(interaction: discord.Interaction, entity_type: str, days: int = 30, delivery: str = "zip"):
+    await interaction.response.defer(thinking=True)
+    granter = await bot.db.get_user(interaction.user.id)
+
+    if entity_type == "faction":
+        entity = await bot.db.get_user_faction(granter.id)
+        if not entity or entity.owner_id != granter.id:
+            await interaction.followup.send("Only faction owners can grant passes!")
+            return
+        member_ids = await bot.db.get_faction_members(entity.id)
+    else:
+        entity = await bot.db.get_nation(granter.nation_id) if granter.nation_id else None
+        if not entity or entity.owner_id != granter.id:
+            await interaction.followup.send("Only nation leaders can grant passes!")
+            return
+        member_ids = await bot.db.get_nation_members(entity.id)
+
+    if not member_ids:
+        await interaction.followup.send(f"Your {entity_type} has no members!")
+        return
+
+    expiry_date = datetime.now() + timedelta(days=days)
+    user_passes = await bot.db.create_user_passes(member_ids, expiry_date)
+
+    members = await bot.members.get_many(interaction.guild, [user_pass.user_id for user_pass in user_passes])
+    items = []
+    for user_pass in user_passes:
+        member = members.get(user_pass.user_id)
+        items.append((user_pass, member.name if member else str(user_pass.user_id)))
+    fmt = await bot.pass_format(interaction.guild_id)
+    pass_images = await bot.renderer.render_many(items, fmt)
+
+    files = []
+    for (user_pass, username), pass_data in zip(items, pass_images):
+        bot.pass_cache.put(bot.pass_cache.key_for(user_pass, username, fmt), user_pass, pass_data)
+        files.append((f"pass_{username}_{user_pass.user_id}.{pass_extension(fmt)}", pass_data))
+
+    summary = f"Granted {len(files)} passes to members of {entity.name}, valid until {expiry_date.strftime('%Y-%m-%d')}."
+    if delivery == "zip":
+        archive = await asyncio.to_thread(build_pass_zip, files)
+        await interaction.followup.send(
+            summary,
+            file=discord.File(BytesIO(archive), filename=f"passes_{entity_type}_{entity.id}.zip")
         )
-        os.remove(f"temp_pass_{user.id}.png")
     else:
-        await interaction.response.send_message("Failed to create pass!")
+        await interaction.followup.send(summary)
+        for start in range(0, len(files), 10):  # Discord allows 10 attachments per message
+            await interaction.followup.send(files=[
+                discord.File(BytesIO(data), filename=filename) for filename, data in files[start:start + 10]
+            ])
+
+@bot.tree.command(name="revoke-pass", description="Revoke a user's pass")
+@in_command_channel()
+async def revoke_pass(interaction: discord.Interaction, user: discord.User):
+    revoker = await bot.db.get_user(interaction.user.id)
+    faction = await bot.db.get_user_faction(revoker.id)
+
+    if not faction or faction.owner_id != revoker.id:
+        await interaction.response.send_message("Only faction owners can revoke passes!")
+        return
+
+    user_pass = await bot.db.get_user_pass(user.id)
+    if not user_pass:
+        await interaction.response.send_message(f"{user.name} has no pass!")
+        return
+    if user_pass.faction_id != faction.id:
+        await interaction.response.send_message("You can only revoke passes issued to your faction's members!")
+        return
+
+    if await bot.db.revoke_pass(user.id):
+        await interaction.response.send_message(f"Pass of {user.name} revoked.")
+    else:
+        await interaction.response.send_message("Failed to revoke pass!")
 
 @bot.tree.command(name="request-pass", description="Request a new pass (costs 5 if no faction/nation)")
 @in_command_channel()
@@ -1368,73 +1718,71 @@ async def request_pass(interaction: discord.Interaction):
     expiry_date = datetime.now() + timedelta(days=30)
     user_pass = await bot.db.create_user_pass(user.id, expiry_date)
     if user_pass:
-        pass_image = pass_generator.create_pass_image(user_pass, interaction.user.name)
-        pass_image.save(f"temp_pass_{user.id}.png")
-        
-        await interaction.followup.send(
-            f"Pass created successfully!",
-            file=discord.File(f"temp_pass_{user.id}.png")
-        )
-        os.remove(f"temp_pass_{user.id}.png")
+        await bot.send_pass(interaction, user_pass, interaction.user.name, "Pass created successfully!")
     else:
         await interaction.followup.send("Failed to create pass!")
 
 @bot.tree.command(name="show-pass", description="Show your pass")
 @in_command_channel()
 async def show_pass(interaction: discord.Interaction):
+    await interaction.response.defer()  # Rendering may wait for a free worker
     user = await bot.db.get_user(interaction.user.id)
     user_pass = await bot.db.get_user_pass(user.id)
     
     if not user_pass:
-        await interaction.response.send_message("You don't have a valid pass!")
+        await interaction.followup.send("You don't have a valid pass!")
         return
 
-    pass_image = pass_generator.create_pass_image(user_pass, interaction.user.name)
-    pass_image.save(f"temp_pass_{user.id}.png")
-    
-    await interaction.response.send_message(
-        "Here's your pass:",
-        file=discord.File(f"temp_pass_{user.id}.png")
-    )
-    os.remove(f"temp_pass_{user.id}.png")
+    await bot.send_pass(interaction, user_pass, interaction.user.name, "Here's your pass:")
+
+async def receive_icon(interaction: discord.Interaction, icon: Optional[discord.Attachment]) -> Optional[discord.Attachment]:
+    """Use the attachment given with the command, otherwise wait for the user to upload one"""
+    if icon:
+        return icon
+    await interaction.followup.send("Please upload your icon (PNG, JPEG, WebP or GIF), or pass it with the command's icon option next time.")
+    try:
+        message = await bot.conversations.ask(interaction, timeout=60.0, check=lambda m: bool(m.attachments))
+    except TimeoutError:
+        await interaction.followup.send("Timed out waiting for icon upload!")
+        return None
+    return message.attachments[0]
+
+async def store_uploaded_icon(interaction: discord.Interaction, entity_type: str, entity_id: int,
+                              icon: Optional[discord.Attachment]):
+    attachment = await receive_icon(interaction, icon)
+    if attachment is None:
+        return
+
+    icon_data = await attachment.read()
+    try:
+        success = await bot.db.store_entity_image(entity_type, entity_id, icon_data)
+    except IconError as e:
+        await interaction.followup.send(f"Invalid icon: {e}")
+        return
+
+    if success:
+        await interaction.followup.send(f"{entity_type.capitalize()} icon updated successfully!")
+    else:
+        await interaction.followup.send(f"Failed to update {entity_type} icon!")
 
 @bot.tree.command(name="upload-faction-icon", description="Upload your faction's icon")
 @in_command_channel()
-async def upload_faction_icon(interaction: discord.Interaction):
+@app_commands.describe(icon="PNG, JPEG, WebP or GIF image to use, or leave empty and upload it in your next message")
+async def upload_faction_icon(interaction: discord.Interaction, icon: Optional[discord.Attachment] = None):
+    await interaction.response.defer(thinking=True)
     user = await bot.db.get_user(interaction.user.id)
     faction = await bot.db.get_user_faction(user.id)
     
     if not faction or faction.owner_id != user.id:
-        await interaction.response.send_message("You must be a faction owner to upload an icon!")
+        await interaction.followup.send("You must be a faction owner to upload an icon!")
         return
 
-    await interaction.response.send_message("Please upload your faction icon (PNG format).")
-    
-    try:
-        message = await bot.wait_for(
-            'message',
-            timeout=60.0,
-            check=lambda m: m.author.id == interaction.user.id and interaction.channel.id == m.channel.id and m.attachments
-        )
-        
-        if not message.attachments or not message.attachments[0].filename.lower().endswith('.png'):
-            await interaction.followup.send("Please upload a PNG image!")
-            return
-
-        icon_data = await message.attachments[0].read()
-        success = await bot.db.store_entity_image('faction', faction.id, icon_data)
-        
-        if success:
-            await interaction.followup.send("Faction icon updated successfully!")
-        else:
-            await interaction.followup.send("Failed to update faction icon!")
-            
-    except TimeoutError:
-        await interaction.followup.send("Timed out waiting for icon upload!")
+    await store_uploaded_icon(interaction, 'faction', faction.id, icon)
 
 @bot.tree.command(name="upload-nation-icon", description="Upload your nation's icon")
 @in_command_channel()
-async def upload_nation_icon(interaction: discord.Interaction):
+@app_commands.describe(icon="PNG, JPEG, WebP or GIF image to use, or leave empty and upload it in your next message")
+async def upload_nation_icon(interaction: discord.Interaction, icon: Optional[discord.Attachment] = None):
     await interaction.response.defer(thinking=True)  # Defer the interaction at the beginning
     user = await bot.db.get_user(interaction.user.id)
     nation = await bot.db.get_nation(user.nation_id) if user.nation_id else None
@@ -1443,29 +1791,7 @@ async def upload_nation_icon(interaction: discord.Interaction):
         await interaction.followup.send("You must be a nation leader to upload an icon!")
         return
 
-    await interaction.followup.send("Please upload your nation icon (PNG format).")
-    
-    try:
-        message = await bot.wait_for(
-            'message',
-            timeout=60.0,
-            check=lambda m: m.author.id == interaction.user.id and interaction.channel.id == m.channel.id and m.attachments
-        )
-        
-        if not message.attachments or not message.attachments[0].filename.lower().endswith('.png'):
-            await interaction.followup.send("Please upload a PNG image!")
-            return
-
-        icon_data = await message.attachments[0].read()
-        success = await bot.db.store_entity_image('nation', nation.id, icon_data)
-        
-        if success:
-            await interaction.followup.send("Nation icon updated successfully!")
-        else:
-            await interaction.followup.send("Failed to update nation icon!")
-            
-    except TimeoutError:
-        await interaction.followup.send("Timed out waiting for icon upload!")
+    await store_uploaded_icon(interaction, 'nation', nation.id, icon)
 
 @bot.tree.command(name="verify-pass", description="Verify another user's pass")
 @in_command_channel()
@@ -1493,53 +1819,195 @@ async def verify_pass(interaction: discord.Interaction, user: discord.User):
         "Once they show their pass, use /check-pass to verify it."
     )
 
+PASS_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+# Embedded images are only fetched from where Discord stores uploads
+DISCORD_CDN_HOSTS = ('cdn.discordapp.com', 'media.discordapp.net')
+EXACT_PASS_EXTENSIONS = ('.png', '.webp')  # Lossless formats passes are sent in
+
 @bot.tree.command(name="check-pass", description="Check a displayed pass")
 @in_command_channel()
 @app_commands.describe(
     pass_file="The pass image file to verify",
-    user="The user whose pass to verify"
+    user="The user whose pass to verify, leave empty to find the owner from the image",
+    tolerant="Also accept screenshots, resized and re-compressed copies of the pass"
 )
 async def check_pass(
     interaction: discord.Interaction, 
     pass_file: discord.Attachment,
-    user: discord.User
+    user: Optional[discord.User] = None,
+    tolerant: bool = True
 ):
-    if not pass_file.filename.lower().endswith('.png'):
-        await interaction.response.send_message("Invalid file format! Please upload a PNG image.")
-        return
-
-    # Save temporarily and verify
-    temp_path = f"temp_verify_{interaction.id}.png"
-    await pass_file.save(temp_path)
-    
-    user_pass = await bot.db.get_user_pass(user.id)
-    if not user_pass:
-        await interaction.response.send_message(f"No pass data found for {user.name}!")
-        os.remove(temp_path)
+    allowed = PASS_IMAGE_EXTENSIONS if tolerant else EXACT_PASS_EXTENSIONS
+    if not pass_file.filename.lower().endswith(allowed):
+        await interaction.response.send_message(
+            "Invalid file format! Please upload a PNG, JPEG or WebP image." if tolerant
+            else "Invalid file format! Please upload a PNG or WebP image."
+        )
         return
 
-    is_valid, discrepancies, marked_image = pass_generator.verify_pass_image(temp_path, user_pass)
-    os.remove(temp_path)
+    await interaction.response.defer()  # Verification may wait for a free worker
+    image_data = await pass_file.read()
+    if user is None:
+        owner_id, reason = await bot.identify_pass_owner(image_data, tolerant)
+        if owner_id is None:
+            await interaction.followup.send(f"❌ Could not identify the pass owner: {reason}")
+            return
+        user = bot.get_user(owner_id) or await bot.fetch_user(owner_id)
+    is_valid, discrepancies, marked_png, closest = await bot.check_pass_image(image_data, user.id, tolerant)
+    similarity = f"Image check: {bot.describe_closest(closest)}"
 
     if is_valid:
-        await interaction.response.send_message(f"✅ Pass verification successful for {user.name}!")
+        await interaction.followup.send(f"✅ Pass verification successful for {user.name}!\n{similarity}")
     else:
-        marked_path = f"marked_pass_{interaction.id}.png"
-        marked_image.save(marked_path)
-        await interaction.response.send_message(
+        message = (
             f"❌ Pass verification failed for {user.name}!\nDiscrepancies found:\n" + 
-            "\n".join(f"- {d}" for d in discrepancies),
-            file=discord.File(marked_path)
+            "\n".join(f"- {d}" for d in discrepancies) + f"\n{similarity}"
         )
-        os.remove(marked_path)
+        if marked_png:
+            await interaction.followup.send(
+                message, file=discord.File(BytesIO(marked_png), filename=f"marked_pass_{interaction.id}.png")
+            )
+        else:
+            await interaction.followup.send(message)
+
+async def collect_channel_passes(channel, limit: int) -> List[tuple]:
+    """Find pass images in the last messages of a channel as (owner, label, fetch) tuples, owner None when unknown"""
+    found = []
+    async for message in channel.history(limit=limit):
+        owner = message.author
+        # The bot posts passes for whoever a command was about, not always whoever ran it,
+        # so the owner of those is read from the image itself
+        if message.author == bot.user:
+            owner = None
+        elif owner.bot:
+            continue
+
+        for attachment in message.attachments:
+            if attachment.filename.lower().endswith(PASS_IMAGE_EXTENSIONS):
+                found.append((owner, attachment.filename, attachment.read))
+        # Re-shown passes are the bot's embeds pointing at an earlier upload, other embeds
+        # are link previews of arbitrary sites and never fetched
+        if message.author != bot.user:
+            continue
+        for embed in message.embeds:
+            url = embed.image.url if embed.image else None
+            if url and urlsplit(url).hostname in DISCORD_CDN_HOSTS:
+                found.append((owner, "embedded pass", lambda url=url: bot.http.get_from_cdn(url)))
+    return found
+
+def format_check_table(rows: List[tuple]) -> str:
+    """Render (label, user, result, notes) rows as a fixed width table inside a code block"""
+    header = ("#", "File", "User", "Result", "Notes")
+    lines = [(str(i), label[:20], user[:20], result, notes) for i, (label, user, result, notes) in enumerate(rows, 1)]
+    widths = [max(len(row[col]) for row in [header] + lines) for col in range(4)]
+    text = [
+        "  ".join(value.ljust(width) for value, width in zip(row[:4], widths)) + "  " + row[4]
+        for row in [header] + lines
+    ]
+    table = "\n".join(text)
+    if len(table) > 1900:
+        table = table[:1900].rsplit("\n", 1)[0] + "\n..."
+    return f"```\n{table}\n```"
+
+@bot.tree.command(name="check-passes", description="Check several displayed passes at once")
+@in_command_channel()
+@app_commands.describe(
+    users="Mentions of the pass owners in file order, leave empty to find owners from the images",
+    scan="Instead of files, check pass images in this many recent messages (max 100)",
+    tolerant="Also accept screenshots, resized and re-compressed copies of the passes"
+)
+async def check_passes(
+    interaction: discord.Interaction,
+    users: Optional[str] = None,
+    scan: Optional[app_commands.Range[int, 1, 100]] = None,
+    file1: Optional[discord.Attachment] = None,
+    file2: Optional[discord.Attachment] = None,
+    file3: Optional[discord.Attachment] = None,
+    file4: Optional[discord.Attachment] = None,
+    file5: Optional[discord.Attachment] = None,
+    file6: Optional[discord.Attachment] = None,
+    file7: Optional[discord.Attachment] = None,
+    file8: Optional[discord.Attachment] = None,
+    file9: Optional[discord.Attachment] = None,
+    file10: Optional[discord.Attachment] = None,
+    tolerant: bool = True
+):
+    files = [f for f in (file1, file2, file3, file4, file5, file6, file7, file8, file9, file10) if f]
+    if bool(files) == bool(scan):
+        await interaction.response.send_message("Attach pass images or set scan, not both.", ephemeral=True)
+        return
+
+    await interaction.response.defer()  # Scanning and verification can take a while
+
+    if files:
+        mentioned = [int(uid) for uid in re.findall(r'<@!?(\d+)>', users or "")]
+        if mentioned and len(mentioned) != len(files):
+            await interaction.followup.send(
+                f"Mention one owner per file ({len(files)} files, {len(mentioned)} mentions)."
+            )
+            return
+        owners = []
+        for uid in mentioned:
+            try:
+                owners.append(bot.get_user(uid) or await bot.fetch_user(uid))
+            except discord.HTTPException:
+                await interaction.followup.send(f"Could not find the user <@{uid}> ({uid}).")
+                return
+        owners = owners or [None] * len(files)
+        candidates = [(owner, f.filename, f.read) for owner, f in zip(owners, files)]
+    else:
+        candidates = await collect_channel_passes(interaction.channel, scan)
+        if not candidates:
+            await interaction.followup.send(f"No pass images found in the last {scan} messages.")
+            return
+
+    # One query for every known owner instead of one revocation lookup per image
+    passes = await bot.db.get_user_passes([owner.id for owner, _, _ in candidates if owner])
+
+    async def check(owner, label, fetch):
+        name = owner.name if owner else "?"
+        allowed = PASS_IMAGE_EXTENSIONS if tolerant else EXACT_PASS_EXTENSIONS
+        if label != "embedded pass" and not label.lower().endswith(allowed):
+            return label, name, "SKIPPED", "Not a PNG or WebP image"
+        try:
+            image_data = await fetch()
+        except discord.HTTPException:
+            return label, name, "ERROR", "Could not download image"
+
+        owner_id = owner.id if owner else None
+        known = passes
+        if owner is None:
+            owner_id, reason = await bot.identify_pass_owner(image_data, tolerant)
+            if owner_id is None:
+                return label, name, "UNKNOWN", reason
+            found = bot.get_user(owner_id)
+            name = found.name if found else str(owner_id)
+            known = None  # Not prefetched, let the check look the pass up
+        is_valid, discrepancies, _, closest = await bot.check_pass_image(
+            image_data, owner_id, tolerant, marked=False, passes=known
+        )
+        if closest:
+            discrepancies.append(bot.describe_closest(closest))
+        return label, name, "VALID" if is_valid else "INVALID", "; ".join(discrepancies)
+
+    rows = await asyncio.gather(*(check(*candidate) for candidate in candidates))
+    valid = sum(1 for row in rows if row[2] == "VALID")
+    await interaction.followup.send(
+        f"Checked {len(rows)} pass{'es' if len(rows) != 1 else ''}: {valid} valid, {len(rows) - valid} failed\n"
+        + format_check_table(rows)
+    )
 
 @bot.tree.command(name="announce", description="Make an announcement")
 @in_command_channel()
+@app_commands.describe(
+    category_channels="Also post in the announcements channel of each faction's own category"
+)
 async def announce(
     interaction: discord.Interaction,
     nation: bool,
     faction: bool,
-    text: str
+    text: str,
+    category_channels: bool = False
 ):
     # Check permissions
     user = await bot.db.get_user(interaction.user.id)
@@ -1561,30 +2029,105 @@ async def announce(
         await interaction.response.send_message("You don't have permission to make announcements!")
         return
 
-    # Create announcement embed
-    embed = discord.Embed(
-        title="Announcement",
-        description=text,
-        color=discord.Color.blue() if faction else discord.Color.gold()
-    )
-    
+    await interaction.response.defer()
+    guild = interaction.guild
+    sends = []
+
     if faction and can_announce_faction:
+        embed = discord.Embed(title="Announcement", description=text, color=discord.Color.blue())
         embed.set_author(name=user_faction.name)
-        if os.path.exists(f"images/faction_{user_faction.id}.png"):
-            embed.set_thumbnail(url=f"attachment://faction_icon.png")
-        
-        channel = interaction.guild.get_channel(bot.faction_announcement_channels[interaction.guild_id])
-        await channel.send(embed=embed)
+        channels = [guild.get_channel(bot.faction_announcement_channels.get(guild.id, 0))]
+        if category_channels:
+            channels.append(category_channel(guild, f"Faction-{user_faction.name}"))
+        sends.append(bot.announcements.announce(channels, embed, 'faction', user_faction.id))
 
     if nation and can_announce_nation:
+        embed = discord.Embed(title="Announcement", description=text, color=discord.Color.gold())
         embed.set_author(name=user_nation.name)
-        if os.path.exists(f"images/nation_{user_nation.id}.png"):
-            embed.set_thumbnail(url=f"attachment://nation_icon.png")
-        
-        channel = interaction.guild.get_channel(bot.nation_announcement_channels[interaction.guild_id])
-        await channel.send(embed=embed)
+        channels = [guild.get_channel(bot.nation_announcement_channels.get(guild.id, 0))]
+        if category_channels:
+            channels.append(category_channel(guild, f"Nation-{user_nation.name}"))
+            for _, faction_name in await bot.db.get_nation_factions(user_nation.id):
+                channels.append(category_channel(guild, f"Faction-{faction_name}"))
+        sends.append(bot.announcements.announce(channels, embed, 'nation', user_nation.id))
+
+    sent = sum(await asyncio.gather(*sends))
+    if not sent:
+        await interaction.followup.send("No announcement channel could be reached!")
+        return
+    await interaction.followup.send(f"Announcement sent to {sent} channel{'s' if sent != 1 else ''}!")
+
+@bot.tree.command(name="perf", description="Show command latency percentiles and the slowest recent commands")
+@in_command_channel()
+@app_commands.checks.has_permissions(administrator=True)
+async def perf(interaction: discord.Interaction):
+    rows = bot.tracer.summary()
+    embed = discord.Embed(
+        title="Command Latency",
+        description=f"Last {len(bot.tracer.traces)} traced interactions. ⚠️ marks commands that missed "
+                    f"the {ACK_DEADLINE_MS // 1000}s acknowledgement deadline.",
+        color=discord.Color.blue()
+    )
+    if not rows:
+        embed.add_field(name="No data", value="No commands traced yet")
+    lines = []
+    for row in rows[:15]:
+        ack = f"{row['ack_p95_ms']:.0f}" if row['ack_p95_ms'] is not None else "-"
+        warning = f" ⚠️{row['late_acks']}" if row['late_acks'] else ""
+        lines.append(
+            f"`/{row['command']}` ×{row['calls']}: {row['p50_ms']:.0f} / {row['p95_ms']:.0f} / "
+            f"{row['p99_ms']:.0f} ms, ack p95 {ack} ms{warning}"
+        )
+    if lines:
+        embed.add_field(name="p50 / p95 / p99", value="\n".join(lines)[:1024], inline=False)
+
+    for trace in bot.tracer.slowest(3):
+        ack = f"{trace.ack_ms:.0f} ms" if trace.ack_ms is not None else "never"
+        spans = "\n".join(
+            f"{name} ×{calls}: {total:.0f} ms" for name, calls, total in trace.span_totals()[:5]
+        ) or "no traced calls"
+        embed.add_field(
+            name=f"/{trace.command}: {trace.total_ms:.0f} ms, ack {ack}",
+            value=f"<t:{int(trace.started_at)}:R>{' (failed)' if trace.failed else ''}\n{spans}"[:1024],
+            inline=False
+        )
+
+    autocomplete = bot.tracer.summary('autocomplete')
+    if autocomplete:
+        embed.add_field(
+            name="Autocomplete p95",
+            value="\n".join(f"`{row['command']}`: {row['p95_ms']:.1f} ms" for row in autocomplete[:5]),
+            inline=False
+        )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    await interaction.response.send_message("Announcement(s) sent successfully!")
+@bot.tree.command(name="outbound-status", description="Show the outbound Discord request queue")
+@in_command_channel()
+@app_commands.checks.has_permissions(administrator=True)
+async def outbound_status(interaction: discord.Interaction):
+    metrics = bot.outbound.metrics()
+    embed = discord.Embed(title="Outbound Queue", color=discord.Color.blue())
+    embed.add_field(name="Queued", value="\n".join(f"{name}: {count}" for name, count in metrics['queued'].items()))
+    embed.add_field(name="In Flight", value=f"{metrics['in_flight']} ({metrics['waiting_for_slot']} waiting)")
+    embed.add_field(name="Buckets", value=metrics['buckets'])
+    embed.add_field(
+        name="Totals",
+        value=f"{metrics['completed']} done, {metrics['failed']} failed, "
+              f"{metrics['coalesced']} coalesced, {metrics['rate_limited']} rate limited",
+        inline=False
+    )
+    embed.add_field(
+        name="Longest Wait",
+        value="\n".join(f"{name}: {ms} ms" for name, ms in metrics['max_wait_ms'].items()),
+        inline=False
+    )
+    if metrics['busiest_buckets']:
+        embed.add_field(
+            name="Busiest Buckets",
+            value="\n".join(f"{bucket}: {depth}" for bucket, depth in metrics['busiest_buckets']),
+            inline=False
+        )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="setup", description="Initialize bot setup for the server")
 @in_command_channel()
@@ -1596,15 +2139,16 @@ async def setup(interaction: discord.Interaction):
     # Initialize server structure
     status = await bot.initialize_server_structure(interaction.guild)
     
-    # Initialize all users
+    # Initialize all users, a page of members at a time
     member_status = []
-    for member in interaction.guild.members:
-        if not member.bot:
-            success = await bot.initialize_user(member.id)
-            member_status.append(f"{'✅' if success else '❌'} {member.name}")
-
-    # Refresh commands
-    await bot.tree.sync()
+    total_members = 0
+    async for chunk in iter_member_chunks(interaction.guild):
+        humans = [member for member in chunk if not member.bot]
+        created = await bot.db.ensure_users([member.id for member in humans])
+        total_members += len(humans)
+        if len(member_status) < 25:
+            member_status.extend(f"✅ {member.name}" for member in humans[:25 - len(member_status)])
+        print(f"Initialized {total_members} members in {interaction.guild.name}, {created} new")
 
     # Create response embed
     embed = discord.Embed(
@@ -1630,14 +2174,30 @@ async def setup(interaction: discord.Interaction):
     # Add user initialization status
     embed.add_field(
         name="User Initialization",
-        value="\n".join(member_status[:25]) + (
-            f"\n...and {len(member_status) - 25} more" if len(member_status) > 25 else ""
+        value="\n".join(member_status) + (
+            f"\n...and {total_members - len(member_status)} more" if total_members > len(member_status) else ""
         ),
         inline=False
     )
 
     await interaction.followup.send(embed=embed)
 
+@bot.tree.command(name="pass-format", description="Choose the image format passes are sent in")
+@in_command_channel()
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(format="PNG works everywhere, palette PNG and WebP are smaller uploads")
+@app_commands.choices(
+    format=[
+        app_commands.Choice(name="PNG", value="png"),
+        app_commands.Choice(name="Palette PNG", value="png-palette"),
+        app_commands.Choice(name="WebP (lossless)", value="webp")
+    ]
+)
+async def pass_format(interaction: discord.Interaction, format: str):
+    await bot.db.set_setting(f"pass_format:{interaction.guild_id}", format)
+    bot.pass_formats[interaction.guild_id] = format
+    await interaction.response.send_message(f"Passes will now be sent as {format} images.")
+
 @bot.tree.command(name="admin", description="Admin command for managing users, factions, and nations")
 @app_commands.checks.has_permissions(administrator=True)
 async def admin(interaction: discord.Interaction):
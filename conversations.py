@@ -0,0 +1,81 @@
+import asyncio
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import discord
+
+# (guild id or None in DMs, channel id, user id)
+ConversationKey = Tuple[Optional[int], int, int]
+
+
+class _Pending:
+    __slots__ = ('future', 'check', 'expires_at')
+
+    def __init__(self, future: asyncio.Future, check: Optional[Callable[[discord.Message], bool]], expires_at: float):
+        self.future = future
+        self.check = check
+        self.expires_at = expires_at
+
+
+class ConversationRouter:
+    """Routes a user's next message in a channel to the flow that asked for it.
+
+    Every bot.wait_for('message') registers a listener that is evaluated
+    against every message the bot sees. Here each prompt is one dict entry
+    keyed by (guild, channel, user), so a message costs one lookup no matter
+    how many prompts are open. A user has at most one open prompt per channel;
+    asking again supersedes the old one, which ends like a timeout.
+    """
+
+    def __init__(self):
+        self._pending: Dict[ConversationKey, _Pending] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @staticmethod
+    def key_for(guild_id: Optional[int], channel_id: int, user_id: int) -> ConversationKey:
+        return guild_id, channel_id, user_id
+
+    async def ask(self, interaction: discord.Interaction, timeout: float = 60.0,
+                  check: Optional[Callable[[discord.Message], bool]] = None) -> discord.Message:
+        """Wait for the interaction user's next message in its channel that passes check.
+
+        Raises TimeoutError if none arrives within timeout seconds.
+        """
+        key = self.key_for(interaction.guild_id, interaction.channel_id, interaction.user.id)
+        previous = self._pending.pop(key, None)
+        if previous and not previous.future.done():
+            previous.future.set_exception(TimeoutError())
+
+        future = asyncio.get_running_loop().create_future()
+        pending = _Pending(future, check, time.monotonic() + timeout)
+        self._pending[key] = pending
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+
+    def dispatch(self, message: discord.Message) -> bool:
+        """Hand a message to the prompt waiting for it, returns whether one took it"""
+        key = self.key_for(message.guild.id if message.guild else None, message.channel.id, message.author.id)
+        pending = self._pending.get(key)
+        if pending is None:
+            return False
+        if pending.future.done() or pending.expires_at < time.monotonic():
+            del self._pending[key]
+            return False
+        if pending.check and not pending.check(message):
+            return False
+        del self._pending[key]
+        pending.future.set_result(message)
+        return True
+
+    def expire(self) -> int:
+        """Drop prompts past their deadline whose waiter is gone, returning how many"""
+        now = time.monotonic()
+        stale = [key for key, pending in self._pending.items() if pending.future.done() or pending.expires_at < now]
+        for key in stale:
+            self._pending.pop(key).future.cancel()
+        return len(stale)
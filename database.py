@@ -1,14 +1,213 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
 import sqlite3
 import json
-import os
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
 from models import FactionPermission, PassIdentifier, Rank, User, Faction, Nation, UserPass
+from pass_codes import CODE_SIZE, PassCode, PassCodec
+from icon_pipeline import ingest_icon
+from blob_store import BlobStore
+
+sqlite3.register_adapter(PassCode, bytes)  # Pass codes are stored as 36 byte BLOBs
+
+
+def _pass_codes_to_blobs(cursor: sqlite3.Cursor):
+    """Migration 5: rewrite hex TEXT pass codes as BLOBs"""
+    for table, column in (('pass_identifiers', 'colorless_part'), ('user_passes', 'colored_part'),
+                          ('revoked_passes', 'colored_part'), ('pass_image_hashes', 'colored_part')):
+        rows = cursor.execute(f"SELECT rowid, {column} FROM {table} WHERE typeof({column}) = 'text'").fetchall()
+        converted = []
+        for rowid, text in rows:
+            try:
+                converted.append((PassCode.from_hex(text), rowid))
+            except ValueError:
+                print(f"Leaving unreadable {table}.{column} in row {rowid} as it is")
+        # OR IGNORE: codes that only differed in padding collapse into one row
+        cursor.executemany(f'UPDATE OR IGNORE {table} SET {column} = ? WHERE rowid = ?', converted)
+
+# Tables whose writes other shard processes need to hear about, by change marker topic
+CHANGE_TOPICS = {
+    'revocations': ('revoked_passes',),
+    'pass_image_hashes': ('pass_image_hashes',),
+    'guild_config': ('guild_config',),
+    'names': ('factions', 'nations'),
+    'pass_icons': ('entity_image_variants',),
+    'settings': ('bot_settings',),
+}
+
+
+def _add_change_markers(cursor: sqlite3.Cursor):
+    """Migration 7: a counter per topic, bumped by triggers in the transaction of every write"""
+    cursor.execute('CREATE TABLE IF NOT EXISTS change_markers (topic TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+    for topic, tables in CHANGE_TOPICS.items():
+        cursor.execute('INSERT OR IGNORE INTO change_markers (topic, version) VALUES (?, 0)', (topic,))
+        for table in tables:
+            # Faction and nation rows change often, only their names matter here
+            operations = ('INSERT', 'DELETE', 'UPDATE OF name') if topic == 'names' else ('INSERT', 'DELETE', 'UPDATE')
+            for operation in operations:
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS mark_{table}_{operation.split()[0].lower()}
+                    AFTER {operation} ON {table}
+                    BEGIN
+                        UPDATE change_markers SET version = version + 1 WHERE topic = '{topic}';
+                    END
+                ''')
+
+# SQLite only waits this long for another process's write lock, past it writes wait on the event loop
+BUSY_TIMEOUT_MS = 5
+# How long a write waits for other shard processes before failing with "database is locked"
+WRITE_LOCK_WAIT = 30
+
+# How many write methods of the current task are inside the transaction of the outermost one
+_write_depth: contextvars.ContextVar[int] = contextvars.ContextVar('write_depth', default=0)
+
+
+def _writes(method):
+    """Run a Database coroutine method as one write transaction, see Database._transaction"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        async with self._transaction():
+            return await method(self, *args, **kwargs)
+    return wrapper
 
 class Database:
+    # Schema changes applied in order on top of create_tables, tracked in PRAGMA user_version
+    MIGRATIONS = [
+        # 1: look up pass owners from the codes on a pass image
+        [
+            'CREATE INDEX IF NOT EXISTS idx_pass_identifiers_colorless ON pass_identifiers (colorless_part)',
+            'CREATE INDEX IF NOT EXISTS idx_user_passes_colored ON user_passes (colored_part)'
+        ],
+        # 2: keep revoked, replaced and expired pass codes for the revocation filter
+        [
+            '''CREATE TABLE IF NOT EXISTS revoked_passes (
+                colored_part TEXT PRIMARY KEY,
+                user_id INTEGER,
+                reason TEXT,
+                revoked_at TEXT,
+                expiry_date TEXT
+            )'''
+        ],
+        # 3: perceptual hashes of issued pass images, to spot edited copies
+        [
+            '''CREATE TABLE IF NOT EXISTS pass_image_hashes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                colored_part TEXT,
+                card_hash TEXT,
+                created_at TEXT,
+                UNIQUE(card_hash, colored_part)
+            )''',
+            'CREATE INDEX IF NOT EXISTS idx_pass_image_hashes_user ON pass_image_hashes (user_id)'
+        ],
+        # 4: icons live in a content-addressed blob store, referenced per size variant
+        [
+            '''CREATE TABLE IF NOT EXISTS image_blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER,
+                refcount INTEGER DEFAULT 0,
+                created_at TEXT
+            )''',
+            '''CREATE TABLE IF NOT EXISTS entity_image_variants (
+                entity_type TEXT,
+                entity_id INTEGER,
+                variant TEXT,
+                digest TEXT,
+                PRIMARY KEY (entity_type, entity_id, variant)
+            )''',
+            'CREATE INDEX IF NOT EXISTS idx_image_blobs_refcount ON image_blobs (refcount)'
+        ],
+        # 5: pass codes as 36 byte BLOBs instead of 72 character hex strings
+        [_pass_codes_to_blobs],
+        # 6: bot channels per guild, so commands work before startup has checked every guild
+        [
+            '''CREATE TABLE IF NOT EXISTS guild_config (
+                guild_id INTEGER PRIMARY KEY,
+                command_channel_id INTEGER,
+                faction_announcement_channel_id INTEGER,
+                nation_announcement_channel_id INTEGER,
+                updated_at TEXT
+            )'''
+        ],
+        # 7: change markers, so shard processes reload only what another one changed
+        [_add_change_markers]
+    ]
+
     def __init__(self):
-        self.conn = sqlite3.connect('megatropo.db')
+        # Shard processes share the file: WAL lets them read while one writes. Startup may
+        # block on another process's write, afterwards writes take the lock in _transaction
+        self.conn = sqlite3.connect('megatropo.db', timeout=WRITE_LOCK_WAIT)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.listeners: Dict[str, List[Callable]] = {}  # event name -> callbacks
+        self.blobs = BlobStore()
+        self._blob_lock = asyncio.Lock()  # Keeps garbage collection from racing an upload of the same blob
+        self._write_lock = asyncio.Lock()  # One write transaction of this process at a time
         self.create_tables()
+        self.migrate()
+        self.pass_codec = PassCodec(self._load_pass_key())
+        self.conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+
+    def add_listener(self, event: str, callback: Callable):
+        """Register a callback for a data change event (e.g. 'pass_changed', 'icon_changed', 'entity_named')"""
+        self.listeners.setdefault(event, []).append(callback)
+
+    def notify(self, event: str, *args):
+        for callback in self.listeners.get(event, []):
+            callback(*args)
+
+    @contextlib.asynccontextmanager
+    async def _transaction(self):
+        """Hold the write lock of the shared database file for the body.
+
+        The lock is taken with BEGIN IMMEDIATE, so a transaction that reads before it
+        writes can't fail halfway on another process's commit. While another shard
+        process writes, SQLite gives up after BUSY_TIMEOUT_MS and the attempt is retried
+        after an asyncio.sleep, so the event loop keeps serving the gateway meanwhile.
+        Writes nested in the body join its transaction and _commit only commits the
+        outermost one; a transaction the body leaves open is rolled back.
+        """
+        depth = _write_depth.get()
+        if depth:
+            token = _write_depth.set(depth + 1)
+            try:
+                yield
+            finally:
+                _write_depth.reset(token)
+            return
+
+        async with self._write_lock:
+            await self._begin_immediate()
+            token = _write_depth.set(1)
+            try:
+                yield
+            finally:
+                _write_depth.reset(token)
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+
+    async def _begin_immediate(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WRITE_LOCK_WAIT
+        delay = 0.005
+        while True:
+            try:
+                self.conn.execute('BEGIN IMMEDIATE')
+                return
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) or loop.time() > deadline:
+                    raise
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def _commit(self):
+        """Commit the current write transaction, unless a write further out owns it"""
+        if _write_depth.get() <= 1:
+            self.conn.commit()
 
     def create_tables(self):
         cursor = self.conn.cursor()
@@ -61,7 +260,7 @@ class Database:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 faction_id INTEGER,
                 nation_id INTEGER,
-                colorless_part TEXT,
+                colorless_part BLOB,
                 UNIQUE(faction_id, nation_id)
             )
         ''')
@@ -72,7 +271,7 @@ class Database:
                 nation_id INTEGER,
                 issue_date TEXT,
                 expiry_date TEXT,
-                colored_part TEXT,
+                colored_part BLOB,
                 faction_rank TEXT,
                 nation_rank TEXT
             )
@@ -85,23 +284,116 @@ class Database:
                 PRIMARY KEY (entity_type, entity_id)
             )
         ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bot_settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        self.conn.commit()
+
+    def migrate(self):
+        """Apply the migrations this database hasn't seen yet"""
+        cursor = self.conn.cursor()
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        for number, statements in enumerate(self.MIGRATIONS[version:], version + 1):
+            for statement in statements:
+                if callable(statement):
+                    statement(cursor)  # Data migrations that need Python
+                else:
+                    cursor.execute(statement)
+            cursor.execute(f'PRAGMA user_version = {number}')
+            self.conn.commit()
+            print(f"Applied database migration {number}")
+
+    def _load_pass_key(self) -> bytes:
+        """Pass signing key from MEGATROPO_PASS_KEY, or one generated once and kept in the database"""
+        key = PassCodec.key_from_env()
+        if key:
+            return key
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT value FROM bot_settings WHERE key = 'pass_key'")
+        row = cursor.fetchone()
+        if row:
+            return bytes.fromhex(row[0])
+        key = PassCodec.generate_key()
+        cursor.execute("INSERT INTO bot_settings (key, value) VALUES ('pass_key', ?)", (key.hex(),))
         self.conn.commit()
+        return key
+
+    async def data_version(self) -> int:
+        """Changes whenever another connection, e.g. another shard process, commits a write"""
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    async def get_change_markers(self) -> Dict[str, int]:
+        """Topic -> counter that goes up with every committed write to the topic's tables"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT topic, version FROM change_markers')
+        return dict(cursor.fetchall())
+
+    async def get_setting(self, key: str) -> Optional[str]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT value FROM bot_settings WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    @_writes
+    async def set_setting(self, key: str, value: str):
+        cursor = self.conn.cursor()
+        cursor.execute('INSERT OR REPLACE INTO bot_settings (key, value) VALUES (?, ?)', (key, value))
+        self._commit()
+
+    async def get_guild_configs(self) -> Dict[int, Tuple[Optional[int], Optional[int], Optional[int]]]:
+        """guild id -> (command, faction announcement, nation announcement) channel ids"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT guild_id, command_channel_id, faction_announcement_channel_id, nation_announcement_channel_id
+            FROM guild_config
+        ''')
+        return {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+
+    @_writes
+    async def set_guild_config(self, guild_id: int, command_channel_id: Optional[int],
+                               faction_announcement_channel_id: Optional[int],
+                               nation_announcement_channel_id: Optional[int]):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            '''INSERT OR REPLACE INTO guild_config (guild_id, command_channel_id, faction_announcement_channel_id,
+                                                     nation_announcement_channel_id, updated_at)
+               VALUES (?, ?, ?, ?, ?)''',
+            (guild_id, command_channel_id, faction_announcement_channel_id, nation_announcement_channel_id,
+             datetime.now().isoformat())
+        )
+        self._commit()
 
     async def get_user(self, user_id: int) -> User:
         cursor = self.conn.cursor()
         cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
         row = cursor.fetchone()
         if not row:
-            cursor.execute('INSERT INTO users (id) VALUES (?)', (user_id,))
-            self.conn.commit()
+            async with self._transaction():
+                # OR IGNORE: another shard process may have added the user since the read
+                cursor.execute('INSERT OR IGNORE INTO users (id) VALUES (?)', (user_id,))
+                self._commit()
             return User(id=user_id)
         return User(id=row[0], balance=row[1], faction_id=row[2], nation_id=row[3])
 
+    @_writes
+    async def ensure_users(self, user_ids: List[int]) -> int:
+        """Create any of these users that don't exist yet in one transaction, returning how many were new"""
+        cursor = self.conn.cursor()
+        before = self.conn.total_changes
+        cursor.executemany('INSERT OR IGNORE INTO users (id) VALUES (?)', [(user_id,) for user_id in user_ids])
+        self._commit()
+        return self.conn.total_changes - before
+
+    @_writes
     async def modify_balance(self, user_id: int, amount: float):
         cursor = self.conn.cursor()
         cursor.execute('UPDATE users SET balance = balance + ? WHERE id = ?', (amount, user_id))
-        self.conn.commit()
+        self._commit()
 
+    @_writes
     async def create_rank(self, faction_id: int, name: str, priority: int, permissions: List[str]) -> Optional[int]:
         cursor = self.conn.cursor()
         try:
@@ -109,11 +401,12 @@ class Database:
                 'INSERT INTO ranks (faction_id, name, priority, permissions) VALUES (?, ?, ?, ?)',
                 (faction_id, name, priority, json.dumps(permissions))
             )
-            self.conn.commit()
+            self._commit()
             return cursor.lastrowid
         except sqlite3.Error:
             return None
 
+    @_writes
     async def add_pending_invite(self, user_id: int, faction_id: int) -> bool:
         cursor = self.conn.cursor()
         try:
@@ -121,7 +414,7 @@ class Database:
                 'INSERT INTO pending_invites (user_id, faction_id) VALUES (?, ?)',
                 (user_id, faction_id)
             )
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.Error:
             return False
@@ -172,6 +465,34 @@ class Database:
             return await self.get_faction(row[0])
         return None
 
+    async def get_entity_names(self, entity_type: str) -> List[Tuple[int, str]]:
+        """(id, name) of every faction or nation"""
+        table = {'faction': 'factions', 'nation': 'nations'}[entity_type]
+        cursor = self.conn.cursor()
+        cursor.execute(f'SELECT id, name FROM {table}')
+        return cursor.fetchall()
+
+    async def list_entities(self, entity_type: str, after: Optional[str] = None, search: Optional[str] = None,
+                            limit: int = 25) -> List[Tuple[int, str, int]]:
+        """(id, name, owner_id) of factions or nations ordered by name, the page after the name `after`.
+
+        Keyset pagination walks the unique name index, so every page costs the
+        same no matter how deep it is. search narrows to names containing it.
+        """
+        table = {'faction': 'factions', 'nation': 'nations'}[entity_type]
+        conditions, params = [], []
+        if after is not None:
+            conditions.append('name > ?')
+            params.append(after)
+        if search:
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        cursor = self.conn.cursor()
+        cursor.execute(f'SELECT id, name, owner_id FROM {table} {where} ORDER BY name LIMIT ?', (*params, limit))
+        return cursor.fetchall()
+
     async def get_nation(self, nation_id: int) -> Optional[Nation]:
         cursor = self.conn.cursor()
         cursor.execute('''
@@ -201,11 +522,23 @@ class Database:
             return await self.get_nation(row[0])
         return None
 
+    async def get_nation_factions(self, nation_id: int) -> List[Tuple[int, str]]:
+        """(id, name) of the factions in a nation"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT id, name FROM factions WHERE nation_id = ? ORDER BY name', (nation_id,))
+        return cursor.fetchall()
+
     async def get_faction_members(self, faction_id: int) -> List[int]:
         cursor = self.conn.cursor()
         cursor.execute('SELECT id FROM users WHERE faction_id = ?', (faction_id,))
         return [row[0] for row in cursor.fetchall()]
 
+    async def get_nation_members(self, nation_id: int) -> List[int]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT id FROM users WHERE nation_id = ?', (nation_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    @_writes
     async def add_alliance(self, nation1_id: int, nation2_id: int) -> bool:
         cursor = self.conn.cursor()
         try:
@@ -229,11 +562,12 @@ class Database:
                     (json.dumps(allies2), nation2_id)
                 )
 
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def remove_alliance(self, nation1_id: int, nation2_id: int) -> bool:
         cursor = self.conn.cursor()
         try:
@@ -257,11 +591,12 @@ class Database:
                     (json.dumps(allies2), nation2_id)
                 )
 
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def transfer_money(self, from_type: str, from_id: int, to_type: str, to_id: int, amount: float) -> bool:
         cursor = self.conn.cursor()
         try:
@@ -286,29 +621,138 @@ class Database:
             else:  # nation
                 cursor.execute('UPDATE nations SET balance = balance + ? WHERE id = ?', (amount, to_id))
 
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.Error:
             return False
 
     async def store_entity_image(self, entity_type: str, entity_id: int, image_data: bytes) -> bool:
-        path = f"images/{entity_type}_{entity_id}.png"
-        os.makedirs("images", exist_ok=True)
-        
+        """Ingest an uploaded icon and store it with all its size variants.
+
+        Raises IconError if the upload isn't a usable image.
+        """
+        loop = asyncio.get_running_loop()
+        # Decoding and resizing can take a while for big uploads, keep it off the event loop
+        variants = await loop.run_in_executor(None, ingest_icon, image_data)
+
         try:
-            with open(path, "wb") as f:
-                f.write(image_data)
-            
-            cursor = self.conn.cursor()
+            async with self._blob_lock:
+                digests = {name: await self.blobs.put(data) for name, data in variants.items()}
+                async with self._transaction():
+                    self._set_entity_variants(entity_type, entity_id, digests, {
+                        digests[name]: len(data) for name, data in variants.items()
+                    })
+            self.notify('icon_changed', entity_type, entity_id)
+            return True
+        except Exception as e:
+            print(f"Failed to store {entity_type} {entity_id} icon: {e}")
+            return False
+
+    def _set_entity_variants(self, entity_type: str, entity_id: int, digests: Dict[str, str], sizes: Dict[str, int]):
+        """Point an entity's variants at these blobs and recount the blobs involved, in one transaction"""
+        cursor = self.conn.cursor()
+        now = datetime.now().isoformat()
+        try:
+            old = [row[0] for row in cursor.execute(
+                'SELECT digest FROM entity_image_variants WHERE entity_type = ? AND entity_id = ?',
+                (entity_type, entity_id)
+            )]
+            cursor.executemany(
+                'INSERT OR IGNORE INTO image_blobs (digest, size, refcount, created_at) VALUES (?, ?, 0, ?)',
+                [(digest, size, now) for digest, size in sizes.items()]
+            )
+            cursor.execute(
+                'DELETE FROM entity_image_variants WHERE entity_type = ? AND entity_id = ?',
+                (entity_type, entity_id)
+            )
+            cursor.executemany(
+                'INSERT INTO entity_image_variants (entity_type, entity_id, variant, digest) VALUES (?, ?, ?, ?)',
+                [(entity_type, entity_id, name, digest) for name, digest in digests.items()]
+            )
+            touched = set(old) | set(digests.values())
+            cursor.executemany(
+                '''UPDATE image_blobs SET refcount =
+                   (SELECT COUNT(*) FROM entity_image_variants WHERE digest = image_blobs.digest)
+                   WHERE digest = ?''',
+                [(digest,) for digest in touched]
+            )
             cursor.execute(
                 'INSERT OR REPLACE INTO entity_images (entity_type, entity_id, image_path) VALUES (?, ?, ?)',
-                (entity_type, entity_id, path)
+                (entity_type, entity_id, self.blobs.path_for(digests['master']))
             )
-            self.conn.commit()
-            return True
-        except Exception:
-            return False
+            self._commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    async def get_entity_icon(self, entity_type: str, entity_id: int, variant: str) -> Optional[str]:
+        """Blob digest of an entity's icon variant, or None if it has no icon"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'SELECT digest FROM entity_image_variants WHERE entity_type = ? AND entity_id = ? AND variant = ?',
+            (entity_type, entity_id, variant)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
 
+    async def get_pass_icons(self, user_pass: UserPass) -> Tuple[Optional[str], Optional[str]]:
+        """Blob digests of the (faction, nation) icons drawn on a pass, None where there is no icon"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            '''SELECT entity_type, digest FROM entity_image_variants
+               WHERE variant = 'pass' AND ((entity_type = 'faction' AND entity_id = ?)
+                                       OR (entity_type = 'nation' AND entity_id = ?))''',
+            (user_pass.faction_id or 0, user_pass.nation_id or 0)
+        )
+        digests = dict(cursor.fetchall())
+        return digests.get('faction'), digests.get('nation')
+
+    async def get_pass_icon_digests(self) -> Dict[Tuple[str, int], str]:
+        """(entity_type, entity_id) -> digest of the icon variant drawn on passes"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT entity_type, entity_id, digest FROM entity_image_variants WHERE variant = 'pass'")
+        return {(entity_type, entity_id): digest for entity_type, entity_id, digest in cursor.fetchall()}
+
+    async def import_legacy_icons(self) -> int:
+        """Move icons stored as loose files before the blob store existed into it"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            '''SELECT entity_type, entity_id, image_path FROM entity_images e
+               WHERE NOT EXISTS (SELECT 1 FROM entity_image_variants v
+                                 WHERE v.entity_type = e.entity_type AND v.entity_id = e.entity_id)'''
+        )
+        imported = 0
+        for entity_type, entity_id, image_path in cursor.fetchall():
+            try:
+                with open(image_path, "rb") as f:
+                    image_data = f.read()
+                if await self.store_entity_image(entity_type, entity_id, image_data):
+                    imported += 1
+            except Exception as e:
+                print(f"Could not import {entity_type} {entity_id} icon from {image_path}: {e}")
+        if imported:
+            print(f"Imported {imported} legacy icons into the blob store")
+        return imported
+
+    async def collect_image_blobs(self) -> int:
+        """Delete blobs no icon variant refers to any more, returning how many files were removed"""
+        async with self._blob_lock:
+            cursor = self.conn.cursor()
+            unreferenced = [row[0] for row in cursor.execute('SELECT digest FROM image_blobs WHERE refcount <= 0')]
+            known = {row[0] for row in cursor.execute('SELECT digest FROM image_blobs WHERE refcount > 0')}
+            loop = asyncio.get_running_loop()
+            strays = await loop.run_in_executor(None, self.blobs.stray_digests, known)
+            garbage = list(set(unreferenced + strays))
+            if not garbage:
+                return 0
+            removed = await loop.run_in_executor(None, self.blobs.delete, garbage)
+            async with self._transaction():
+                cursor.executemany('DELETE FROM image_blobs WHERE digest = ? AND refcount <= 0', [(d,) for d in unreferenced])
+                self._commit()
+        print(f"Removed {removed} unreferenced image blobs")
+        return removed
+
+    @_writes
     async def generate_pass_identifier(self, faction_id: Optional[int], nation_id: Optional[int]) -> PassIdentifier:
         cursor = self.conn.cursor()
         cursor.execute(
@@ -318,24 +762,21 @@ class Database:
         row = cursor.fetchone()
         
         if not row:
-            # Generate new colorless part (simplified for example)
-            import random
-            colorless = format(random.getrandbits(24), '06x')
-            
+            colorless = self._new_colorless_part()
             cursor.execute(
                 'INSERT INTO pass_identifiers (faction_id, nation_id, colorless_part) VALUES (?, ?, ?)',
                 (faction_id, nation_id, colorless)
             )
-            self.conn.commit()
+            self._commit()
         else:
-            colorless = row[0]
+            colorless = PassCode(row[0])
 
         # Generate unique colored part for user
-        colored = format(random.getrandbits(24), '06x')
+        colored = PassCode(os.urandom(CODE_SIZE))
         
         return PassIdentifier(colorless, colored, faction_id, nation_id)
 
-    async def get_pass_identifier(self, faction_id: Optional[int], nation_id: Optional[int]) -> Optional[str]:
+    async def get_pass_identifier(self, faction_id: Optional[int], nation_id: Optional[int]) -> Optional[PassCode]:
         """Get existing colorless part for faction/nation combination"""
         cursor = self.conn.cursor()
         cursor.execute(
@@ -343,30 +784,48 @@ class Database:
             (faction_id, nation_id)
         )
         row = cursor.fetchone()
-        return row[0] if row else None
+        return PassCode(row[0]) if row else None
+
+    def _new_colorless_part(self) -> PassCode:
+        # 24 random nibbles, the rest of the strip stays black
+        return PassCode(os.urandom(12) + bytes(CODE_SIZE - 12))
+
+    def _colorless_part_for(self, faction_id: Optional[int], nation_id: Optional[int]) -> PassCode:
+        """Get the colorless part for a faction/nation combination, creating and storing it if new"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'SELECT colorless_part FROM pass_identifiers WHERE faction_id IS ? AND nation_id IS ? ORDER BY id DESC LIMIT 1',
+            (faction_id, nation_id)
+        )
+        row = cursor.fetchone()
+        if row:
+            return PassCode(row[0])
 
+        colorless_part = PassCode.zero()
+        if faction_id or nation_id:
+            colorless_part = self._new_colorless_part()
+            cursor.execute(
+                'INSERT INTO pass_identifiers (faction_id, nation_id, colorless_part) VALUES (?, ?, ?)',
+                (faction_id, nation_id, colorless_part)
+            )
+        return colorless_part
+
+    def _colored_part_for(self, user_id: int, faction_id: Optional[int], nation_id: Optional[int],
+                          expiry_date: datetime) -> PassCode:
+        """Signed user-specific colored part"""
+        return self.pass_codec.encode(user_id, faction_id, nation_id, expiry_date)
+
+    @_writes
     async def create_user_pass(self, user_id: int, expiry_date: datetime) -> Optional[UserPass]:
         user = await self.get_user(user_id)
         if not user:
             return None
 
-        # Get or create identifier
-        colorless_part = await self.get_pass_identifier(user.faction_id, user.nation_id)
-        if not colorless_part:
-            # Generate new colorless part with fixed length
-            import random
-            colorless_part = '0' * 72  # Default to all zeros
-            if user.faction_id or user.nation_id:
-                random_part = ''.join(format(random.randint(0, 15), 'x') for _ in range(24))
-                colorless_part = random_part + '0' * 48  # Pad with zeros
-
-        # Generate colored part for user with fixed length
-        import hashlib
-        hash_input = f"user_{user_id}_{datetime.now().strftime('%Y%m')}"
-        hash_hex = hashlib.sha256(hash_input.encode()).hexdigest()
-        colored_part = hash_hex[:72].ljust(72, '0')  # Ensure exactly 72 chars
+        colorless_part = self._colorless_part_for(user.faction_id, user.nation_id)
+        colored_part = self._colored_part_for(user_id, user.faction_id, user.nation_id, expiry_date)
         
         cursor = self.conn.cursor()
+        revoked = self._revoke_current_passes(cursor, [user_id], 'replaced')
         cursor.execute('''
             INSERT OR REPLACE INTO user_passes 
             (user_id, faction_id, nation_id, issue_date, expiry_date, colored_part)
@@ -379,7 +838,9 @@ class Database:
             expiry_date.isoformat(),
             colored_part
         ))
-        self.conn.commit()
+        self._commit()
+        self._announce_revocations(revoked)
+        self.notify('pass_changed', user_id)
 
         return UserPass(
             user_id=user_id,
@@ -395,6 +856,68 @@ class Database:
             )
         )
 
+    @_writes
+    async def create_user_passes(self, user_ids: List[int], expiry_date: datetime) -> List[UserPass]:
+        """Issue passes to many users at once in a single transaction"""
+        if not user_ids:
+            return []
+
+        cursor = self.conn.cursor()
+        cursor.executemany('INSERT OR IGNORE INTO users (id) VALUES (?)', [(uid,) for uid in user_ids])
+
+        memberships = {}
+        for start in range(0, len(user_ids), 500):  # Stay below SQLite's bound parameter limit
+            chunk = user_ids[start:start + 500]
+            cursor.execute(
+                f'SELECT id, faction_id, nation_id FROM users WHERE id IN ({", ".join("?" * len(chunk))})',
+                tuple(chunk)
+            )
+            for user_id, faction_id, nation_id in cursor.fetchall():
+                memberships[user_id] = (faction_id, nation_id)
+
+        issue_date = datetime.now()
+        colorless_parts = {}
+        passes = []
+        for user_id in user_ids:
+            faction_id, nation_id = memberships[user_id]
+            if (faction_id, nation_id) not in colorless_parts:
+                colorless_parts[(faction_id, nation_id)] = self._colorless_part_for(faction_id, nation_id)
+            passes.append(UserPass(
+                user_id=user_id,
+                faction_id=faction_id,
+                nation_id=nation_id,
+                issue_date=issue_date,
+                expiry_date=expiry_date,
+                pass_identifier=PassIdentifier(
+                    colorless_part=colorless_parts[(faction_id, nation_id)],
+                    colored_part=self._colored_part_for(user_id, faction_id, nation_id, expiry_date),
+                    faction_id=faction_id,
+                    nation_id=nation_id
+                )
+            ))
+
+        revoked = self._revoke_current_passes(cursor, user_ids, 'replaced')
+        cursor.executemany('''
+            INSERT OR REPLACE INTO user_passes 
+            (user_id, faction_id, nation_id, issue_date, expiry_date, colored_part)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (
+                p.user_id,
+                p.faction_id,
+                p.nation_id,
+                issue_date.isoformat(),
+                expiry_date.isoformat(),
+                p.pass_identifier.colored_part
+            ) for p in passes
+        ])
+        self._commit()
+        self._announce_revocations(revoked)
+
+        for p in passes:
+            self.notify('pass_changed', p.user_id)
+        return passes
+
     async def get_user_faction(self, user_id: int) -> Optional[Faction]:
         """Get a user's faction by their user ID"""
         cursor = self.conn.cursor()
@@ -413,16 +936,157 @@ class Database:
             SELECT up.*, pi.colorless_part
             FROM user_passes up
             LEFT JOIN pass_identifiers pi ON (
-                pi.faction_id = up.faction_id AND 
-                pi.nation_id = up.nation_id
+                pi.faction_id IS up.faction_id AND 
+                pi.nation_id IS up.nation_id
             )
             WHERE up.user_id = ?
+            ORDER BY pi.id DESC
         ''', (user_id,))
         row = cursor.fetchone()
         
         if not row:
             return None
             
+        return self._user_pass_from_row(row)
+
+    async def get_user_passes(self, user_ids: List[int]) -> Dict[int, UserPass]:
+        """Get the current passes of several users in one query, keyed by user id"""
+        passes = {}
+        ids = list(dict.fromkeys(user_ids))
+        cursor = self.conn.cursor()
+        for i in range(0, len(ids), 500):  # Stay under SQLite's bound parameter limit
+            chunk = ids[i:i + 500]
+            cursor.execute(f'''
+                SELECT up.*, pi.colorless_part
+                FROM user_passes up
+                LEFT JOIN pass_identifiers pi ON (
+                    pi.faction_id IS up.faction_id AND 
+                    pi.nation_id IS up.nation_id
+                )
+                WHERE up.user_id IN ({','.join('?' * len(chunk))})
+                ORDER BY pi.id DESC
+            ''', chunk)
+            for row in cursor.fetchall():
+                # Rows come newest identifier first, keep that one like get_user_pass does
+                if row[0] not in passes:
+                    passes[row[0]] = self._user_pass_from_row(row)
+        return passes
+
+    async def find_pass_owner(self, colorless_part: PassCode, colored_parts: List[PassCode]) -> Optional[UserPass]:
+        """Find the current pass drawn with these codes.
+
+        colored_parts are alternative readings of the same strip, most likely first.
+        Both lookups go through an index, so this stays fast however many passes exist.
+        """
+        if not colored_parts:
+            return None
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT up.*, pi.colorless_part
+            FROM user_passes up
+            LEFT JOIN pass_identifiers pi ON (
+                pi.faction_id IS up.faction_id AND 
+                pi.nation_id IS up.nation_id
+            )
+            WHERE up.colored_part IN ({','.join('?' * len(colored_parts))})
+            ORDER BY pi.id DESC
+        ''', colored_parts)
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+
+        cursor.execute(
+            'SELECT faction_id, nation_id FROM pass_identifiers WHERE colorless_part = ?', (colorless_part,)
+        )
+        entities = set(cursor.fetchall())
+        # Prefer a pass whose faction/nation drew this colorless part, then the likeliest reading
+        rank = {colored: i for i, colored in enumerate(colored_parts)}
+        row = min(rows, key=lambda r: ((r[1], r[2]) not in entities, rank[PassCode(r[5])]))
+        return self._user_pass_from_row(row)
+
+    def _revoke_current_passes(self, cursor: sqlite3.Cursor, user_ids: List[int], reason: str) -> List[PassCode]:
+        """Record the current passes of these users as revoked, part of the caller's transaction"""
+        revoked = []
+        for start in range(0, len(user_ids), 500):  # Stay below SQLite's bound parameter limit
+            chunk = user_ids[start:start + 500]
+            cursor.execute(
+                f'SELECT colored_part, user_id, expiry_date FROM user_passes WHERE user_id IN ({", ".join("?" * len(chunk))})',
+                tuple(chunk)
+            )
+            revoked.extend(cursor.fetchall())
+        return self._record_revocations(cursor, revoked, reason)
+
+    def _record_revocations(self, cursor: sqlite3.Cursor, passes: List[tuple], reason: str) -> List[PassCode]:
+        """Insert (colored_part, user_id, expiry_date) rows into revoked_passes, returning the revoked codes.
+
+        The caller announces them with _announce_revocations once its transaction is committed.
+        """
+        revoked_at = datetime.now().isoformat()
+        cursor.executemany('''
+            INSERT OR IGNORE INTO revoked_passes (colored_part, user_id, reason, revoked_at, expiry_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(colored_part, user_id, reason, revoked_at, expiry) for colored_part, user_id, expiry in passes])
+        return [PassCode(colored_part) for colored_part, _, _ in passes]
+
+    def _announce_revocations(self, codes: List[PassCode]):
+        for code in codes:
+            self.notify('pass_revoked', code)
+
+    @_writes
+    async def expire_passes(self) -> int:
+        """Add passes that expired since the last run to revoked_passes, returning how many"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT up.colored_part, up.user_id, up.expiry_date
+            FROM user_passes up
+            WHERE datetime(up.expiry_date) < datetime(?)
+            AND NOT EXISTS (SELECT 1 FROM revoked_passes rp WHERE rp.colored_part = up.colored_part)
+        ''', (datetime.now().isoformat(),))
+        expired = cursor.fetchall()
+        if expired:
+            revoked = self._record_revocations(cursor, expired, 'expired')
+            self._commit()
+            self._announce_revocations(revoked)
+        return len(expired)
+
+    async def is_pass_revoked(self, colored_part: PassCode) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT 1 FROM revoked_passes WHERE colored_part = ?', (colored_part,))
+        return cursor.fetchone() is not None
+
+    async def get_revoked_codes(self) -> List[PassCode]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT colored_part FROM revoked_passes')
+        return [PassCode(row[0]) for row in cursor.fetchall()]
+
+    @_writes
+    async def add_pass_image_hash(self, user_id: int, colored_part: PassCode, card_hash: str) -> bool:
+        """Remember the perceptual hash of an issued pass image, returns False if it was known"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO pass_image_hashes (user_id, colored_part, card_hash, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, colored_part, card_hash, datetime.now().isoformat()))
+        self._commit()
+        return cursor.rowcount > 0
+
+    async def last_pass_image_hash_id(self) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM pass_image_hashes')
+        return cursor.fetchone()[0]
+
+    async def get_pass_image_hashes(self, after_id: int = 0, upto_id: Optional[int] = None) -> List[tuple]:
+        """(card_hash, user_id, colored_part) rows with after_id < id <= upto_id, oldest first"""
+        cursor = self.conn.cursor()
+        if upto_id is None:
+            upto_id = await self.last_pass_image_hash_id()
+        cursor.execute(
+            'SELECT card_hash, user_id, colored_part FROM pass_image_hashes WHERE id > ? AND id <= ? ORDER BY id',
+            (after_id, upto_id)
+        )
+        return [(card_hash, user_id, PassCode(colored)) for card_hash, user_id, colored in cursor.fetchall()]
+
+    def _user_pass_from_row(self, row) -> UserPass:
         return UserPass(
             user_id=row[0],
             faction_id=row[1],
@@ -430,8 +1094,8 @@ class Database:
             issue_date=datetime.fromisoformat(row[3]),
             expiry_date=datetime.fromisoformat(row[4]),
             pass_identifier=PassIdentifier(
-                colorless_part=row[8] or '000000',
-                colored_part=row[5],
+                colorless_part=PassCode(row[8]) if row[8] else PassCode.zero(),
+                colored_part=PassCode(row[5]),
                 faction_id=row[1],
                 nation_id=row[2]
             ),
@@ -439,16 +1103,21 @@ class Database:
             nation_rank=row[7]
         )
 
+    @_writes
     async def revoke_pass(self, user_id: int) -> bool:
         """Revoke a user's pass"""
         cursor = self.conn.cursor()
         try:
+            revoked = self._revoke_current_passes(cursor, [user_id], 'revoked')
             cursor.execute('DELETE FROM user_passes WHERE user_id = ?', (user_id,))
-            self.conn.commit()
+            self._commit()
+            self._announce_revocations(revoked)
+            self.notify('pass_changed', user_id)
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def update_pass_ranks(self, user_id: int, faction_rank: Optional[str] = None, nation_rank: Optional[str] = None) -> bool:
         """Update the rank information on a user's pass"""
         cursor = self.conn.cursor()
@@ -470,21 +1139,39 @@ class Database:
                 f'UPDATE user_passes SET {", ".join(updates)} WHERE user_id = ?',
                 tuple(params)
             )
-            self.conn.commit()
+            self._commit()
+            self.notify('pass_changed', user_id)
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def extend_pass_validity(self, user_id: int, days: int) -> bool:
         """Extend the validity of a user's pass"""
         cursor = self.conn.cursor()
         try:
+            cursor.execute(
+                'SELECT faction_id, nation_id, expiry_date FROM user_passes WHERE user_id = ?', (user_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return True
+            faction_id, nation_id, expiry_date = row
+            expiry_date = datetime.fromisoformat(expiry_date) + timedelta(days=days)
+            # The expiry is part of the signature, so the pass has to be signed again
+            revoked = self._revoke_current_passes(cursor, [user_id], 'replaced')
             cursor.execute('''
                 UPDATE user_passes 
-                SET expiry_date = datetime(expiry_date, ?) 
+                SET expiry_date = ?, colored_part = ?
                 WHERE user_id = ?
-            ''', (f'+{days} days', user_id))
-            self.conn.commit()
+            ''', (
+                expiry_date.isoformat(),
+                self._colored_part_for(user_id, faction_id, nation_id, expiry_date),
+                user_id
+            ))
+            self._commit()
+            self._announce_revocations(revoked)
+            self.notify('pass_changed', user_id)
             return True
         except sqlite3.Error:
             return False
@@ -498,6 +1185,7 @@ class Database:
         ''')
         return [row[0] for row in cursor.fetchall()]
 
+    @_writes
     async def regenerate_faction_pass_identifier(self, faction_id: int) -> bool:
         """Generate a new pass identifier for a faction (costs 50)"""
         faction = await self.get_faction(faction_id)
@@ -506,9 +1194,8 @@ class Database:
             
         cursor = self.conn.cursor()
         try:
-            import random
-            new_colorless = format(random.getrandbits(24), '06x')
-            
+            new_colorless = self._new_colorless_part()
+
             cursor.execute('''
                 INSERT OR REPLACE INTO pass_identifiers 
                 (faction_id, nation_id, colorless_part) 
@@ -520,11 +1207,12 @@ class Database:
                 (faction_id,)
             )
             
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def regenerate_nation_pass_identifier(self, nation_id: int) -> bool:
         """Generate a new pass identifier for a nation (costs 200)"""
         nation = await self.get_nation(nation_id)
@@ -533,9 +1221,8 @@ class Database:
             
         cursor = self.conn.cursor()
         try:
-            import random
-            new_colorless = format(random.getrandbits(24), '06x')
-            
+            new_colorless = self._new_colorless_part()
+
             cursor.execute('''
                 INSERT OR REPLACE INTO pass_identifiers 
                 (faction_id, nation_id, colorless_part) 
@@ -547,16 +1234,16 @@ class Database:
                 (nation_id,)
             )
             
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def create_faction(self, name: str, owner_id: int) -> Optional[int]:
         cursor = self.conn.cursor()
         try:
-            # Start a transaction
-            cursor.execute('BEGIN TRANSACTION')
+            # _writes started the transaction with BEGIN IMMEDIATE, the default ranks join it
 
             # Create the faction
             cursor.execute(
@@ -581,18 +1268,19 @@ class Database:
                 )
 
             # Commit the transaction
-            cursor.execute('COMMIT')
+            self._commit()
+            self.notify('entity_named', 'faction', faction_id, name)
             return faction_id
 
         except sqlite3.Error:
-            cursor.execute('ROLLBACK')
+            self.conn.rollback()
             return None
 
+    @_writes
     async def create_nation(self, name: str, owner_id: int) -> Optional[int]:
         cursor = self.conn.cursor()
         try:
-            cursor.execute('BEGIN TRANSACTION')
-
+            # _writes started the transaction with BEGIN IMMEDIATE, the default ranks join it
             cursor.execute(
                 'INSERT INTO nations (name, owner_id) VALUES (?, ?)',
                 (name, owner_id)
@@ -613,12 +1301,14 @@ class Database:
                     (nation_id, owner_rank[0], owner_id)
                 )
 
-            cursor.execute('COMMIT')
+            self._commit()
+            self.notify('entity_named', 'nation', nation_id, name)
             return nation_id
         except sqlite3.Error:
-            cursor.execute('ROLLBACK')
+            self.conn.rollback()
             return None
 
+    @_writes
     async def convert_faction_to_nation(self, faction_id: int, name: str) -> bool:
         cursor = self.conn.cursor()
         try:
@@ -642,11 +1332,13 @@ class Database:
                 'UPDATE users SET nation_id = ? WHERE faction_id = ?',
                 (nation_id, faction_id)
             )
-            self.conn.commit()
+            self._commit()
+            self.notify('entity_named', 'nation', nation_id, name)
             return True
         except sqlite3.IntegrityError:
             return False
 
+    @_writes
     async def remove_rank(self, entity_id: int, rank_name: str) -> bool:
         cursor = self.conn.cursor()
         try:
@@ -654,11 +1346,12 @@ class Database:
                 'DELETE FROM ranks WHERE faction_id = ? AND name = ?',
                 (entity_id, rank_name)
             )
-            self.conn.commit()
+            self._commit()
             return cursor.rowcount > 0
         except sqlite3.Error:
             return False
 
+    @_writes
     async def edit_rank(self, entity_id: int, rank_name: str, new_name: Optional[str], new_priority: Optional[int], permissions: List[str]) -> bool:
         cursor = self.conn.cursor()
         try:
@@ -683,32 +1376,37 @@ class Database:
                 f'UPDATE ranks SET {", ".join(updates)} WHERE faction_id = ? AND name = ?',
                 tuple(params)
             )
-            self.conn.commit()
+            self._commit()
             return cursor.rowcount > 0
         except sqlite3.Error:
             return False
 
+    @_writes
     async def disband_faction(self, faction_id: int) -> bool:
         cursor = self.conn.cursor()
         try:
             cursor.execute('DELETE FROM factions WHERE id = ?', (faction_id,))
             cursor.execute('UPDATE users SET faction_id = NULL WHERE faction_id = ?', (faction_id,))
-            self.conn.commit()
+            self._commit()
+            self.notify('entity_removed', 'faction', faction_id)
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def disband_nation(self, nation_id: int) -> bool:
         cursor = self.conn.cursor()
         try:
             cursor.execute('DELETE FROM nations WHERE id = ?', (nation_id,))
             cursor.execute('UPDATE users SET nation_id = NULL WHERE nation_id = ?', (nation_id,))
             cursor.execute('UPDATE factions SET nation_id = NULL WHERE nation_id = ?', (nation_id,))
-            self.conn.commit()
+            self._commit()
+            self.notify('entity_removed', 'nation', nation_id)
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def create_default_ranks_for_faction(self, faction_id: int):
         cursor = self.conn.cursor()
         default_ranks = [
@@ -722,8 +1420,9 @@ class Database:
                 'INSERT INTO ranks (faction_id, name, priority, permissions) VALUES (?, ?, ?, ?)',
                 (faction_id, name, priority, json.dumps(permissions))
             )
-        self.conn.commit()
+        self._commit()
 
+    @_writes
     async def create_default_ranks_for_nation(self, nation_id: int):
         cursor = self.conn.cursor()
         default_ranks = [
@@ -737,8 +1436,9 @@ class Database:
                 'INSERT INTO ranks (faction_id, name, priority, permissions) VALUES (?, ?, ?, ?)',
                 (nation_id, name, priority, json.dumps(permissions))
             )
-        self.conn.commit()
+        self._commit()
 
+    @_writes
     async def accept_faction_invite(self, user_id: int, faction_id: int) -> bool:
         cursor = self.conn.cursor()
         try:
@@ -747,11 +1447,12 @@ class Database:
                 return False  # No pending invite found
 
             cursor.execute('UPDATE users SET faction_id = ? WHERE id = ?', (faction_id, user_id))
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def accept_nation_invite(self, user_id: int, nation_id: int) -> bool:
         cursor = self.conn.cursor()
         try:
@@ -760,35 +1461,40 @@ class Database:
                 return False  # No pending invite found
 
             cursor.execute('UPDATE users SET nation_id = ? WHERE id = ?', (nation_id, user_id))
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.Error:
             return False
 
+    @_writes
     async def modify_faction_balance(self, faction_id: int, amount: float):
         cursor = self.conn.cursor()
         cursor.execute('UPDATE factions SET balance = balance + ? WHERE id = ?', (amount, faction_id))
-        self.conn.commit()
+        self._commit()
 
+    @_writes
     async def modify_nation_balance(self, nation_id: int, amount: float):
         cursor = self.conn.cursor()
         cursor.execute('UPDATE nations SET balance = balance + ? WHERE id = ?', (amount, nation_id))
-        self.conn.commit()
+        self._commit()
 
+    @_writes
     async def add_member_to_faction(self, user_id: int, faction_id: int):
         cursor = self.conn.cursor()
         cursor.execute('UPDATE users SET faction_id = ? WHERE id = ?', (faction_id, user_id))
-        self.conn.commit()
+        self._commit()
 
+    @_writes
     async def add_member_to_nation(self, user_id: int, nation_id: int):
         cursor = self.conn.cursor()
         cursor.execute('UPDATE users SET nation_id = ? WHERE id = ?', (nation_id, user_id))
-        self.conn.commit()
+        self._commit()
 
+    @_writes
     async def assign_rank_to_user(self, user_id: int, entity_id: int, rank_name: str):
         cursor = self.conn.cursor()
         cursor.execute('SELECT id FROM ranks WHERE faction_id = ? AND name = ?', (entity_id, rank_name))
         rank = cursor.fetchone()
         if rank:
             cursor.execute('UPDATE users SET rank_id = ? WHERE id = ?', (rank[0], user_id))
-            self.conn.commit()
+            self._commit()
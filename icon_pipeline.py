@@ -0,0 +1,103 @@
+import colorsys
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, Tuple
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+MAX_UPLOAD_BYTES = 8 * 1024 * 1024
+MAX_PIXELS = 4096 * 4096  # Refuse anything bigger before decoding it
+ALLOWED_FORMATS = {'PNG', 'JPEG', 'WEBP', 'GIF'}
+MASTER_SIZE = 512  # Largest copy kept of an uploaded icon
+
+# Variant name -> square edge in pixels
+VARIANTS = {
+    'pass': 50,    # Drawn on pass cards
+    'icon': 100,   # Same size as generated default icons
+    'thumb': 128,  # Embed thumbnails
+}
+
+
+REGULAR_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+BOLD_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+
+class IconError(ValueError):
+    """An uploaded icon was rejected, the message is safe to show to the user"""
+
+
+def _encode(image: Image.Image) -> bytes:
+    with BytesIO() as bio:
+        image.save(bio, 'PNG', optimize=True)
+        return bio.getvalue()
+
+
+def ingest_icon(image_data: bytes) -> Dict[str, bytes]:
+    """Validate an uploaded icon and render every variant we use, as PNG bytes.
+
+    The upload is decoded once, its EXIF orientation applied and all metadata
+    dropped. Returns {'master': ..., 'pass': ..., 'icon': ..., 'thumb': ...}.
+    Blocking, run it in an executor.
+    """
+    if len(image_data) > MAX_UPLOAD_BYTES:
+        raise IconError(f"Icon is too large, the limit is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+
+    try:
+        image = Image.open(BytesIO(image_data))
+        if image.format not in ALLOWED_FORMATS:
+            raise IconError("Icon must be a PNG, JPEG, WebP or GIF image.")
+        if image.width * image.height > MAX_PIXELS:
+            raise IconError("Icon dimensions are too large.")
+        image.seek(0)  # Animated images use their first frame
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA')
+    except IconError:
+        raise
+    except Exception:
+        raise IconError("Could not read the uploaded image.")
+
+    # Crop to a centred square so icons are never stretched
+    edge = min(image.width, image.height, MASTER_SIZE)
+    master = ImageOps.fit(image, (edge, edge), Image.LANCZOS)
+    master.info = {}  # No EXIF, ICC profiles or text chunks in stored files
+
+    variants = {'master': _encode(master)}
+    for name, size in VARIANTS.items():
+        variant = master.resize((size, size), Image.LANCZOS)
+        if name == 'pass':
+            # Pass cards are white and RGB, flatten here instead of on every render
+            flat = Image.new('RGB', variant.size, 'white')
+            flat.paste(variant, mask=variant.getchannel('A'))
+            variant = flat
+        variants[name] = _encode(variant)
+    return variants
+
+
+@lru_cache(maxsize=None)
+def load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """Fonts are parsed from disk once per process and size"""
+    return ImageFont.truetype(path, size)
+
+
+def default_icon_color(seed: str) -> Tuple[int, int, int]:
+    """A stable colour for a seed, saturated and dark enough for a white letter on top"""
+    digest = hashlib.sha256(seed.encode()).digest()
+    hue = int.from_bytes(digest[:2], 'big') / 65536
+    saturation = 0.55 + digest[2] / 255 * 0.35
+    value = 0.55 + digest[3] / 255 * 0.3
+    return tuple(round(c * 255) for c in colorsys.hsv_to_rgb(hue, saturation, value))
+
+
+@lru_cache(maxsize=256)
+def default_icon(seed: str, letter: str, size: int, font_size: int) -> Image.Image:
+    """A letter on a coloured disc, the same for the same seed every time.
+
+    The result is memoized and shared between callers, so it must not be drawn on.
+    """
+    image = Image.new('RGB', (size, size), color=(255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse([(0, 0), (size, size)], fill=default_icon_color(seed))
+    draw.text((size / 2, size / 2), letter, fill=(255, 255, 255),
+              font=load_font(BOLD_FONT, font_size), anchor='mm')
+    return image
@@ -0,0 +1,90 @@
+from typing import Any, Iterable, List, Optional, Tuple
+
+from pass_codes import PassCode
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes under Hamming distance.
+
+    Every child hangs off its parent at its exact distance from it, so by the
+    triangle inequality a search only descends into children whose edge is
+    within the current best distance of the query's distance to the parent.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, payloads, {distance: child}]
+        self.size = 0
+
+    def add(self, value: int, payload: Any):
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [payload], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(payload)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [payload], {}]
+                return
+            node = child
+
+    def nearest(self, value: int, max_distance: Optional[int] = None) -> Optional[Tuple[int, int, List[Any]]]:
+        """Closest stored hash as (distance, hash, payloads), or None if nothing is within max_distance"""
+        if self._root is None:
+            return None
+        best = None
+        limit = max_distance if max_distance is not None else float('inf')
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= limit and (best is None or distance < best[0]):
+                best = (distance, node[0], node[1])
+                limit = distance
+                if distance == 0:
+                    break
+            for edge, child in node[2].items():
+                if distance - limit <= edge <= distance + limit:
+                    stack.append(child)
+        return best
+
+
+class PassImageIndex:
+    """Perceptual hashes of issued pass images, searchable for the closest match"""
+
+    def __init__(self):
+        self._tree = BKTree()
+        self._seen = set()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def load(self, entries: Iterable[Tuple[str, int, PassCode]]):
+        """Add (hex hash, user_id, colored_part) rows, e.g. from the database at startup"""
+        for card_hash, user_id, colored_part in entries:
+            self.add(card_hash, user_id, colored_part)
+
+    def add(self, card_hash: str, user_id: int, colored_part: PassCode) -> bool:
+        key = (card_hash, colored_part)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        self._tree.add(int(card_hash, 16), (user_id, colored_part))
+        return True
+
+    def closest(self, card_hash: str, max_distance: Optional[int] = None) -> Optional[Tuple[int, int, PassCode]]:
+        """Closest issued pass as (distance, user_id, colored_part), or None if the index is empty"""
+        match = self._tree.nearest(int(card_hash, 16), max_distance)
+        if match is None:
+            return None
+        distance, _, payloads = match
+        user_id, colored_part = payloads[-1]  # Most recently issued first
+        return distance, user_id, colored_part
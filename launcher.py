@@ -0,0 +1,103 @@
+"""Run the bot as several processes, each owning a contiguous range of shards.
+
+    python launcher.py [--processes 4] [--shards 16]
+
+Every process is a regular bot.py run with MEGATROPO_SHARD_COUNT and
+MEGATROPO_SHARD_IDS set, so each has its own event loop on its own core. They
+share megatropo.db: SQLite in WAL mode serializes their writes, and each process
+polls PRAGMA data_version to notice the others' changes. Shard 0's process is
+the primary, the only one that syncs commands and runs database maintenance.
+"""
+import argparse
+import asyncio
+import math
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+import discord
+
+from database import Database
+
+# Discord allows max_concurrency shard identifies per 5 seconds
+IDENTIFY_WINDOW = 5.0
+
+
+async def recommended_shards(token: str) -> Tuple[int, int]:
+    """Discord's recommended shard count and the identify concurrency for this bot"""
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shards, _, session_start_limit = await http.get_bot_gateway()
+        return shards, session_start_limit.get('max_concurrency', 1)
+    finally:
+        await http.close()
+
+
+def shard_ranges(shard_count: int, processes: int) -> List[List[int]]:
+    """Split shard ids into up to processes contiguous, near-equal ranges"""
+    processes = max(1, min(processes, shard_count))
+    per_process, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for index in range(processes):
+        size = per_process + (1 if index < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def spawn(shard_ids: List[int], shard_count: int, render_workers: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env['MEGATROPO_SHARD_COUNT'] = str(shard_count)
+    env['MEGATROPO_SHARD_IDS'] = ','.join(map(str, shard_ids))
+    # Processes share the cores, so each gets its slice of the render pool unless it was set explicitly
+    env.setdefault('MEGATROPO_RENDER_WORKERS', str(render_workers))
+    return subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')], env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help="Bot processes to run")
+    parser.add_argument('--shards', type=int, help="Total shard count, Discord's recommendation by default")
+    args = parser.parse_args()
+
+    token = os.getenv('DCBOTTOKEN')
+    if not token:
+        sys.exit("DCBOTTOKEN is not set")
+
+    shard_count, max_concurrency = asyncio.run(recommended_shards(token))
+    shard_count = args.shards or shard_count
+    ranges = shard_ranges(shard_count, args.processes)
+    render_workers = max(1, (os.cpu_count() or 1) // len(ranges))
+
+    # Create the schema and apply migrations once, before the processes race to do it
+    Database().conn.close()
+
+    print(f"Running {shard_count} shards in {len(ranges)} processes")
+    processes = {}
+    try:
+        for shard_ids in ranges:
+            processes[tuple(shard_ids)] = spawn(shard_ids, shard_count, render_workers)
+            print(f"Started shards {shard_ids[0]}-{shard_ids[-1]}")
+            # Let this process identify its shards before the next one starts identifying
+            time.sleep(math.ceil(len(shard_ids) / max_concurrency) * IDENTIFY_WINDOW)
+
+        while True:
+            time.sleep(IDENTIFY_WINDOW)
+            for shard_ids, process in processes.items():
+                if process.poll() is not None:
+                    print(f"Shards {shard_ids[0]}-{shard_ids[-1]} exited with {process.returncode}, restarting")
+                    processes[shard_ids] = spawn(list(shard_ids), shard_count, render_workers)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
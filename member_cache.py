@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+# Gateway member requests take at most 100 user ids each
+QUERY_BATCH = 100
+
+
+class MemberCache:
+    """Bounded LRU of guild members fetched on demand.
+
+    In lean mode the gateway member cache is switched off, so guild.get_member
+    only knows the bot itself. Members are looked up here instead, batching
+    misses into gateway member requests and remembering who isn't in a guild.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        # (guild id, user id) -> member, or None for users known not to be in the guild
+        self._entries: "OrderedDict[Tuple[int, int], Optional[discord.Member]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remember(self, guild_id: int, user_id: int, member: Optional[discord.Member]):
+        key = (guild_id, user_id)
+        self._entries[key] = member
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        return (await self.get_many(guild, [user_id])).get(user_id)
+
+    async def get_many(self, guild: discord.Guild, user_ids: Iterable[int]) -> Dict[int, discord.Member]:
+        """Members of guild among user_ids, fetching the ones neither cache has seen"""
+        found: Dict[int, discord.Member] = {}
+        missing: List[int] = []
+        for user_id in dict.fromkeys(user_ids):
+            member = guild.get_member(user_id)
+            if member:
+                found[user_id] = member
+                continue
+            key = (guild.id, user_id)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                if self._entries[key]:
+                    found[user_id] = self._entries[key]
+            else:
+                missing.append(user_id)
+
+        for start in range(0, len(missing), QUERY_BATCH):
+            batch = missing[start:start + QUERY_BATCH]
+            try:
+                members = await guild.query_members(user_ids=batch, limit=len(batch), cache=False)
+            except TimeoutError:
+                print(f"Timed out fetching {len(batch)} members in server: {guild.name}")
+                continue
+            fetched = {member.id: member for member in members}
+            for user_id in batch:
+                self._remember(guild.id, user_id, fetched.get(user_id))
+            found.update(fetched)
+        return found
+
+    def update(self, member: discord.Member):
+        """Refresh an entry from a member event, without adding members nobody asked for"""
+        if (member.guild.id, member.id) in self._entries:
+            self._entries[(member.guild.id, member.id)] = member
+
+    def forget(self, guild_id: int, user_id: int):
+        self._entries.pop((guild_id, user_id), None)
+
+
+async def iter_member_chunks(guild: discord.Guild, chunk_size: int = 1000) -> AsyncIterator[List[discord.Member]]:
+    """Yield a guild's members in lists of up to chunk_size, without holding the whole list.
+
+    Uses the gateway cache when the guild is chunked, otherwise pages through
+    the REST member list, which needs the members intent.
+    """
+    chunk: List[discord.Member] = []
+    if guild.chunked:
+        members = guild.members
+        for start in range(0, len(members), chunk_size):
+            yield members[start:start + chunk_size]
+        return
+
+    async for member in guild.fetch_members(limit=None):
+        chunk.append(member)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
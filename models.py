@@ -2,6 +2,7 @@ from dataclasses import dataclass
 from typing import List, Optional, Dict, Set
 from enum import Enum, auto
 from datetime import datetime
+from pass_codes import PassCode
 
 class FactionPermission(Enum):
     ADD_MEMBERS = auto()
@@ -47,8 +48,8 @@ class Nation:
 
 @dataclass
 class PassIdentifier:
-    colorless_part: str  # hex string for faction/nation combo
-    colored_part: str    # hex string for user-specific colors
+    colorless_part: PassCode  # faction/nation combo
+    colored_part: PassCode    # user-specific, signed
     faction_id: Optional[int] = None
     nation_id: Optional[int] = None
 
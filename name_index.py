@@ -0,0 +1,71 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class NameIndex:
+    """Case-insensitive prefix index over faction and nation names, for autocomplete.
+
+    Each entity type keeps a sorted list of (folded name, name, id), so a
+    prefix lookup is one bisect plus a slice and never touches the database.
+    Kept in sync through the database's 'entity_named' and 'entity_removed'
+    events.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, List[Tuple[str, str, int]]] = {}
+        self._by_id: Dict[Tuple[str, int], Tuple[str, str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def load(self, entity_type: str, rows: Iterable[Tuple[int, str]]):
+        """Replace an entity type's names with (id, name) rows"""
+        for key in [key for key in self._by_id if key[0] == entity_type]:
+            del self._by_id[key]
+        entries = []
+        for entity_id, name in rows:
+            entry = (name.casefold(), name, entity_id)
+            entries.append(entry)
+            self._by_id[(entity_type, entity_id)] = entry
+        entries.sort()
+        self._entries[entity_type] = entries
+
+    def add(self, entity_type: str, entity_id: int, name: str):
+        """Add an entity, or rename it if it is already indexed"""
+        self.remove(entity_type, entity_id)
+        entry = (name.casefold(), name, entity_id)
+        insort(self._entries.setdefault(entity_type, []), entry)
+        self._by_id[(entity_type, entity_id)] = entry
+
+    def remove(self, entity_type: str, entity_id: int):
+        entry = self._by_id.pop((entity_type, entity_id), None)
+        if entry is None:
+            return
+        entries = self._entries[entity_type]
+        del entries[bisect_left(entries, entry)]
+
+    def complete(self, entity_type: str, prefix: str, limit: int = 25) -> List[str]:
+        """Up to limit names starting with prefix, ignoring case, in name order"""
+        entries = self._entries.get(entity_type, [])
+        folded = prefix.casefold()
+        start = bisect_left(entries, (folded,))
+        names = []
+        for folded_name, name, _ in entries[start:start + limit]:
+            if not folded_name.startswith(folded):
+                break
+            names.append(name)
+        return names
+
+    def lookup(self, entity_type: str, name: str) -> Optional[int]:
+        """Id of the entity with this name, ignoring case unless names differ only by case"""
+        entries = self._entries.get(entity_type, [])
+        folded = name.casefold()
+        found = None
+        position = bisect_left(entries, (folded,))
+        while position < len(entries) and entries[position][0] == folded:
+            _, entry_name, entity_id = entries[position]
+            if entry_name == name:
+                return entity_id
+            found = found or entity_id
+            position += 1
+        return found
@@ -0,0 +1,178 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import discord
+
+# Lower runs first
+INTERACTIVE = 0  # responses a user is waiting on
+NORMAL = 1
+BACKGROUND = 2  # announcements, channel setup, maintenance
+
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BACKGROUND: 'background'}
+
+# Discord rate limits most routes per channel, guild or webhook
+Bucket = Tuple[str, int]
+
+
+def channel_bucket(channel: discord.abc.Snowflake) -> Bucket:
+    return ('channel', channel.id)
+
+
+def guild_bucket(guild: discord.abc.Snowflake) -> Bucket:
+    return ('guild', guild.id)
+
+
+def interaction_bucket(interaction: discord.Interaction) -> Bucket:
+    # Followups go to the interaction webhook, which has a bucket of its own
+    return ('webhook', interaction.id)
+
+
+class _Job:
+    __slots__ = ('priority', 'factory', 'future', 'coalesce_key', 'queued_at')
+
+    def __init__(self, priority: int, factory: Callable[[], Awaitable[Any]], coalesce_key: Optional[Hashable]):
+        self.priority = priority
+        self.factory = factory
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.coalesce_key = coalesce_key
+        self.queued_at = time.monotonic()
+
+
+class _PriorityGate:
+    """A semaphore that hands free slots to the highest priority waiter first"""
+
+    def __init__(self, limit: int):
+        self.free = limit
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self.free > 0 and not self._waiters:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Got the slot just as we were cancelled, pass it on
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
+
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+
+class OutboundQueue:
+    """Dispatches Discord REST calls through per-bucket queues.
+
+    Calls to the same bucket run one at a time, highest priority first, so
+    bursts queue here instead of piling onto one rate limit. A gate caps the
+    calls in flight across buckets and lets interactive work past background
+    work when they compete. A queued call with the same coalesce key as a newer
+    one is replaced by it, e.g. repeated edits of one message, and both callers
+    get the newer call's result.
+    """
+
+    def __init__(self, max_in_flight: int = 16):
+        self._gate = _PriorityGate(max_in_flight)
+        self._queues: Dict[Bucket, List[Tuple[int, int, _Job]]] = {}
+        self._pending_keys: Dict[Tuple[Bucket, Hashable], _Job] = {}
+        self._workers: Dict[Bucket, asyncio.Task] = {}
+        self._order = itertools.count()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.max_wait_ms = {priority: 0.0 for priority in PRIORITY_NAMES}
+
+    def submit(self, bucket: Bucket, factory: Callable[[], Awaitable[Any]], priority: int = NORMAL,
+               coalesce_key: Optional[Hashable] = None) -> asyncio.Future:
+        """Queue factory() on bucket, returning a future for its result"""
+        if coalesce_key is not None:
+            queued = self._pending_keys.get((bucket, coalesce_key))
+            if queued:
+                queued.factory = factory
+                self.coalesced += 1
+                return queued.future
+
+        job = _Job(priority, factory, coalesce_key)
+        if coalesce_key is not None:
+            self._pending_keys[(bucket, coalesce_key)] = job
+        heapq.heappush(self._queues.setdefault(bucket, []), (priority, next(self._order), job))
+        if bucket not in self._workers:
+            self._workers[bucket] = asyncio.create_task(self._drain(bucket))
+        return job.future
+
+    async def run(self, bucket: Bucket, factory: Callable[[], Awaitable[Any]], priority: int = NORMAL,
+                  coalesce_key: Optional[Hashable] = None) -> Any:
+        # A coalesced job's future is shared, one caller giving up must not cancel it for the others
+        return await asyncio.shield(self.submit(bucket, factory, priority, coalesce_key))
+
+    async def _drain(self, bucket: Bucket):
+        queue = self._queues[bucket]
+        try:
+            while queue:
+                _, _, job = heapq.heappop(queue)
+                if job.coalesce_key is not None:
+                    self._pending_keys.pop((bucket, job.coalesce_key), None)
+                if job.future.done():
+                    continue  # Caller gave up
+                await self._gate.acquire(job.priority)
+                self.in_flight += 1
+                waited = (time.monotonic() - job.queued_at) * 1000
+                self.max_wait_ms[job.priority] = max(self.max_wait_ms[job.priority], waited)
+                try:
+                    result = await job.factory()
+                except Exception as e:
+                    self.failed += 1
+                    if isinstance(e, discord.HTTPException) and e.status == 429:
+                        self.rate_limited += 1
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    self.completed += 1
+                    if not job.future.done():
+                        job.future.set_result(result)
+                finally:
+                    self.in_flight -= 1
+                    self._gate.release()
+        finally:
+            del self._workers[bucket]
+            if not queue:
+                self._queues.pop(bucket, None)
+
+    def depth(self) -> Dict[str, int]:
+        """Queued calls per priority"""
+        counts = {name: 0 for name in PRIORITY_NAMES.values()}
+        for queue in self._queues.values():
+            for priority, _, _ in queue:
+                counts[PRIORITY_NAMES[priority]] += 1
+        return counts
+
+    def metrics(self) -> Dict[str, Any]:
+        busiest = sorted(((len(queue), bucket) for bucket, queue in self._queues.items()), reverse=True)[:5]
+        return {
+            'queued': self.depth(),
+            'buckets': len(self._queues),
+            'busiest_buckets': [(f"{kind}:{bucket_id}", depth) for depth, (kind, bucket_id) in busiest],
+            'in_flight': self.in_flight,
+            'waiting_for_slot': self._gate.waiting(),
+            'completed': self.completed,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'rate_limited': self.rate_limited,
+            'max_wait_ms': {PRIORITY_NAMES[priority]: round(ms, 1) for priority, ms in self.max_wait_ms.items()},
+        }
@@ -0,0 +1,93 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from models import UserPass
+from pass_formats import DEFAULT_FORMAT
+
+
+@dataclass
+class CachedPass:
+    data: bytes  # encoded in the guild's pass format
+    user_id: int
+    entities: Set[Tuple[str, int]]  # icons drawn on the pass
+    url: Optional[str] = None
+    url_expires: Optional[datetime] = None
+
+
+class RenderedPassCache:
+    """LRU of rendered pass images keyed by a hash of everything drawn on the card and the format.
+
+    Once a PNG has been uploaded the attachment URL is remembered, so showing an
+    unchanged pass again can embed the existing upload instead of sending the file.
+    """
+
+    def __init__(self, max_entries: int = 512, url_ttl: timedelta = timedelta(hours=12)):
+        self.max_entries = max_entries
+        # Discord attachment URLs are signed and expire, so only trust them for a while
+        self.url_ttl = url_ttl
+        self._entries: "OrderedDict[str, CachedPass]" = OrderedDict()
+        self._icon_versions: Dict[Tuple[str, int], int] = {}
+
+    def key_for(self, user_pass: UserPass, username: str, fmt: str = DEFAULT_FORMAT) -> str:
+        identifier = user_pass.pass_identifier
+        fields = (
+            user_pass.user_id,
+            user_pass.faction_id,
+            user_pass.nation_id,
+            user_pass.issue_date.strftime('%Y-%m-%d'),
+            user_pass.expiry_date.strftime('%Y-%m-%d'),
+            user_pass.faction_rank,
+            user_pass.nation_rank,
+            identifier.colorless_part,
+            identifier.colored_part,
+            username,
+            self._icon_versions.get(('faction', user_pass.faction_id), 0),
+            self._icon_versions.get(('nation', user_pass.nation_id), 0),
+            fmt
+        )
+        return hashlib.sha256(repr(fields).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedPass]:
+        entry = self._entries.get(key)
+        if entry:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, user_pass: UserPass, data: bytes) -> CachedPass:
+        entities = set()
+        if user_pass.faction_id:
+            entities.add(('faction', user_pass.faction_id))
+        if user_pass.nation_id:
+            entities.add(('nation', user_pass.nation_id))
+
+        entry = CachedPass(data=data, user_id=user_pass.user_id, entities=entities)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def remember_url(self, key: str, url: str):
+        entry = self._entries.get(key)
+        if entry:
+            entry.url = url
+            entry.url_expires = datetime.now() + self.url_ttl
+
+    def url_for(self, key: str) -> Optional[str]:
+        entry = self.get(key)
+        if entry and entry.url and entry.url_expires > datetime.now():
+            return entry.url
+        return None
+
+    def invalidate_user(self, user_id: int):
+        for key in [k for k, entry in self._entries.items() if entry.user_id == user_id]:
+            del self._entries[key]
+
+    def invalidate_icon(self, entity_type: str, entity_id: int):
+        entity = (entity_type, entity_id)
+        self._icon_versions[entity] = self._icon_versions.get(entity, 0) + 1
+        for key in [k for k, entry in self._entries.items() if entity in entry.entities]:
+            del self._entries[key]
@@ -0,0 +1,137 @@
+import hashlib
+import hmac
+import os
+import struct
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+# user id, faction id, nation id, expiry (unix seconds) - 0 stands for "no faction/nation"
+_CLAIMS = struct.Struct('>QIII')
+MAC_SIZE = 16
+CODE_SIZE = _CLAIMS.size + MAC_SIZE  # 36 bytes, the 72 nibbles of the colored part
+
+
+class PassCode:
+    """One half of a pass's verification strip: 72 nibbles, one per cell, packed into 36 bytes.
+
+    Stored as a BLOB, compared as bytes, and unpacked straight into a NumPy
+    array of cell values for drawing and reading strips.
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data: bytes):
+        if len(data) != CODE_SIZE:
+            raise ValueError(f"A pass code is {CODE_SIZE} bytes, got {len(data)}")
+        self._data = bytes(data)
+
+    @classmethod
+    def zero(cls) -> 'PassCode':
+        return cls(bytes(CODE_SIZE))
+
+    @classmethod
+    def from_hex(cls, text: str) -> 'PassCode':
+        """Parse a hex code, padding or cutting it to 72 nibbles like the old TEXT columns were"""
+        return cls(bytes.fromhex(text[:CODE_SIZE * 2].ljust(CODE_SIZE * 2, '0')))
+
+    @classmethod
+    def from_nibbles(cls, nibbles: np.ndarray) -> 'PassCode':
+        nibbles = np.asarray(nibbles, dtype=np.uint8)
+        return cls(((nibbles[0::2] << 4) | (nibbles[1::2] & 0xF)).tobytes())
+
+    def nibbles(self) -> np.ndarray:
+        """The 72 cell values, 0-15, in strip order"""
+        packed = np.frombuffer(self._data, dtype=np.uint8)
+        return np.stack((packed >> 4, packed & 0xF), axis=1).ravel()
+
+    def max_difference(self, other: 'PassCode') -> int:
+        """Largest difference between two codes in any one cell"""
+        if self._data == other._data:
+            return 0
+        return int(np.abs(self.nibbles().astype(np.int8) - other.nibbles().astype(np.int8)).max())
+
+    def hex(self) -> str:
+        return self._data.hex()
+
+    def __bytes__(self) -> bytes:
+        return self._data
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PassCode) and self._data == other._data
+
+    def __hash__(self) -> int:
+        return hash(self._data)
+
+    def __reduce__(self):
+        return PassCode, (self._data,)
+
+    def __str__(self) -> str:
+        return self._data.hex()
+
+    def __repr__(self) -> str:
+        return f"PassCode('{self._data.hex()}')"
+
+
+@dataclass(frozen=True)
+class PassClaims:
+    user_id: int
+    faction_id: Optional[int]
+    nation_id: Optional[int]
+    expiry_date: datetime
+
+    @property
+    def expired(self) -> bool:
+        return datetime.now() > self.expiry_date
+
+
+class PassCodec:
+    """Signs pass claims into the colored part of the verification strip.
+
+    The colored part carries the claims themselves plus a truncated HMAC-SHA256
+    over them, so a pass can be checked with nothing but the key.
+    """
+
+    def __init__(self, key: bytes):
+        if len(key) < 16:
+            raise ValueError("Pass signing key must be at least 16 bytes")
+        self.key = key
+
+    @staticmethod
+    def generate_key() -> bytes:
+        return os.urandom(32)
+
+    @staticmethod
+    def key_from_env() -> Optional[bytes]:
+        """MEGATROPO_PASS_KEY lets several bot processes or offline checkpoints share a key"""
+        value = os.getenv('MEGATROPO_PASS_KEY')
+        if not value:
+            return None
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            return value.encode()
+
+    def _mac(self, claims: bytes) -> bytes:
+        return hmac.new(self.key, claims, hashlib.sha256).digest()[:MAC_SIZE]
+
+    def encode(self, user_id: int, faction_id: Optional[int], nation_id: Optional[int], expiry_date: datetime) -> PassCode:
+        """Return the colored part for these claims"""
+        claims = _CLAIMS.pack(user_id, faction_id or 0, nation_id or 0, int(expiry_date.timestamp()))
+        return PassCode(claims + self._mac(claims))
+
+    def decode(self, colored_part: PassCode) -> Optional[PassClaims]:
+        """Return the claims of a colored part, or None if its MAC does not match"""
+        code = bytes(colored_part)
+        claims, mac = code[:_CLAIMS.size], code[_CLAIMS.size:]
+        if not hmac.compare_digest(mac, self._mac(claims)):
+            return None
+        user_id, faction_id, nation_id, expiry = _CLAIMS.unpack(claims)
+        return PassClaims(
+            user_id=user_id,
+            faction_id=faction_id or None,
+            nation_id=nation_id or None,
+            expiry_date=datetime.fromtimestamp(expiry)
+        )
@@ -1,13 +1,37 @@
-import random
-from PIL import Image, ImageDraw, ImageFont, ImageOps
+from PIL import Image, ImageDraw, ImageOps
 import numpy as np
 from datetime import datetime
 import os
-from models import UserPass
+from models import PassIdentifier, UserPass
+from pass_codes import PassClaims, PassCode, PassCodec
+from io import BytesIO
+from typing import Optional, Tuple
+from blob_store import BlobStore
+from icon_pipeline import REGULAR_FONT, default_icon, load_font
+
+
+def _cubic(t: np.ndarray) -> np.ndarray:
+    # Keys cubic with a = -0.5, the kernel PIL uses for BICUBIC
+    t = np.abs(t)
+    return np.where(t < 1, 1.5 * t**3 - 2.5 * t**2 + 1, np.where(t < 2, -0.5 * t**3 + 2.5 * t**2 - 4 * t + 2, 0.0))
+
+
+def _lanczos(t: np.ndarray) -> np.ndarray:
+    return np.sinc(t) * np.sinc(t / 3)
+
+
+# (kernel, support) pairs tried when undoing the resize of a pass image
+RESAMPLING_KERNELS = [
+    (lambda t: ((t > -0.5) & (t <= 0.5)).astype(float), 0.5),  # Nearest neighbour, ties go to the next pixel like PIL
+    (lambda t: np.clip(1 - np.abs(t), 0, None), 1.0),   # Bilinear
+    (_cubic, 2.0),
+    (_lanczos, 3.0)
+]
 
 class PassGenerator:
-    def __init__(self):
-        self.font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 16)
+    def __init__(self, blobs: Optional[BlobStore] = None):
+        self.font = load_font(REGULAR_FONT, 16)
+        self.blobs = blobs or BlobStore()
         self.width = 400
         self.height = 250
         self.verification_height = 20
@@ -19,6 +43,7 @@ class PassGenerator:
         self.grid_size = 2         # Size of each grid cell in pixels
         self.grid_chars = 72  # 12x6 grid = 72 characters
         self.default_pattern = self._generate_checker_pattern()
+        self._resampling_cache = {}  # Resize models of the strip, shared by images resized the same way
 
     def _generate_checker_pattern(self) -> str:
         """Generate a checker pattern for empty faction slots"""
@@ -32,16 +57,6 @@ class PassGenerator:
                 pattern += "4"  # Light grey
         return pattern
 
-    def _generate_user_code(self, user_id: int) -> str:
-        """Generate a unique 72-character colored code for a user"""
-        import hashlib
-        # Create a hash from user ID
-        hash_input = f"user_{user_id}_{datetime.now().strftime('%Y%m')}"  # Changes monthly
-        hash_obj = hashlib.sha256(hash_input.encode())
-        # Convert hash to hex and expand to 72 chars
-        hex_hash = hash_obj.hexdigest()
-        return (hex_hash * 3)[:72]  # Repeat hash to reach 72 chars
-
     def _generate_entity_code(self, entity_type: str, entity_id: int) -> str:
         """Generate a unique 72-character code for a faction or nation"""
         import hashlib
@@ -49,27 +64,29 @@ class PassGenerator:
         hash_obj = hashlib.sha256(hash_input.encode())
         return (hash_obj.hexdigest() * 3)[:72]
 
-    def create_pass_image(self, user_pass: UserPass, username: str) -> Image.Image:
+    def _pass_icon(self, digest: Optional[str], entity_type: str, entity_id: int, letter: str) -> Image.Image:
+        """The 50x50 icon drawn on passes, precomputed at upload time and read from the blob store"""
+        if digest:
+            try:
+                return Image.open(BytesIO(self.blobs.read(digest)))
+            except FileNotFoundError:
+                print(f"Icon blob {digest} is missing, drawing the default icon")
+        return self._generate_default_icon(entity_type, entity_id, letter)
+
+    def create_pass_image(self, user_pass: UserPass, username: str,
+                          icons: Tuple[Optional[str], Optional[str]] = (None, None)) -> Image.Image:
+        """Draw a pass card. icons are the blob digests of the faction and nation 'pass' icon variants."""
         img = Image.new('RGB', (self.width, self.height), 'white')
         draw = ImageDraw.Draw(img)
+        faction_icon, nation_icon = icons
 
         # Add faction icon if exists
         if user_pass.faction_id:
-            try:
-                faction_icon = Image.open(f"images/faction_{user_pass.faction_id}.png")
-            except FileNotFoundError:
-                faction_icon = self._generate_default_icon("F")
-            faction_icon = faction_icon.resize((50, 50))
-            img.paste(faction_icon, (20, 20))
+            img.paste(self._pass_icon(faction_icon, 'faction', user_pass.faction_id, "F"), (20, 20))
 
         # Add nation icon if exists
         if user_pass.nation_id:
-            try:
-                nation_icon = Image.open(f"images/nation_{user_pass.nation_id}.png")
-            except FileNotFoundError:
-                nation_icon = self._generate_default_icon("N")
-            nation_icon = nation_icon.resize((50, 50))
-            img.paste(nation_icon, (self.width - 70, 20))
+            img.paste(self._pass_icon(nation_icon, 'nation', user_pass.nation_id, "N"), (self.width - 70, 20))
 
         # Add user information
         y = 80
@@ -88,171 +105,702 @@ class PassGenerator:
         y += 25
         draw.text((20, y), f"Expiry Date: {user_pass.expiry_date.strftime('%Y-%m-%d')}", fill='black', font=self.font)
 
-        # Generate verification codes
-        if user_pass.nation_id:
-            nation_code = self._generate_entity_code("nation", user_pass.nation_id)
-            colorless = nation_code
-            if not user_pass.faction_id:
-                # Add checker pattern with white trim if needed
-                if any(int(nation_code[-1], 16) > 7):
-                    colorless = nation_code[:-1] + "0"  # White trim at end
-                if any(int(nation_code[0], 16) > 7):
-                    colorless = "0" + nation_code[1:]  # White trim at start
-        else:
-            colorless = self.default_pattern
-
-        if user_pass.faction_id:
-            faction_code = self._generate_entity_code("faction", user_pass.faction_id)
-            colorless = faction_code
-            if user_pass.nation_id:
-                # Combine faction and nation codes
-                for i in range(72):
-                    if i < 36:  # First half faction
-                        colorless = faction_code
-                    else:  # Second half nation
-                        colorless = nation_code
-
-        # Generate colored part (user-specific)
-        colored = self._generate_user_code(user_pass.user_id)
-
         # Draw verification line
         line_y = self.height - 40
         start_x = (self.width - (self.colorless_width * self.grid_size)) // 2
 
-        # Ensure patterns are exactly 72 characters
-        colorless = user_pass.pass_identifier.colorless_part[:72].ljust(72, '0')
-        colored = user_pass.pass_identifier.colored_part[:72].ljust(72, '0')
-
-        # Draw colorless part
-        for i in range(72):
-            x = i % 12
-            y = i // 12
-            color_value = int(colorless[i], 16) * 16
-            
-            for dx in range(self.grid_size):
-                for dy in range(self.grid_size):
-                    draw.point(
-                        (start_x + x * self.grid_size + dx, line_y + y * self.grid_size + dy),
-                        fill=(color_value, color_value, color_value)
-                    )
-
-        # Draw colored part
-        colored_start_x = start_x + (self.colorless_width * self.grid_size) + self.line_spacing
-        for i in range(72):
-            x = i % 12
-            y = i // 12
-            color_val = int(colored[i], 16)
-            r = (color_val & 0xF) * 16
-            g = (color_val & 0xF) * 16
-            b = 0  # Keep blue at 0 for consistent verification
-            
-            for dx in range(self.grid_size):
-                for dy in range(self.grid_size):
-                    draw.point(
-                        (colored_start_x + x * self.grid_size + dx, line_y + y * self.grid_size + dy),
-                        fill=(r, g, b)
-                    )
+        img.paste(self._strip_image(user_pass.pass_identifier), (start_x, line_y))
 
         return img
 
-    def extract_verification_line(self, image: Image.Image) -> tuple[str, str]:
+    def strip_box(self) -> tuple[int, int, int, int]:
+        """(left, top, right, bottom) of the verification strip on a rendered card"""
+        start_x = (self.width - (self.colorless_width * self.grid_size)) // 2
+        line_y = self.height - 40
+        width = (self.colorless_width + self.colored_width) * self.grid_size + self.line_spacing
+        return start_x, line_y, start_x + width, line_y + self.colorless_height * self.grid_size
+
+    def _strip_image(self, identifier: PassIdentifier) -> Image.Image:
+        """The verification strip as one image, each code's nibbles blown up to grid cells"""
+        cell = np.ones((self.grid_size, self.grid_size), dtype=np.uint8)
+        shape = (self.colorless_height, self.colorless_width)
+        colorless = np.kron(identifier.colorless_part.nibbles().reshape(shape) * 16, cell)
+        colored = np.kron(identifier.colored_part.nibbles().reshape(shape) * 16, cell)
+
+        colored_x = colorless.shape[1] + self.line_spacing
+        strip = np.full((colorless.shape[0], colored_x + colored.shape[1], 3), 255, dtype=np.uint8)
+        strip[:, :colorless.shape[1]] = colorless[..., None]
+        # Red and green carry the value, blue stays at 0 for consistent verification
+        strip[:, colored_x:, 0] = colored
+        strip[:, colored_x:, 1] = colored
+        strip[:, colored_x:, 2] = 0
+        return Image.fromarray(strip)
+
+    def extract_verification_line(self, image: Image.Image) -> tuple[PassCode, PassCode]:
         """Extract both parts of the verification line from an image."""
         line_y = self.height - 40
         start_x = (self.width - (self.colorless_width * self.grid_size)) // 2
         
-        line_data = np.array(image)
-        colorless_values = []
-        colored_values = []
-
-        # Extract both parts
-        for i in range(72):
-            x = i % 12
-            y = i // 12
-
-            # Sample colorless grid
-            sample_x = start_x + x * self.grid_size + self.grid_size // 2
-            sample_y = line_y + y * self.grid_size + self.grid_size // 2
-            gray_value = line_data[sample_y][sample_x][0]
-            colorless_values.append(format(gray_value // 16, 'x'))
-
-            # Sample colored grid
-            colored_start_x = start_x + (self.colorless_width * self.grid_size) + self.line_spacing
-            sample_x = colored_start_x + x * self.grid_size + self.grid_size // 2
-            r, g, _ = line_data[sample_y][sample_x]
-            color_val = (r // 16) & 0xF  # Only use red channel
-            colored_values.append(format(color_val, 'x'))
-
-        return (''.join(colorless_values), ''.join(colored_values))
-
-    def verify_pass_image(self, image_path: str, user_pass: UserPass) -> tuple[bool, list[str], Image.Image]:
-        """Verify a pass image and return (is_valid, discrepancies, marked_image)"""
+        line_data = np.asarray(image.convert('RGB'))
+        # Sample the centre pixel of every cell, row by row
+        rows = line_y + np.arange(self.colorless_height) * self.grid_size + self.grid_size // 2
+        cols = start_x + np.arange(self.colorless_width) * self.grid_size + self.grid_size // 2
+        colored_cols = cols + (self.colorless_width * self.grid_size) + self.line_spacing
+
+        colorless = line_data[rows[:, None], cols[None, :], 0].ravel() // 16
+        colored = line_data[rows[:, None], colored_cols[None, :], 0].ravel() // 16  # Only use red channel
+        return PassCode.from_nibbles(colorless), PassCode.from_nibbles(colored)
+
+    def _box_sums(self, integral: np.ndarray, top: int, left: int, height: int, width: int, rows: int, cols: int) -> np.ndarray:
+        """Sum of every height x width box offset by (top, left) from each of rows x cols origins"""
+        bottom, right = top + height, left + width
+        return (integral[bottom:bottom + rows, right:right + cols]
+                - integral[top:top + rows, right:right + cols]
+                - integral[bottom:bottom + rows, left:left + cols]
+                + integral[top:top + rows, left:left + cols])
+
+    def _aspect_matches(self, image_size: tuple[int, int]) -> bool:
+        width, height = image_size
+        return abs((width / height) / (self.width / self.height) - 1) < 0.03
+
+    def _card_location(self, image_size: tuple[int, int]) -> tuple[float, float, float, float]:
+        """Where a card resized to image_size has its strip, a resize maps the card's whole box"""
+        scale, scale_y = image_size[0] / self.width, image_size[1] / self.height
+        start_x = (self.width - (self.colorless_width * self.grid_size)) // 2
+        return start_x * scale, (self.height - 40) * scale_y, scale, scale_y
+
+    def _strip_candidates(self, mask: np.ndarray, count: int = 3) -> list[tuple[int, int, float]]:
+        """(x, y, scale) of the likeliest strips in a screenshot, found in one pass over the mask.
+
+        Every row of the strip crosses two dark runs of the same length split by the
+        short gap, at the same columns from row to row, so such pairs are collected
+        from the whole mask at once and the columns shared by the most rows win.
+        """
+        part_w = self.colorless_width * self.grid_size
+        # Every row is padded white, so its edges alternate between run starts and run ends
+        steps = np.diff(np.pad(mask, ((0, 0), (1, 1))), axis=1)
+        rows, edges = np.divmod(np.flatnonzero(steps), steps.shape[1])
+        rows, starts, ends = rows[::2], edges[::2], edges[1::2]
+        lengths = ends - starts
+
+        # Resampling smears the gap, but it stays a small, non-zero fraction of the grids' width.
+        # Lanczos can ring a thin dark line into the gap, so runs one apart are paired as well.
+        pair_rows, pair_x, pair_end = [], [], []
+        for skip in (1, 2):
+            first, second = slice(None, -skip), slice(skip, None)
+            gaps = starts[second] - ends[first]
+            length = lengths[first]
+            pairs = ((rows[second] == rows[first]) & (length >= part_w // 2)
+                     & (np.abs(lengths[second] - length) <= np.maximum(2, length // 12))
+                     & (gaps * 4 <= length) & (gaps > 0))
+            if skip == 2:
+                pairs &= lengths[1:-1] * 2 < gaps
+            pair_rows.append(rows[first][pairs])
+            pair_x.append(starts[first][pairs])
+            pair_end.append(ends[second][pairs])
+        pair_rows, pair_x, pair_end = np.concatenate(pair_rows), np.concatenate(pair_x), np.concatenate(pair_end)
+        if len(pair_x) == 0:
+            return []
+
+        # Edges wobble by a pixel between rows, so a spot collects the rows a pixel either side of it too
+        width = mask.shape[1] + 2
+        spots, counts = np.unique(pair_x * width + pair_end, return_counts=True)
+        votes = np.zeros_like(counts)
+        for shift in (-width - 1, -width, -width + 1, -1, 0, 1, width - 1, width, width + 1):
+            at = np.minimum(np.searchsorted(spots, spots + shift), len(spots) - 1)
+            votes += np.where(spots[at] == spots + shift, counts[at], 0)
+
+        candidates = []
+        for index in np.argsort(-votes, kind='stable')[:64]:
+            x, end = divmod(int(spots[index]), width)
+            scale = (end - x) / (2 * part_w + self.line_spacing)
+            # The strip is six cells high, smearing costs it a row or two at most
+            if votes[index] < self.colorless_height * self.grid_size * scale / 2:
+                continue
+            if any(abs(x - kx) <= 2 and abs(end - kend) <= 2 for kx, _, _, kend in candidates):
+                continue
+            members = (np.abs(pair_x - x) <= 1) & (np.abs(pair_end - end) <= 1)
+            candidates.append((x, int(pair_rows[members].min()), scale, end))
+            if len(candidates) == count:
+                break
+        return [(x, y, scale) for x, y, scale, _ in candidates]
+
+    def _best_match(self, mask: np.ndarray, scales: np.ndarray,
+                    area: tuple[int, int, int, int]) -> tuple[float, int, int, float] | None:
+        """(score, x, y, scale) of the best strip template match with its top-left corner in area"""
+        # Only the part of the mask the templates can reach gets an integral image
+        top_scale = max(scales)
+        strip_w = (self.colorless_width + self.colored_width) * self.grid_size + self.line_spacing
+        extent = int(np.ceil(4 * top_scale)) + 2
+        left, top = max(0, area[0] - extent), max(0, area[1] - extent)
+        right = area[2] + int(np.ceil(strip_w * top_scale)) + extent
+        bottom = area[3] + int(np.ceil(self.colorless_height * self.grid_size * top_scale)) + extent
+        window = mask[top:bottom, left:right]
+        integral = np.pad(window.cumsum(0, dtype=np.int32).cumsum(1), ((1, 0), (1, 0)))
+        img_h, img_w = window.shape
+        area_x0, area_y0, area_x1, area_y1 = area[0] - left, area[1] - top, area[2] - left, area[3] - top
+        best = None
+        for scale in scales:
+            cell_w = round(self.colorless_width * self.grid_size * scale)
+            cell_h = round(self.colorless_height * self.grid_size * scale)
+            gap = max(1, round(self.line_spacing * scale))
+            # Resampling smears the strip edges, so keep the white areas a pixel or so away from them
+            halo = max(1, round(scale))
+            inner_gap = max(1, gap - 2 * halo)
+            margin = halo + max(1, round(3 * scale))
+            total_w = 2 * cell_w + gap
+
+            # Box origins are the template's outer corner, margin pixels up and left of the strip
+            first_y = max(0, area_y0 - margin)
+            first_x = max(0, area_x0 - margin)
+            rows = min(area_y1 - margin, img_h - cell_h - 2 * margin) - first_y + 1
+            cols = min(area_x1 - margin, img_w - total_w - 2 * margin) - first_x + 1
+            if rows <= 0 or cols <= 0 or cell_w < 2:
+                continue
+            origins = integral[first_y:, first_x:]
+
+            grids = (self._box_sums(origins, margin, margin, cell_h, cell_w, rows, cols)
+                     + self._box_sums(origins, margin, margin + cell_w + gap, cell_h, cell_w, rows, cols))
+            gap_sum = self._box_sums(origins, margin, margin + cell_w + (gap - inner_gap) // 2, cell_h, inner_gap, rows, cols)
+            outer = self._box_sums(origins, 0, 0, cell_h + 2 * margin, total_w + 2 * margin, rows, cols)
+            near = self._box_sums(origins, margin - halo, margin - halo, cell_h + 2 * halo, total_w + 2 * halo, rows, cols)
+            ring_area = (cell_h + 2 * margin) * (total_w + 2 * margin) - (cell_h + 2 * halo) * (total_w + 2 * halo)
+            # A solid dark box still scores only 0.5, but ringing between two dark grids is forgiven
+            score = (grids / (2 * cell_h * cell_w)
+                     - 0.5 * gap_sum / (cell_h * inner_gap)
+                     - (outer - near) / ring_area)
+
+            y, x = np.unravel_index(np.argmax(score), score.shape)
+            if best is None or score[y, x] > best[0]:
+                best = (score[y, x], left + first_x + x + margin, top + first_y + y + margin, scale)
+        return best
+
+    def locate_verification_strip(self, image: Image.Image) -> tuple[float, float, float, float] | None:
+        """Find the verification strip in a rescaled or recompressed image.
+
+        A resized card has its strip where the card's own scale puts it, so an image
+        with the card's aspect only has to confirm the strip is there. Anywhere else
+        the strip is picked out by the runs it leaves in a non-white mask, confirmed by
+        a box template of the strip (two solid grids split by a white gap and
+        surrounded by white) and measured from its edges, then placed exactly by the
+        card's box where the background shows it or else by the cell boundaries.
+        Returns (x, y, scale_x, scale_y) of the strip's top-left corner, or None if no
+        strip is found.
+        """
+        # Strip cells are at most 240, PIL's L conversion uses the same weights as _luma
+        mask = np.asarray(image.convert('L')) < 248
+
+        if self._aspect_matches(image.size):
+            x, y, scale, scale_y = location = self._card_location(image.size)
+            slack = max(2, round(2 * scale))
+            match = self._best_match(mask, np.array([scale]),
+                                     (round(x) - slack, round(y) - slack, round(x) + slack + 1, round(y) + slack + 1))
+            if match is not None and match[0] >= 0.6:
+                return location
+            # Otherwise a screenshot that happens to have the card's aspect
+
+        best = None
+        for x, y, scale in self._strip_candidates(mask):
+            reach = max(2, round(2 * scale))
+            match = self._best_match(mask, scale * np.array([0.97, 1.0, 1.03]),
+                                     (x - reach, y - reach, x + reach + 1, y + reach + 1))
+            if match is not None and (best is None or match[0] > best[0]):
+                best = match
+        if best is None or best[0] < 0.6:
+            return None
+        _, x, y, scale = best
+        location = self._refine_strip(mask, x, y, scale)
+        return self._card_box_location(mask, location) or self._align_to_cells(image, location)
+
+    def _card_box_location(self, mask: np.ndarray, location: tuple[float, float, float, float]) -> tuple[float, float, float, float] | None:
+        """Strip location from the bounds of the card around it, or None where they can't be seen.
+
+        Edges only put the strip within a few tenths of a pixel and its scale within a
+        percent, too loose to read downscaled cells. The card is white from its strip
+        out to its left, right and bottom edges, so against a darker background those
+        give the card's box in whole pixels. Its height only moves the strip a fraction
+        of a pixel, so it is taken from the card's aspect.
+        """
+        x, y, scale, _ = location
+        start_x = (self.width - (self.colorless_width * self.grid_size)) // 2
+        line_y = self.height - 40
+        part_h = self.colorless_height * self.grid_size
+        strip_w = (self.colorless_width + self.colored_width) * self.grid_size + self.line_spacing
+        smear = max(2, round(2 * scale))
+
+        rows = mask[round(y + part_h * scale * 0.25):round(y + part_h * scale * 0.75) + 1]
+        before = rows[:, :max(0, round(x) - smear)]
+        after = rows[:, round(x + strip_w * scale) + smear:]
+        below = mask[round(y + part_h * scale) + smear:, round(x):round(x + strip_w * scale)]
+        if not (before.any(axis=1).all() and after.any(axis=1).all() and below.any(axis=0).all()):
+            return None
+        # Last dark pixel before the strip and first one after it, on every row and column
+        lefts = before.shape[1] - np.argmax(before[:, ::-1], axis=1)
+        rights = round(x + strip_w * scale) + smear + np.argmax(after, axis=1)
+        bottoms = round(y + part_h * scale) + smear + np.argmax(below, axis=0)
+        if np.ptp(lefts) or np.ptp(rights) or np.ptp(bottoms):
+            return None  # Something other than the background borders the card
+
+        left, right, bottom = int(lefts[0]), int(rights[0]), int(bottoms[0])
+        card_w = right - left
+        card_h = round(card_w * self.height / self.width)
+        card_scale, card_scale_y = card_w / self.width, card_h / self.height
+        card_x = left + start_x * card_scale
+        card_y = bottom - card_h + line_y * card_scale_y
+        if abs(card_scale / scale - 1) > 0.03 or abs(card_x - x) > 1 + scale or abs(card_y - y) > 1 + scale:
+            return None
+        return card_x, card_y, card_scale, card_scale_y
+
+    def _align_to_cells(self, image: Image.Image, location: tuple[float, float, float, float]) -> tuple[float, float, float, float]:
+        """Location moved so the strip's cell boundaries line up with the steps in the image.
+
+        Cells meet every grid_size rendered pixels, so the luma steps across the strip
+        are scored against a comb of that pitch for every offset and scale within the
+        edges' error at once, then the steps down the strip for the vertical offset.
+        """
+        x, y, scale, _ = location
+        part_h = self.colorless_height * self.grid_size
+        strip_w = (self.colorless_width + self.colored_width) * self.grid_size + self.line_spacing
+        left, top = max(0, int(x) - 3), max(0, int(y) - 3)
+        luma = self._luma(image.crop((left, top, int(np.ceil(x + strip_w * scale)) + 4, int(np.ceil(y + part_h * scale)) + 4)))
+
+        # A step between two pixels sits on the pixel edge between them
+        band = luma[round(y - top + part_h * scale * 0.2):round(y - top + part_h * scale * 0.8) + 1]
+        steps = np.abs(np.diff(band, axis=1)).mean(axis=0)
+        shifts = np.linspace(-0.6, 0.6, 25)
+        scales = scale * np.linspace(0.98, 1.02, 41)
+        cells = (left + 1 + np.arange(len(steps)) - (x + shifts)[:, None, None]) / scales[None, :, None] / self.grid_size
+        score = (steps * np.cos(2 * np.pi * cells) * ((cells > -0.5) & (cells < strip_w / self.grid_size + 0.5))).sum(axis=2)
+        shift, scale_index = np.unravel_index(np.argmax(score), score.shape)
+        x, scale = x + shifts[shift], scales[scale_index]
+
+        columns = luma[:, round(x - left):round(x - left + strip_w * scale)]
+        steps = np.abs(np.diff(columns, axis=0)).mean(axis=1)
+        cells = (top + 1 + np.arange(len(steps)) - (y + shifts)[:, None]) / scale / self.grid_size
+        score = (steps * np.cos(2 * np.pi * cells) * ((cells > -0.5) & (cells < self.colorless_height + 0.5))).sum(axis=1)
+        return float(x), float(y + shifts[np.argmax(score)]), float(scale), float(scale)
+
+    def _edge(self, profile: np.ndarray, expected: float, rising: bool, reach: int) -> float | None:
+        """Sub-pixel position where a dark-fraction profile crosses 0.5 near the expected edge"""
+        start = max(1, int(expected) - reach)
+        stop = min(len(profile), int(expected) + reach + 1)
+        before, after = profile[start - 1:stop - 1], profile[start:stop]
+        crossing = (before < 0.5) & (after >= 0.5) if rising else (before >= 0.5) & (after < 0.5)
+        hits = np.nonzero(crossing)[0]
+        if len(hits) == 0:
+            return None
+        i = hits[np.argmin(np.abs(start + hits - expected))]
+        # Profile values sit at pixel centres, interpolate between them
+        return start + i - 0.5 + (0.5 - before[i]) / (after[i] - before[i])
+
+    def _refine_strip(self, mask: np.ndarray, x: int, y: int, scale: float) -> tuple[float, float, float, float]:
+        """Measure the strip edges to sub-pixel accuracy.
+
+        Resampling widens dark areas by the same amount on every side, so distances
+        between edges of the same direction give the scale and midpoints between
+        opposite edges give the position, both free of that bias. The strip is too
+        short to measure its height well, so it is taken to be scaled like the width.
+        """
+        part_w = self.colorless_width * self.grid_size
+        part_h = self.colorless_height * self.grid_size
+        pitch = part_w + self.line_spacing
+        reach = max(2, round(2 * scale))
+
+        band = mask[int(y + part_h * scale * 0.25):int(y + part_h * scale * 0.75) + 1]
+        columns = band.mean(axis=0)
+        edges = [
+            self._edge(columns, x, True, reach),
+            self._edge(columns, x + part_w * scale, False, reach),
+            self._edge(columns, x + pitch * scale, True, reach),
+            self._edge(columns, x + (pitch + part_w) * scale, False, reach)
+        ]
+        if None in edges:
+            return float(x), float(y), float(scale), float(scale)
+        left, right, colored_left, colored_right = edges
+        scale = ((colored_left - left) + (colored_right - right)) / (2 * pitch)
+        x = ((left + right) + (colored_left + colored_right) - 2 * (pitch + part_w) * scale) / 4
+        scale_y = scale
+
+        rows = mask[:, int(x):int(x + (pitch + part_w) * scale)].mean(axis=1)
+        top = self._edge(rows, y, True, reach)
+        bottom = self._edge(rows, y + part_h * scale_y, False, reach)
+        if top is not None and bottom is not None:
+            y = (top + bottom - part_h * scale_y) / 2
+        return float(x), float(y), float(scale), float(scale_y)
+
+    def _luma(self, image: Image.Image) -> np.ndarray:
+        # JPEG keeps brightness far better than colour, so cells are read from luma
+        rgb = np.asarray(image.convert('RGB'), dtype=np.float64)
+        return rgb[:, :, 0] * 0.299 + rgb[:, :, 1] * 0.587 + rgb[:, :, 2] * 0.114
+
+    def _resampling_matrix(self, kernel_index: int, origin: float, scale: float, segments: list[tuple[int, int]],
+                           cells: list[int], pixels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """How much each strip segment contributes to each image pixel along one axis.
+
+        Models a PIL-style resize: a pixel centre maps back to a rendered coordinate and
+        takes a normalised, kernel-weighted sum of rendered pixels, widened when downscaling.
+        Returns the matrix and the pseudo-inverse of its cell columns, cached by where the
+        first pixel lands so the fits of a position are only solved once.
+        """
+        phase = origin + (pixels[0] + 0.5) / scale
+        key = (kernel_index, segments[0][0], round(phase, 3), round(scale, 4), len(pixels))
+        cached = self._resampling_cache.get(key)
+        if cached is not None:
+            return cached
+
+        kernel, support = RESAMPLING_KERNELS[kernel_index]
+        first = segments[0][0]
+        rendered = np.arange(first, segments[-1][0] + segments[-1][1]) + 0.5
+        # PIL widens every filter but nearest neighbour when downscaling
+        spread = max(1.0, 1 / scale) if support > 0.5 else 1.0
+        offsets = rendered[None, :] - (phase + np.arange(len(pixels)) / scale)[:, None]
+        weights = kernel(offsets / spread) * (np.abs(offsets) <= support * spread)
+        weights /= np.maximum(weights.sum(axis=1, keepdims=True), 1e-9)
+
+        basis = np.zeros((len(rendered), len(segments)))
+        for index, (start, size) in enumerate(segments):
+            basis[start - first:start - first + size, index] = 1
+        matrix = weights @ basis
+
+        if len(self._resampling_cache) >= 4096:
+            self._resampling_cache.clear()
+        columns = matrix[:, cells]
+        try:
+            # Normal equations, far cheaper than an SVD and fine while every cell covers some pixels
+            inverse = np.linalg.solve(columns.T @ columns, columns.T)
+        except np.linalg.LinAlgError:
+            inverse = np.linalg.pinv(columns)
+        self._resampling_cache[key] = matrix, inverse
+        return self._resampling_cache[key]
+
+    def _strip_segments(self) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+        """(start, size) of every column and row segment of the rendered strip, white border included"""
+        start_x = (self.width - (self.colorless_width * self.grid_size)) // 2
+        line_y = self.height - 40
+        part_w = self.colorless_width * self.grid_size
+        border = 6
+        cols = ([(start_x - border, border)]
+                + [(start_x + i * self.grid_size, self.grid_size) for i in range(self.colorless_width)]
+                + [(start_x + part_w, self.line_spacing)]
+                + [(start_x + part_w + self.line_spacing + i * self.grid_size, self.grid_size) for i in range(self.colored_width)]
+                + [(start_x + 2 * part_w + self.line_spacing, border)])
+        rows = ([(line_y - border, border)]
+                + [(line_y + j * self.grid_size, self.grid_size) for j in range(self.colorless_height)]
+                + [(line_y + self.colorless_height * self.grid_size, border)])
+        return cols, rows
+
+    def _decode_cells(self, image: Image.Image, x: float, y: float, scale: float, scale_y: float) -> np.ndarray:
+        """Recover the rendered luma of every cell, colorless cells first.
+
+        At 2 pixels a cell is too small to sample its centre clear of its neighbours,
+        so the strip is modelled as a grid of flat segments (cells, the gap and a white
+        border) pushed through a separable resize at the located scale, and the cells
+        are fitted by least squares with the gap and border known to be white. Each
+        kernel gets one fit and the closest fit wins. Bicubic and Lanczos overshoot and
+        get clipped at 0 and 255, so a clipped pixel only says the model may go past it.
+        """
+        cols, rows = self._strip_segments()
+        gap = 1 + self.colorless_width
+        col_cells = [i for i in range(1, len(cols) - 1) if i != gap]
+        row_cells = list(range(1, len(rows) - 1))
+        known = np.full((len(rows), len(cols)), 255.0)
+        known[np.ix_(row_cells, col_cells)] = 0
+
+        # Only fit pixels that sit over the strip and half the border, the rest can see beyond it
+        img_w, img_h = image.size
+        pad = cols[0][1] / 2 * scale
+        px = np.arange(max(0, int(x - pad)), min(img_w, int(np.ceil(x + (cols[-1][0] - cols[1][0]) * scale + pad))))
+        py = np.arange(max(0, int(y - pad)), min(img_h, int(np.ceil(y + (rows[-1][0] - rows[1][0]) * scale_y + pad))))
+        window = image.crop((px[0], py[0], px[-1] + 1, py[-1] + 1))
+        observed = self._luma(window)
+        channels = np.asarray(window.convert('RGB'))[:, :, :2]  # Blue is always 0 in colored cells
+        clipped_low = (channels == 0).any(axis=2)
+        clipped_high = (channels == 255).any(axis=2)
+
+        best = None
+        for kernel_index in range(len(RESAMPLING_KERNELS)):
+            ax, ax_cells = self._resampling_matrix(kernel_index, cols[1][0] - x / scale, scale, cols, col_cells, px)
+            ay, ay_cells = self._resampling_matrix(kernel_index, rows[1][0] - y / scale_y, scale_y, rows, row_cells, py)
+            white = ay @ known @ ax.T
+            target = observed
+            for _ in range(4):
+                values = ay_cells @ (target - white) @ ax_cells.T
+                model = white + ay[:, row_cells] @ values @ ax[:, col_cells].T
+                target = np.where(clipped_low, np.minimum(observed, model),
+                                  np.where(clipped_high, np.maximum(observed, model), observed))
+            residual = np.sum((model - target) ** 2)
+            if best is None or residual < best[0]:
+                best = residual, values
+        values = best[1]
+        colorless = values[:, :self.colorless_width]
+        colored = values[:, self.colorless_width:]
+        return np.concatenate([colorless.ravel(), colored.ravel()])
+
+    def _native_cells(self, luma: np.ndarray) -> np.ndarray:
+        """Mean luma of every cell of an unscaled card, colorless cells first"""
+        cols, rows = self._strip_segments()
+        size = self.grid_size
+        values = []
+        for first, last in ((1, 1 + self.colorless_width), (2 + self.colorless_width, len(cols) - 1)):
+            left = cols[first][0]
+            top = rows[1][0]
+            block = luma[top:top + self.colorless_height * size, left:left + (last - first) * size]
+            values.append(block.reshape(self.colorless_height, size, last - first, size).mean(axis=(1, 3)).ravel())
+        return np.concatenate(values)
+
+    def _tolerant_levels(self, image: Image.Image) -> tuple[np.ndarray, np.ndarray, tuple[float, float, float, float]] | None:
+        """Unrounded nibble value of every colorless and colored cell, plus the strip location"""
+        if image.size == (self.width, self.height):
+            # Not resized, only recompressed: the cells are still where they were drawn
+            location = ((self.width - (self.colorless_width * self.grid_size)) // 2, self.height - 40, 1.0, 1.0)
+            values = self._native_cells(self._luma(image))
+        else:
+            location = self.locate_verification_strip(image)
+            if location is None:
+                return None
+            values = self._decode_cells(image, *location)
+        # Colorless cells are grey (luma = 16 * value), colored cells have no blue (luma = 0.886 * 16 * value)
+        return values[:self.grid_chars] / 16, values[self.grid_chars:] / (16 * 0.886), location
+
+    def _nibbles(self, levels: np.ndarray) -> PassCode:
+        return PassCode.from_nibbles(np.clip(np.rint(levels), 0, 15))
+
+    def extract_verification_line_tolerant(self, image: Image.Image) -> tuple[PassCode, PassCode, tuple[float, float, float, float]] | None:
+        """Extract both parts of the verification line from a rescaled or recompressed image.
+
+        Returns (colorless, colored, (x, y, scale_x, scale_y)) or None when no strip is found.
+        """
+        levels = self._tolerant_levels(image)
+        if levels is None:
+            return None
+        colorless, colored, location = levels
+        return self._nibbles(colorless), self._nibbles(colored), location
+
+    def _signed_candidates(self, levels: np.ndarray, ambiguous: int = 8):
+        """Readings of a colored part, most likely first.
+
+        A signed code has to match exactly, so after the plain rounding the cells
+        closest to halfway between two values are also tried rounded the other way.
+        """
+        rounded = np.clip(np.rint(levels), 0, 15)
+        yield self._nibbles(rounded)
+        fraction = levels - np.floor(levels)
+        closest = np.argsort(np.abs(fraction - 0.5))[:ambiguous]
+        alternate = np.clip(np.where(levels > rounded, rounded + 1, rounded - 1), 0, 15)
+        for mask in range(1, 2 ** len(closest)):
+            candidate = rounded.copy()
+            flips = [cell for bit, cell in enumerate(closest) if mask >> bit & 1]
+            candidate[flips] = alternate[flips]
+            yield self._nibbles(candidate)
+
+    def _parts_match(self, extracted: PassCode, expected: PassCode, tolerance: int) -> bool:
+        if tolerance == 0:
+            return extracted == expected
+        return extracted.max_difference(expected) <= tolerance
+
+    def card_hash(self, image: Image.Image, location: tuple | None = None, hash_size: int = 32) -> str | None:
+        """Perceptual difference hash of the card around the verification strip, as hex.
+
+        The card is cut out using the strip location, brought back to its rendered
+        size and the strip itself is blanked, so copies of a pass hash alike no matter
+        what was done to their codes. Returns None if the card can't be found.
+        """
+        image = image.convert('RGB')
+        if location is None:
+            if image.size == (self.width, self.height):
+                location = ((self.width - (self.colorless_width * self.grid_size)) // 2, self.height - 40, 1, 1)
+            else:
+                location = self.locate_verification_strip(image)
+                if location is None:
+                    return None
+
+        x, y, scale, scale_y = location
+        start_x = (self.width - (self.colorless_width * self.grid_size)) // 2
+        line_y = self.height - 40
+        left, top = x - start_x * scale, y - line_y * scale_y
+        card = image.transform(
+            (self.width, self.height), Image.EXTENT,
+            (left, top, left + self.width * scale, top + self.height * scale_y),
+            Image.BILINEAR, fillcolor='white'
+        )
+        ImageDraw.Draw(card).rectangle(
+            [(start_x - 6, line_y - 6),
+             (start_x + (self.colorless_width + self.colored_width) * self.grid_size + self.line_spacing + 6,
+              line_y + self.colorless_height * self.grid_size + 6)],
+            fill='white'
+        )
+
+        pixels = np.asarray(card.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+        # The card is mostly flat white, require a real step so compression noise doesn't flip bits
+        bits = (pixels[:, 1:] - pixels[:, :-1] > 8).ravel()
+        return format(int(''.join('1' if bit else '0' for bit in bits), 2), f'0{hash_size * hash_size // 4}x')
+
+    def _mark_image(self, image: Image.Image, location: tuple, colorless_bad: bool, colored_bad: bool,
+                    expired: bool) -> Image.Image:
+        """Copy of the image with invalid strip parts shaded red and a red border if expired"""
+        start_x, line_y, scale, scale_y = location
+
+        # Create a transparent overlay for marking errors
+        marked_image = image.convert('RGB')  # Uploads may be palette images
+        if not (colorless_bad or colored_bad or expired):
+            return marked_image  # A full-size overlay costs more than reading the strip of a screenshot
+        overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+
+        # Mark specific regions if they're invalid
+        part_width = self.colorless_width * self.grid_size * scale
+        part_height = self.colorless_height * self.grid_size * scale_y
+
+        if colorless_bad:
+            # Mark colorless region with red overlay
+            draw.rectangle(
+                [
+                    (start_x, line_y),
+                    (start_x + part_width, line_y + part_height)
+                ],
+                fill=(255, 0, 0, 64),  # Semi-transparent red
+                outline=(255, 0, 0, 255)  # Solid red outline
+            )
+
+        if colored_bad:
+            # Mark colored region with red overlay
+            colored_start_x = start_x + part_width + self.line_spacing * scale
+            draw.rectangle(
+                [
+                    (colored_start_x, line_y),
+                    (colored_start_x + part_width, line_y + part_height)
+                ],
+                fill=(255, 0, 0, 64),  # Semi-transparent red
+                outline=(255, 0, 0, 255)  # Solid red outline
+            )
+
+        if expired:
+            # Add red border around the entire pass
+            draw.rectangle(
+                [(0, 0), (image.width-1, image.height-1)],
+                outline=(255, 0, 0, 255),
+                width=3
+            )
+
+        # Paste the overlay onto the original image
+        marked_image.paste(overlay, (0, 0), overlay)
+        return marked_image
+
+    def verify_signed_pass(self, image_path, codec: PassCodec,
+                           tolerant: bool = False) -> tuple[PassClaims | None, PassCode | None, list[str], Image.Image, tuple | None]:
+        """Check the signature in a pass image without any stored pass data.
+
+        Returns (claims, colored_part, discrepancies, marked_image, location). claims is
+        None when the strip cannot be read or its signature does not match, location is
+        None when the strip cannot be found. Whether the pass belongs
+        to the person showing it and has not been revoked is left to the caller.
+        """
         discrepancies = []
-        
+
         try:
             image = Image.open(image_path)
+            if tolerant:
+                image = image.convert('RGB')
+                levels = self._tolerant_levels(image)
+                if levels is None:
+                    return None, None, ["Verification strip not found"], image, None
+                _, colored_levels, location = levels
+                candidates = self._signed_candidates(colored_levels)
+            else:
+                if image.size != (self.width, self.height):
+                    return None, None, ["Invalid image dimensions"], image, None
+                _, colored = self.extract_verification_line(image)
+                location = ((self.width - (self.colorless_width * self.grid_size)) // 2, self.height - 40, 1, 1)
+                candidates = [colored]
+
+            claims = None
+            colored_part = None
+            for candidate in candidates:
+                claims = codec.decode(candidate)
+                if claims:
+                    colored_part = candidate
+                    break
+
+            if claims is None:
+                discrepancies.append("Invalid pass signature")
+            elif claims.expired:
+                discrepancies.append("Pass expired")
+            marked_image = self._mark_image(image, location, False, claims is None, bool(claims and claims.expired))
+            return claims, colored_part, discrepancies, marked_image, location
+
+        except Exception as e:
+            discrepancies.append(f"Error processing image: {str(e)}")
+            return None, None, discrepancies, Image.new('RGB', (self.width, self.height), 'white'), None
+
+    def read_strip_codes(self, image_path, tolerant: bool = False, readings: int = 16) -> tuple[PassCode, list[PassCode]] | None:
+        """Read a pass image's colorless part and its most likely colored parts, or None if unreadable"""
+        image = Image.open(image_path)
+        if not tolerant:
             if image.size != (self.width, self.height):
-                discrepancies.append("Invalid image dimensions")
-                return False, discrepancies, image
+                return None
+            colorless, colored = self.extract_verification_line(image)
+            return colorless, [colored]
+
+        levels = self._tolerant_levels(image.convert('RGB'))
+        if levels is None:
+            return None
+        colorless_levels, colored_levels, _ = levels
+        candidates = []
+        for candidate in self._signed_candidates(colored_levels):
+            candidates.append(candidate)
+            if len(candidates) == readings:
+                break
+        return self._nibbles(colorless_levels), candidates
+
+    def verify_pass_image(self, image_path, user_pass: UserPass, tolerant: bool = False) -> tuple[bool, list[str], Image.Image]:
+        """Verify a pass image (path or file object) and return (is_valid, discrepancies, marked_image)
+
+        With tolerant=True the strip is located instead of read from fixed pixels, so
+        screenshots, thumbnails and JPEG re-encodes of a pass can still be verified.
+        """
+        discrepancies = []
+        
+        try:
+            image = Image.open(image_path)
+            if tolerant:
+                image = image.convert('RGB')
+                extracted = self.extract_verification_line_tolerant(image)
+                if extracted is None:
+                    discrepancies.append("Verification strip not found")
+                    return False, discrepancies, image
+                extracted_colorless, extracted_colored, location = extracted
+            else:
+                if image.size != (self.width, self.height):
+                    discrepancies.append("Invalid image dimensions")
+                    return False, discrepancies, image
 
-            # Extract and verify both parts
-            extracted_colorless, extracted_colored = self.extract_verification_line(image)
+                # Extract and verify both parts
+                extracted_colorless, extracted_colored = self.extract_verification_line(image)
+                location = ((self.width - (self.colorless_width * self.grid_size)) // 2, self.height - 40, 1, 1)
             
-            # Normalize expected values
-            expected_colorless = user_pass.pass_identifier.colorless_part[:72].ljust(72, '0')
-            expected_colored = user_pass.pass_identifier.colored_part[:72].ljust(72, '0')
-
-            # Create a transparent overlay for marking errors
-            marked_image = image.copy()
-            overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(overlay)
+            expected_colorless = user_pass.pass_identifier.colorless_part
+            expected_colored = user_pass.pass_identifier.colored_part
 
-            # Mark specific regions if they're invalid
-            line_y = self.height - 40
-            start_x = (self.width - (self.colorless_width * self.grid_size)) // 2
+            # Recompression can leave a cell one step off, so tolerant checks allow that
+            tolerance = 1 if tolerant else 0
+            colorless_ok = self._parts_match(extracted_colorless, expected_colorless, tolerance)
+            colored_ok = self._parts_match(extracted_colored, expected_colored, tolerance)
+            expired = datetime.now() > user_pass.expiry_date
 
-            if extracted_colorless != expected_colorless:
+            if not colorless_ok:
                 discrepancies.append("Invalid faction/nation identifier")
-                # Mark colorless region with red overlay
-                draw.rectangle(
-                    [
-                        (start_x, line_y),
-                        (start_x + self.colorless_width * self.grid_size, line_y + self.colorless_height * self.grid_size)
-                    ],
-                    fill=(255, 0, 0, 64),  # Semi-transparent red
-                    outline=(255, 0, 0, 255)  # Solid red outline
-                )
-
-            if extracted_colored != expected_colored:
+            if not colored_ok:
                 discrepancies.append("Invalid user identifier")
-                # Mark colored region with red overlay
-                colored_start_x = start_x + (self.colorless_width * self.grid_size) + self.line_spacing
-                draw.rectangle(
-                    [
-                        (colored_start_x, line_y),
-                        (colored_start_x + self.colored_width * self.grid_size, line_y + self.colored_height * self.grid_size)
-                    ],
-                    fill=(255, 0, 0, 64),  # Semi-transparent red
-                    outline=(255, 0, 0, 255)  # Solid red outline
-                )
-
-            if datetime.now() > user_pass.expiry_date:
+            if expired:
                 discrepancies.append("Pass expired")
-                # Add red border around the entire pass
-                draw.rectangle(
-                    [(0, 0), (self.width-1, self.height-1)],
-                    outline=(255, 0, 0, 255),
-                    width=3
-                )
-
-            # Paste the overlay onto the original image
-            marked_image.paste(overlay, (0, 0), overlay)
+            marked_image = self._mark_image(image, location, not colorless_ok, not colored_ok, expired)
 
             if discrepancies:
                 print("\nVerification details:")
-                if extracted_colorless != expected_colorless:
+                if not colorless_ok:
                     print(f"Expected colorless: {expected_colorless}")
                     print(f"Extracted colorless: {extracted_colorless}")
-                if extracted_colored != expected_colored:
+                if not colored_ok:
                     print(f"Expected colored: {expected_colored}")
                     print(f"Extracted colored: {extracted_colored}")
 
@@ -262,22 +810,6 @@ class PassGenerator:
             discrepancies.append(f"Error processing image: {str(e)}")
             return False, discrepancies, Image.new('RGB', (self.width, self.height), 'white')
 
-    def _generate_default_icon(self, letter: str) -> Image.Image:
-        """Generate a default icon with the given letter and a random color"""
-        size = (50, 50)
-        img = Image.new('RGB', size, color=(255, 255, 255))
-        draw = ImageDraw.Draw(img)
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 20)
-        
-        # Generate random color
-        color = tuple(random.randint(0, 255) for _ in range(3))
-        
-        # Draw circular vignette
-        draw.ellipse([(0, 0), size], fill=color)
-        
-        # Draw the letter
-        text_size = draw.textsize(letter, font=font)
-        text_position = ((size[0] - text_size[0]) // 2, (size[1] - text_size[1]) // 2)
-        draw.text(text_position, letter, fill=(255, 255, 255), font=font)
-        
-        return img
+    def _generate_default_icon(self, entity_type: str, entity_id: int, letter: str) -> Image.Image:
+        """Default pass icon for an entity without one, the same colour on every render"""
+        return default_icon(f"{entity_type}:{entity_id}", letter, 50, 20)
@@ -0,0 +1,205 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from PIL import Image
+
+from models import PassIdentifier, UserPass
+from pass_codes import PassClaims, PassCode, PassCodec
+from pass_formats import DEFAULT_FORMAT, encode_pass
+from pass_generator import PassGenerator
+
+# Each worker process keeps its own generator so the font is loaded once per worker
+_worker_generator: Optional[PassGenerator] = None
+_worker_codec: Optional[PassCodec] = None
+
+
+def _init_worker(pass_key: Optional[bytes]):
+    global _worker_generator, _worker_codec
+    _worker_generator = PassGenerator()
+    _worker_codec = PassCodec(pass_key) if pass_key else None
+
+
+def _warm_worker() -> int:
+    return os.getpid()
+
+
+def describe_pass(user_pass: UserPass, username: str) -> tuple:
+    """Pack a pass into a small tuple of primitives that is cheap to send to a worker"""
+    identifier = user_pass.pass_identifier
+    return (
+        user_pass.user_id,
+        user_pass.faction_id,
+        user_pass.nation_id,
+        user_pass.issue_date.isoformat(),
+        user_pass.expiry_date.isoformat(),
+        bytes(identifier.colorless_part),
+        bytes(identifier.colored_part),
+        user_pass.faction_rank,
+        user_pass.nation_rank,
+        username
+    )
+
+
+def _pass_from_descriptor(descriptor: tuple) -> Tuple[UserPass, str]:
+    (user_id, faction_id, nation_id, issue_date, expiry_date,
+     colorless_part, colored_part, faction_rank, nation_rank, username) = descriptor
+    user_pass = UserPass(
+        user_id=user_id,
+        faction_id=faction_id,
+        nation_id=nation_id,
+        issue_date=datetime.fromisoformat(issue_date),
+        expiry_date=datetime.fromisoformat(expiry_date),
+        pass_identifier=PassIdentifier(
+            colorless_part=PassCode(colorless_part),
+            colored_part=PassCode(colored_part),
+            faction_id=faction_id,
+            nation_id=nation_id
+        ),
+        faction_rank=faction_rank,
+        nation_rank=nation_rank
+    )
+    return user_pass, username
+
+
+def _encode_png(image) -> bytes:
+    with BytesIO() as bio:
+        image.save(bio, 'PNG')
+        return bio.getvalue()
+
+
+def _card_hash(image, location=None) -> Optional[str]:
+    # A failed hash only costs the similarity report, never the verification itself
+    try:
+        return _worker_generator.card_hash(image, location)
+    except Exception as e:
+        print(f"Failed to hash pass image: {e}")
+        return None
+
+
+def _render_in_worker(descriptor: tuple, icons: Tuple[Optional[str], Optional[str]],
+                      fmt: str) -> Tuple[bytes, Optional[str]]:
+    user_pass, username = _pass_from_descriptor(descriptor)
+    image = _worker_generator.create_pass_image(user_pass, username, icons)
+    return encode_pass(image, fmt, _worker_generator.strip_box()), _card_hash(image)
+
+
+def _verify_in_worker(image_data: bytes, descriptor: tuple, tolerant: bool,
+                      marked: bool) -> Tuple[bool, List[str], Optional[bytes], Optional[str]]:
+    user_pass, _ = _pass_from_descriptor(descriptor)
+    is_valid, discrepancies, marked_image = _worker_generator.verify_pass_image(BytesIO(image_data), user_pass, tolerant)
+    # The marked copy is only shown to the verifier on failure, skip encoding it otherwise
+    return (
+        is_valid,
+        discrepancies,
+        _encode_png(marked_image) if marked and not is_valid else None,
+        _card_hash(Image.open(BytesIO(image_data)))
+    )
+
+
+def _verify_signed_in_worker(image_data: bytes, tolerant: bool,
+                             marked: bool) -> Tuple[Optional[PassClaims], Optional[PassCode], List[str], Optional[bytes], Optional[str]]:
+    claims, colored_part, discrepancies, marked_image, location = _worker_generator.verify_signed_pass(
+        BytesIO(image_data), _worker_codec, tolerant
+    )
+    return (
+        claims,
+        colored_part,
+        discrepancies,
+        _encode_png(marked_image) if marked and discrepancies else None,
+        _card_hash(Image.open(BytesIO(image_data)), location) if location else None
+    )
+
+
+def _read_codes_in_worker(image_data: bytes, tolerant: bool) -> Optional[Tuple[PassCode, List[PassCode]]]:
+    try:
+        return _worker_generator.read_strip_codes(BytesIO(image_data), tolerant)
+    except Exception as e:
+        print(f"Failed to read pass codes: {e}")
+        return None
+
+
+class RenderService:
+    """Runs PassGenerator work in a process pool so the event loop never blocks on PIL/NumPy"""
+
+    def __init__(self, pass_key: Optional[bytes] = None, workers: Optional[int] = None,
+                 max_pending: Optional[int] = None):
+        self.pass_key = pass_key
+        self.workers = workers or int(os.getenv('MEGATROPO_RENDER_WORKERS', '0')) or os.cpu_count() or 1
+        # Jobs allowed in flight before callers have to wait for a free slot
+        self.max_pending = max_pending or int(os.getenv('MEGATROPO_RENDER_QUEUE', '0')) or self.workers * 4
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        # Called with (pass, perceptual hash) after every render, e.g. to index issued pass images
+        self.on_render: Optional[Callable[[UserPass, str], Awaitable[None]]] = None
+        # Returns the (faction, nation) icon blob digests to draw on a pass
+        self.icon_lookup: Optional[Callable[[UserPass], Awaitable[Tuple[Optional[str], Optional[str]]]]] = None
+
+    def start(self):
+        if self._executor:
+            return
+        # bot.py starts the client at import time, so workers must be forked rather than spawned
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker,
+            initargs=(self.pass_key,)
+        )
+        # Bring every worker up now so the first renders don't pay for process start and font loading
+        for _ in range(self.workers):
+            self._executor.submit(_warm_worker)
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, func, *args):
+        self.pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def render(self, user_pass: UserPass, username: str, fmt: str = DEFAULT_FORMAT) -> bytes:
+        """Render a pass and return it encoded in one of pass_formats.PASS_FORMATS"""
+        icons = await self.icon_lookup(user_pass) if self.icon_lookup else (None, None)
+        data, card_hash = await self._run(_render_in_worker, describe_pass(user_pass, username), icons, fmt)
+        if self.on_render and card_hash:
+            await self.on_render(user_pass, card_hash)
+        return data
+
+    async def render_many(self, items: List[Tuple[UserPass, str]], fmt: str = DEFAULT_FORMAT) -> List[bytes]:
+        """Render several (pass, username) pairs across the pool, keeping the input order"""
+        return list(await asyncio.gather(*(self.render(user_pass, username, fmt) for user_pass, username in items)))
+
+    async def verify(self, image_data: bytes, user_pass: UserPass, tolerant: bool = False,
+                     marked: bool = True) -> Tuple[bool, List[str], Optional[bytes], Optional[str]]:
+        """Verify an uploaded pass image against a stored pass.
+
+        Returns (is_valid, discrepancies, marked PNG or None, perceptual hash of the card or None).
+
+        tolerant=True also accepts screenshots, resized copies and JPEG re-encodes of the pass.
+        marked=False skips encoding the marked copy when only the verdict is needed.
+        """
+        return await self._run(_verify_in_worker, image_data, describe_pass(user_pass, ""), tolerant, marked)
+
+    async def verify_signed(self, image_data: bytes, tolerant: bool = False,
+                            marked: bool = True) -> Tuple[Optional[PassClaims], Optional[PassCode], List[str], Optional[bytes], Optional[str]]:
+        """Check a pass image's signature without stored pass data.
+
+        Returns (claims or None, colored part, discrepancies, marked PNG or None,
+        perceptual hash of the card or None).
+        """
+        return await self._run(_verify_signed_in_worker, image_data, tolerant, marked)
+
+    async def read_codes(self, image_data: bytes, tolerant: bool = False) -> Optional[Tuple[PassCode, List[PassCode]]]:
+        """Read (colorless part, likely colored parts) from a pass image, or None if unreadable"""
+        return await self._run(_read_codes_in_worker, image_data, tolerant)
@@ -0,0 +1,73 @@
+import hashlib
+import math
+from typing import Awaitable, Callable, Iterable
+
+from pass_codes import PassCode
+
+
+class BloomFilter:
+    """Fixed size Bloom filter over byte strings, using double hashing of one SHA-256 digest"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: bytes):
+        digest = hashlib.sha256(item).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: bytes):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: bytes) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """Answers "was this pass revoked?" without touching the database for the common case.
+
+    A Bloom filter over every revoked colored part lives in memory. A miss means
+    the pass was definitely not revoked; a hit is confirmed against the
+    revoked_passes table, since Bloom filters allow false positives.
+    """
+
+    def __init__(self, confirm: Callable[[PassCode], Awaitable[bool]], error_rate: float = 0.01):
+        self._confirm = confirm
+        self.error_rate = error_rate
+        self._filter = BloomFilter(0, error_rate)
+        self.lookups = 0
+        self.confirmations = 0
+
+    def rebuild(self, colored_parts: Iterable[PassCode]):
+        """Replace the filter with one holding these codes, leaving room to grow"""
+        colored_parts = list(colored_parts)
+        bloom = BloomFilter(max(1024, len(colored_parts) * 2), self.error_rate)
+        for colored_part in colored_parts:
+            bloom.add(bytes(colored_part))
+        self._filter = bloom
+        print(f"Revocation filter holds {len(colored_parts)} passes ({len(bloom._bits) // 1024} KiB)")
+
+    def add(self, colored_part: PassCode):
+        self._filter.add(bytes(colored_part))
+
+    def needs_rebuild(self) -> bool:
+        # Past its capacity the false positive rate climbs quickly
+        return self._filter.count > self._filter.capacity
+
+    def might_be_revoked(self, colored_part: PassCode) -> bool:
+        return bytes(colored_part) in self._filter
+
+    async def is_revoked(self, colored_part: PassCode) -> bool:
+        self.lookups += 1
+        if bytes(colored_part) not in self._filter:
+            return False
+        self.confirmations += 1
+        return await self._confirm(colored_part)
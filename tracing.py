@@ -0,0 +1,170 @@
+import contextvars
+import functools
+import inspect
+import statistics
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+from discord import app_commands
+
+# Discord drops an interaction that isn't deferred or answered within 3 seconds
+ACK_DEADLINE_MS = 3000
+# Bulk commands can make thousands of calls, keep the first ones of each trace
+MAX_SPANS = 200
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar('trace', default=None)
+
+
+class Trace:
+    """Timings of one command invocation, in milliseconds from its start"""
+    __slots__ = ('command', 'guild_id', 'kind', 'started_at', '_start', 'ack_ms', 'total_ms', 'spans',
+                 'dropped_spans', 'failed')
+
+    def __init__(self, command: str, guild_id: Optional[int], kind: str):
+        self.command = command
+        self.guild_id = guild_id
+        self.kind = kind  # 'command' or 'autocomplete'
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.ack_ms: Optional[float] = None  # first defer or response
+        self.total_ms: Optional[float] = None  # handler finished, final response sent
+        self.spans: List[Tuple[str, float, float]] = []  # (name, start, duration)
+        self.dropped_spans = 0
+        self.failed = False
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def add_span(self, name: str, start_ms: float, duration_ms: float):
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append((name, start_ms, duration_ms))
+        else:
+            self.dropped_spans += 1
+
+    def span_totals(self) -> List[Tuple[str, int, float]]:
+        """(name, calls, total ms) per span name, slowest first"""
+        totals: Dict[str, List[float]] = {}
+        for name, _, duration in self.spans:
+            totals.setdefault(name, []).append(duration)
+        return sorted(((name, len(d), sum(d)) for name, d in totals.items()), key=lambda t: t[2], reverse=True)
+
+
+def mark_ack():
+    """Record the first defer or response of the current trace"""
+    trace = _current.get()
+    if trace is not None and trace.ack_ms is None:
+        trace.ack_ms = trace.elapsed_ms()
+
+
+def _percentiles(values: List[float]) -> Tuple[float, float, float]:
+    if len(values) == 1:
+        return values[0], values[0], values[0]
+    cuts = statistics.quantiles(values, n=100)
+    return cuts[49], cuts[94], cuts[98]
+
+
+class Tracer:
+    """Keeps the last `capacity` command traces in a ring buffer"""
+
+    def __init__(self, capacity: int = 2000):
+        self.traces: "deque[Trace]" = deque(maxlen=capacity)
+
+    def start(self, command: str, guild_id: Optional[int], kind: str = 'command') -> Tuple[Trace, contextvars.Token]:
+        trace = Trace(command, guild_id, kind)
+        return trace, _current.set(trace)
+
+    def finish(self, trace: Trace, token: contextvars.Token, failed: bool = False):
+        trace.total_ms = trace.elapsed_ms()
+        trace.failed = failed
+        _current.reset(token)
+        self.traces.append(trace)
+
+    def instrument(self, obj: Any, prefix: str):
+        """Wrap obj's public coroutine methods so calls made during a trace are recorded as spans"""
+        for name, method in inspect.getmembers(obj, inspect.iscoroutinefunction):
+            if not name.startswith('_'):
+                setattr(obj, name, _traced(method, f"{prefix}.{name}"))
+
+    def summary(self, kind: str = 'command') -> List[Dict[str, Any]]:
+        """Latency percentiles per command, slowest p95 first"""
+        by_command: Dict[str, List[Trace]] = {}
+        for trace in self.traces:
+            if trace.kind == kind:
+                by_command.setdefault(trace.command, []).append(trace)
+
+        rows = []
+        for command, traces in by_command.items():
+            totals = [trace.total_ms for trace in traces]
+            acks = [trace.ack_ms for trace in traces if trace.ack_ms is not None]
+            p50, p95, p99 = _percentiles(totals)
+            rows.append({
+                'command': command,
+                'calls': len(traces),
+                'p50_ms': p50,
+                'p95_ms': p95,
+                'p99_ms': p99,
+                'ack_p95_ms': _percentiles(acks)[1] if acks else None,
+                # Answered late, or never acknowledged and ran past the deadline
+                'late_acks': sum(1 for t in traces if (t.ack_ms if t.ack_ms is not None else t.total_ms) > ACK_DEADLINE_MS),
+                'failed': sum(1 for trace in traces if trace.failed),
+            })
+        return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+    def slowest(self, count: int = 5, kind: str = 'command') -> List[Trace]:
+        traces = [trace for trace in self.traces if trace.kind == kind]
+        return sorted(traces, key=lambda trace: trace.total_ms, reverse=True)[:count]
+
+
+def _traced(method, name: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        trace = _current.get()
+        if trace is None:
+            return await method(*args, **kwargs)
+        start = trace.elapsed_ms()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            trace.add_span(name, start, trace.elapsed_ms() - start)
+    return wrapper
+
+
+class TracedCommandTree(app_commands.CommandTree):
+    """Command tree that traces every application command and autocomplete call.
+
+    _call is where discord.py runs checks and the handler for each command
+    interaction, so wrapping it covers the whole invocation in one place.
+    """
+
+    async def _call(self, interaction: discord.Interaction):
+        tracer: Optional[Tracer] = getattr(self.client, 'tracer', None)
+        if tracer is None:
+            return await super()._call(interaction)
+
+        kind = 'autocomplete' if interaction.type is discord.InteractionType.autocomplete else 'command'
+        trace, token = tracer.start((interaction.data or {}).get('name', 'unknown'), interaction.guild_id, kind)
+        try:
+            await super()._call(interaction)
+        finally:
+            tracer.finish(trace, token, interaction.command_failed)
+
+
+def _ack_hook(method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        result = await method(*args, **kwargs)
+        mark_ack()  # Discord has the acknowledgement once the callback request returns
+        return result
+    return wrapper
+
+
+def install_interaction_hooks():
+    """Time the first defer or response of traced interactions, done once per process"""
+    response = discord.InteractionResponse
+    if getattr(response, '_traced', False):
+        return
+    for name in ('defer', 'send_message', 'send_modal', 'edit_message', 'autocomplete'):
+        setattr(response, name, _ack_hook(getattr(response, name)))
+    response._traced = True